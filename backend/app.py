@@ -2,17 +2,47 @@
 
 import os
 import asyncio
-from datetime import datetime, timezone
+import logging
+import math
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from itertools import islice
 from typing import Optional, List, Dict, Any
 from uuid import UUID, uuid4
 import json
 
-from fastapi import FastAPI, HTTPException, Depends, Query
+from fastapi import FastAPI, HTTPException, Depends, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 from supabase import create_client, Client
 import asyncpg
+import httpx
 from contextlib import asynccontextmanager
+import sys
+
+# Modules shared between backend/ and heatmap/backend/ live in the repository's shared/ directory
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "shared"))
+
+from bulk_load import BulkRowError, BulkRows, model_columns
+from crowd_forecast import LEVEL_ORDER, CrowdForecaster
+from crowd_history import RESOLUTIONS, CrowdRollups, resolution_for
+from dispatch import OPEN_STATUSES, Dispatcher
+from etag import content_etag, etag_matches, not_modified, set_etag, table_versions_etag
+from export_stream import TableExport, export_conditions
+from fast_json import api_response, dumps
+from geo import nearby_filter
+from live_feed import LiveFeed
+from pagination import InvalidCursor, Keyset, SortKey, parse_timestamp
+from response_cache import LRUBackend, RedisBackend, ResponseCache
+from routing import DENSITY_PENALTY, WALKING_SPEED_KMH, RouteCache, WalkGraph, camera_penalty
+from snapshot import Snapshot
+from spatial_index import SpatialGrid
+from telemetry import BufferFull, TelemetryBuffer, maintain_history_partitions
+
+logger = logging.getLogger(__name__)
 
 # Environment variables - IMPORTANT: Set these in your .env file
 SUPABASE_URL = os.getenv("SUPABASE_URL")
@@ -33,11 +63,338 @@ supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 # Database connection pool
 db_pool = None
 
+# Dedicated connection for LISTEN/NOTIFY (pooled connections get recycled)
+listen_conn = None
+# Set when it drops (or never came up); keep_listening() reconnects, backing off up to the max
+listen_lost = asyncio.Event()
+LISTEN_RETRY_INTERVAL = float(os.getenv("LISTEN_RETRY_INTERVAL", "5"))
+LISTEN_RETRY_MAX_INTERVAL = float(os.getenv("LISTEN_RETRY_MAX_INTERVAL", "300"))
+
+# Background tasks spawned from notification callbacks
+background_tasks = set()
+
+# In-memory spatial indexes for rarely-changing point data
+# Facilities also kept in FACILITIES_KEYSET order for the /facilities list
+facility_index = SpatialGrid(order_key=lambda record: (record["created_at"], record["facility_id"]))
+parking_index = SpatialGrid()
+
+# Smart band pings are coalesced here and flushed to smart_bands in bulk
+telemetry_buffer = TelemetryBuffer(
+    flush_interval=float(os.getenv("TELEMETRY_FLUSH_INTERVAL", "1.0")),
+    max_pending=int(os.getenv("TELEMETRY_MAX_PENDING", "500000")),
+    max_history_attempts=int(os.getenv("TELEMETRY_HISTORY_ATTEMPTS", "5")),
+)
+BAND_HISTORY_RETENTION_DAYS = int(os.getenv("BAND_HISTORY_RETENTION_DAYS", "30"))
+
+# Crowd history: crowd_density writes are appended to crowd_readings and rolled up
+crowd_rollups = CrowdRollups()
+CROWD_ROLLUP_INTERVAL = float(os.getenv("CROWD_ROLLUP_INTERVAL", "30"))
+CROWD_READINGS_RETENTION_DAYS = int(os.getenv("CROWD_READINGS_RETENTION_DAYS", "7"))
+CROWD_MINUTE_ROLLUP_RETENTION_DAYS = int(os.getenv("CROWD_MINUTE_ROLLUP_RETENTION_DAYS", "30"))
+CROWD_HISTORY_MAX_BUCKETS = 2000
+CROWD_BATCH_MAX_ITEMS = int(os.getenv("CROWD_BATCH_MAX_ITEMS", "10000"))
+
+# Streaming NDJSON/CSV downloads for post-event analysis (GET /export/...)
+table_export = TableExport(dumps, chunk_rows=int(os.getenv("EXPORT_CHUNK_ROWS", "5000")),
+                           max_active=int(os.getenv("EXPORT_MAX_ACTIVE", "4")))
+
+# Row limit for the POST /{resource}/bulk endpoints
+BULK_MAX_ROWS = int(os.getenv("BULK_MAX_ROWS", "100000"))
+
+# Next 15/30/60 minute crowd forecasts, refitted in the background from the rollups
+crowd_forecaster = CrowdForecaster(
+    history_hours=float(os.getenv("CROWD_FORECAST_HISTORY_HOURS", "6")),
+    season_days=int(os.getenv("CROWD_FORECAST_SEASON_DAYS", "7")),
+)
+CROWD_FORECAST_INTERVAL = float(os.getenv("CROWD_FORECAST_INTERVAL", "60"))
+
+# On-duty responders kept in memory for instant emergency assignment
+dispatcher = Dispatcher(
+    max_radius_km=float(os.getenv("DISPATCH_MAX_RADIUS_KM", "5")),
+    max_load=int(os.getenv("DISPATCH_MAX_LOAD", "3")),
+)
+DISPATCH_REFRESH_INTERVAL = float(os.getenv("DISPATCH_REFRESH_INTERVAL", "5"))
+
+# Read-through cache for hot GET endpoints; a redis:// URL shares it across workers.
+# Without one each worker keeps its own LRU, and invalidations reach the other
+# workers as NOTIFYs on CACHE_CHANNEL; where LISTEN is unavailable (e.g. behind a
+# transaction-mode pooler), run more than one worker only with Redis.
+RESPONSE_CACHE_URL = os.getenv("RESPONSE_CACHE_URL")
+response_cache = ResponseCache(
+    RedisBackend(RESPONSE_CACHE_URL) if RESPONSE_CACHE_URL
+    else LRUBackend(max_bytes=int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))),
+    ttl=float(os.getenv("RESPONSE_CACHE_TTL", "30")),
+)
+
+# Control-room screens poll /dashboard/stats; serve them a periodically refreshed snapshot
+DASHBOARD_STATS_INTERVAL = float(os.getenv("DASHBOARD_STATS_INTERVAL", "5.0"))
+
+# Tags this process's cache invalidation broadcasts, so it skips its own
+INSTANCE_ID = uuid4().hex[:12]
+
+# Changes pushed to /live subscribers, fed by the live_changes NOTIFY channel
+LIVE_CHANNEL = "live_changes"
+live_feed = LiveFeed(dumps)
+# (table, id) -> op of rows waiting to be published; repeated changes to a row coalesce
+live_pending: "OrderedDict[tuple, str]" = OrderedDict()
+live_wakeup = asyncio.Event()
+LIVE_TABLES = {
+    "crowd_density": ("crowd", """
+        SELECT cd.*, f.name as facility_name, f.type as facility_type, f.lat, f.lng
+        FROM crowd_density cd
+        JOIN facilities f ON cd.location_id = f.facility_id
+        WHERE cd.density_id = $1
+    """),
+    "shuttles": ("shuttles", "SELECT * FROM shuttles WHERE shuttle_id = $1"),
+    "emergency_reports": ("emergencies", "SELECT * FROM emergency_reports WHERE report_id = $1"),
+}
+# topic -> (lat field, lng field, type field) used by the subscription filters
+LIVE_FILTER_FIELDS = {
+    "crowd": ("lat", "lng", "facility_type"),
+    "shuttles": ("current_lat", "current_lng", None),
+    "emergencies": ("lat", "lng", "type"),
+}
+
+# Walking graph for /routes/compute, prebuilt with `python routing.py <extract.osm> <file>`
+ROUTING_GRAPH_PATH = os.getenv("ROUTING_GRAPH_PATH")
+# Request points further than this from any walkway are rejected
+ROUTING_SNAP_KM = float(os.getenv("ROUTING_SNAP_KM", "0.5"))
+# Live edge weights: crowd readings penalize graph nodes within this radius
+CROWD_PENALTY_RADIUS_KM = float(os.getenv("CROWD_PENALTY_RADIUS_KM", "0.15"))
+CROWD_WEIGHTS_INTERVAL = float(os.getenv("CROWD_WEIGHTS_INTERVAL", "10"))
+CROWD_READING_MAX_AGE_MINUTES = int(os.getenv("CROWD_READING_MAX_AGE_MINUTES", "30"))
+# Camera API (heatmap/backend) and a JSON file of {camera_id: {"lat": ..., "lng": ...}}
+CAMERA_API_URL = os.getenv("CAMERA_API_URL")
+CAMERA_LOCATIONS_PATH = os.getenv("CAMERA_LOCATIONS_PATH")
+# Computed paths are reused until a crowd penalty near them moves by this much
+CROWD_EPOCH_THRESHOLD = float(os.getenv("CROWD_EPOCH_THRESHOLD", "0.25"))
+ROUTE_CACHE_MAX_ENTRIES = int(os.getenv("ROUTE_CACHE_MAX_ENTRIES", "20000"))
+walk_graph: Optional[WalkGraph] = None
+route_cache: Optional[RouteCache] = None
+camera_locations: Dict[str, tuple] = {}
+
+SPATIAL_CHANNEL = "spatial_index_changes"
+CACHE_CHANNEL = "response_cache_invalidations"
+CACHED_RESOURCES = ("facilities", "crowd", "routes")
+# Set while the indexes load; changes notified meanwhile wait in spatial_replay, keyed by row
+spatial_loading = False
+spatial_replay: Dict[tuple, dict] = {}
+SPATIAL_TABLES = {
+    "facilities": (facility_index, "facility_id"),
+    "parking_slots": (parking_index, "slot_id"),
+}
+
+def index_row(table: str, row):
+    index, key_column = SPATIAL_TABLES[table]
+    if index.ready:
+        index.upsert(row[key_column], float(row["lat"]), float(row["lng"]), dict(row))
+
+async def load_spatial_index(conn, table: str):
+    index, key_column = SPATIAL_TABLES[table]
+    rows = await conn.fetch(f"SELECT * FROM {table}")
+    index.load([(row[key_column], float(row["lat"]), float(row["lng"]), dict(row)) for row in rows])
+
+async def load_spatial_indexes():
+    # The load reads a snapshot that may predate changes notified while it runs,
+    # so those are replayed afterwards (each re-reads its row)
+    global spatial_loading
+    spatial_replay.clear()
+    spatial_loading = True
+    try:
+        async with db_pool.acquire() as conn:
+            for table in SPATIAL_TABLES:
+                await load_spatial_index(conn, table)
+    finally:
+        spatial_loading = False
+    while spatial_replay:
+        await apply_spatial_change(spatial_replay.pop(next(iter(spatial_replay))))
+
+async def refresh_spatial_entry(table: str, op: str, row_id: str):
+    index, key_column = SPATIAL_TABLES[table]
+    key = UUID(row_id)
+    if table == "facilities":
+        # Covers writes made outside this process too; every worker gets this notify
+        await response_cache.invalidate("facilities", "crowd", broadcast=False)
+    if op == "DELETE":
+        index.remove(key)
+        return
+    row = await db_pool.fetchrow(f"SELECT * FROM {table} WHERE {key_column} = $1", key)
+    if row:
+        index_row(table, row)
+    else:
+        index.remove(key)
+
+async def reload_spatial_table(table: str):
+    if table == "facilities":
+        await response_cache.invalidate("facilities", "crowd", broadcast=False)
+    if SPATIAL_TABLES[table][0].ready:
+        async with db_pool.acquire() as conn:
+            await load_spatial_index(conn, table)
+
+async def apply_spatial_change(change: dict):
+    if change["op"] == "RELOAD":
+        # Sent once per bulk load, whose rows don't notify one by one
+        await reload_spatial_table(change["table"])
+    else:
+        await refresh_spatial_entry(change["table"], change["op"], change["id"])
+
+def on_spatial_notify(connection, pid, channel, payload):
+    change = json.loads(payload)
+    if change.get("table") not in SPATIAL_TABLES:
+        return
+    if change.get("instance") == INSTANCE_ID and not spatial_loading:
+        # A bulk load on this worker, which has already reloaded the table
+        return
+    if spatial_loading:
+        spatial_replay[(change["table"], change.get("id"))] = change
+        return
+    task = asyncio.create_task(apply_spatial_change(change))
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+async def broadcast_invalidation(namespaces):
+    try:
+        await db_pool.execute("SELECT pg_notify($1, $2)", CACHE_CHANNEL,
+                              json.dumps({"instance": INSTANCE_ID, "namespaces": list(namespaces)}))
+    except Exception:
+        # Other workers serve the old entries until they expire
+        logger.exception("Could not broadcast cache invalidation of %s", ", ".join(namespaces))
+
+def on_cache_notify(connection, pid, channel, payload):
+    change = json.loads(payload)
+    if change["instance"] == INSTANCE_ID:
+        return
+    task = asyncio.create_task(response_cache.invalidate(*change["namespaces"], broadcast=False))
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+def on_live_notify(connection, pid, channel, payload):
+    if not live_feed.subscribers:
+        return
+    change = json.loads(payload)
+    if change.get("table") not in LIVE_TABLES:
+        return
+    live_pending[(change["table"], change["id"])] = change["op"]
+    live_wakeup.set()
+
+async def publish_live_changes():
+    # A single worker keeps events in notification order; each row is read once
+    # per burst however many times it changed
+    while True:
+        await live_wakeup.wait()
+        live_wakeup.clear()
+        while live_pending:
+            (table, row_id), op = live_pending.popitem(last=False)
+            topic, query = LIVE_TABLES[table]
+            try:
+                row = await db_pool.fetchrow(query, UUID(row_id))
+            except Exception:
+                # Subscribers miss this change until the row changes again
+                logger.exception("Could not load %s row %s for the live feed", table, row_id)
+                continue
+            if row is not None:
+                live_feed.publish(topic, {"op": op, "row": dict(row)})
+
+def on_listen_terminated(connection):
+    # Without invalidations the indexes may go stale, so fall back to Postgres until reconnected
+    for index, _ in SPATIAL_TABLES.values():
+        index.ready = False
+    live_feed.available = False
+    listen_lost.set()
+
+async def start_listening():
+    """Subscribe to the change channels, then load the indexes"""
+    global listen_conn
+    listen_lost.clear()
+    # Subscribe before loading so no change between the two is missed
+    listen_conn = await asyncpg.connect(DATABASE_URL)
+    await listen_conn.add_listener(SPATIAL_CHANNEL, on_spatial_notify)
+    await listen_conn.add_listener(LIVE_CHANNEL, on_live_notify)
+    if not RESPONSE_CACHE_URL:
+        await listen_conn.add_listener(CACHE_CHANNEL, on_cache_notify)
+    listen_conn.add_termination_listener(on_listen_terminated)
+    live_feed.available = True
+    await load_spatial_indexes()
+    if listen_conn.is_closed():
+        raise ConnectionError("LISTEN connection dropped while the indexes loaded")
+
+async def stop_listening():
+    global listen_conn
+    if listen_conn is not None and not listen_conn.is_closed():
+        await listen_conn.close()
+    listen_conn = None
+
+async def keep_listening():
+    """Background loop: reconnect the LISTEN connection whenever it drops, then reload"""
+    delay = LISTEN_RETRY_INTERVAL
+    while True:
+        await listen_lost.wait()
+        await asyncio.sleep(delay)
+        try:
+            await stop_listening()
+            await start_listening()
+        except Exception as e:
+            on_listen_terminated(listen_conn)
+            await stop_listening()
+            delay = min(delay * 2, LISTEN_RETRY_MAX_INTERVAL)
+            logger.warning(f"LISTEN connection unavailable ({e}); retrying in {delay:.0f}s")
+            continue
+        delay = LISTEN_RETRY_INTERVAL
+        # Invalidations notified while disconnected were missed
+        await response_cache.invalidate(*CACHED_RESOURCES, broadcast=False)
+        logger.info("LISTEN connection restored; indexes reloaded")
+
+def load_routing():
+    global walk_graph, route_cache, camera_locations
+    if CAMERA_LOCATIONS_PATH:
+        with open(CAMERA_LOCATIONS_PATH) as f:
+            camera_locations = {
+                camera_id: (float(point["lat"]), float(point["lng"])) for camera_id, point in json.load(f).items()
+            }
+    if ROUTING_GRAPH_PATH:
+        walk_graph = WalkGraph.load(ROUTING_GRAPH_PATH)
+        route_cache = RouteCache(walk_graph, threshold=CROWD_EPOCH_THRESHOLD, max_entries=ROUTE_CACHE_MAX_ENTRIES)
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     global db_pool
     db_pool = await asyncpg.create_pool(DATABASE_URL, min_size=5, max_size=20)
+    try:
+        await start_listening()
+    except Exception:
+        # e.g. a transaction-mode pooler without LISTEN support: read from Postgres
+        # while keep_listening() retries
+        on_listen_terminated(listen_conn)
+        await stop_listening()
+    listen_task = asyncio.create_task(keep_listening())
+    if not RESPONSE_CACHE_URL:
+        response_cache.broadcast = broadcast_invalidation
+    await asyncio.to_thread(load_routing)
+    telemetry_task = asyncio.create_task(telemetry_buffer.run(db_pool))
+    partition_task = asyncio.create_task(maintain_history_partitions(db_pool, BAND_HISTORY_RETENTION_DAYS))
+    stats_task = asyncio.create_task(dashboard_stats.run())
+    live_task = asyncio.create_task(publish_live_changes())
+    dispatch_task = asyncio.create_task(dispatcher.run(db_pool, DISPATCH_REFRESH_INTERVAL))
+    rollup_task = asyncio.create_task(crowd_rollups.run(
+        db_pool, CROWD_ROLLUP_INTERVAL, CROWD_READINGS_RETENTION_DAYS, CROWD_MINUTE_ROLLUP_RETENTION_DAYS))
+    forecast_task = asyncio.create_task(crowd_forecaster.run(db_pool, CROWD_FORECAST_INTERVAL, fetch_camera_scores))
+    weights_task = asyncio.create_task(crowd_weights.run()) if walk_graph is not None else None
     yield
+    if weights_task is not None:
+        weights_task.cancel()
+    forecast_task.cancel()
+    rollup_task.cancel()
+    dispatch_task.cancel()
+    live_task.cancel()
+    stats_task.cancel()
+    partition_task.cancel()
+    telemetry_task.cancel()
+    listen_task.cancel()
+    try:
+        await telemetry_buffer.flush(db_pool)
+    except Exception:
+        pass
+    await stop_listening()
     await db_pool.close()
 
 # FastAPI app
@@ -62,12 +419,75 @@ async def get_db():
     async with db_pool.acquire() as connection:
         yield connection
 
+# kNN search radius: start small and widen until k rows are found
+NEAREST_START_RADIUS_KM = 0.5
+NEAREST_MAX_RADIUS_KM = 50.0
+
+async def fetch_nearest(db, table: str, extra_select: str, conditions: List[str], values: list,
+                        lat: float, lng: float, k: int, max_radius: float):
+    # Each pass is a bounded bounding-box scan; once k rows fall inside the
+    # radius they are the true k nearest, so the search can stop there
+    radius = min(NEAREST_START_RADIUS_KM, max_radius)
+    while True:
+        geo_conditions, geo_values, distance_expr, param_count = nearby_filter(
+            "lat", "lng", lat, lng, radius, len(values) + 1)
+        query = f"""
+        SELECT *, {distance_expr} as distance{extra_select}
+        FROM {table}
+        WHERE {" AND ".join(conditions + geo_conditions)}
+        ORDER BY distance ASC
+        LIMIT ${param_count}
+        """
+        results = await db.fetch(query, *values, *geo_values, k)
+        if len(results) >= k or radius >= max_radius:
+            return results
+        radius = min(radius * 4, max_radius)
+
 # Standard API Response Model
+# Large list endpoints render the same envelope with fast_json.api_response instead
 class APIResponse(BaseModel):
     success: bool
     message: str
     data: Optional[Any] = None
 
+# List responses also carry the cursor for the next page (pass it back as `after`)
+class PaginatedResponse(APIResponse):
+    next_cursor: Optional[str] = None
+
+# Keyset orderings for cursor pagination; each one has a matching index in schema.sql
+PRIORITY_RANK = {"critical": 1, "high": 2, "medium": 3}
+PRIORITY_RANK_SQL = "CASE er.priority WHEN 'critical' THEN 1 WHEN 'high' THEN 2 WHEN 'medium' THEN 3 ELSE 4 END"
+
+USERS_KEYSET = Keyset(
+    SortKey("created_at", "created_at", True, parse_timestamp),
+    SortKey("user_id", "user_id", True, UUID),
+)
+FACILITIES_KEYSET = Keyset(
+    SortKey("created_at", "created_at", True, parse_timestamp),
+    SortKey("facility_id", "facility_id", True, UUID),
+)
+EMERGENCY_KEYSET = Keyset(
+    SortKey(PRIORITY_RANK_SQL, "priority", False, lambda priority: PRIORITY_RANK.get(priority, 4)),
+    SortKey("er.created_at", "created_at", True, parse_timestamp),
+    SortKey("er.report_id", "report_id", True, UUID),
+)
+MISSING_KEYSET = Keyset(
+    SortKey("mp.created_at", "created_at", True, parse_timestamp),
+    SortKey("mp.missing_id", "missing_id", True, UUID),
+)
+# Stand-ins for NULL that keep Postgres' default null placement while giving the cursor
+# a comparable value: the INTEGER maximum keeps "crowd_avoidance_score DESC" NULLS FIRST,
+# and NaN, which sorts after every number, keeps "distance ASC" NULLS LAST
+NULL_SCORE = 2147483647
+ROUTES_KEYSET = Keyset(
+    SortKey(f"COALESCE(crowd_avoidance_score, {NULL_SCORE})", "crowd_avoidance_score",
+            True, lambda score: score if score is not None else NULL_SCORE),
+    SortKey("COALESCE(distance, 'NaN'::numeric)", "distance",
+            False, lambda distance: Decimal(distance if distance is not None else "NaN")),
+    SortKey("created_at", "created_at", True, parse_timestamp),
+    SortKey("route_id", "route_id", True, UUID),
+)
+
 # =======================
 # PYDANTIC MODELS
 # =======================
@@ -89,6 +509,7 @@ class UserUpdate(BaseModel):
     location_lat: Optional[float] = None
     location_lng: Optional[float] = None
     device_id: Optional[str] = None
+    on_duty: Optional[bool] = None
 
 class FacilityCreate(BaseModel):
     type: str = Field(..., pattern="^(washroom|rest|mandir|akhada|food|parking|ghat|medical|police_station)$")
@@ -187,6 +608,21 @@ class SmartBandUpdate(BaseModel):
     last_lng: Optional[float] = None
     battery_level: Optional[int] = None
 
+class GeofenceCreate(BaseModel):
+    name: str
+    center_lat: float = Field(..., ge=-90, le=90)
+    center_lng: float = Field(..., ge=-180, le=180)
+    radius: float = Field(..., gt=0)
+    type: str = Field(..., regex="^(restricted|vip|emergency|parking|facility)$")
+    is_active: bool = True
+
+class BandPing(BaseModel):
+    band_id: UUID
+    lat: float = Field(..., ge=-90, le=90)
+    lng: float = Field(..., ge=-180, le=180)
+    battery_level: Optional[int] = Field(None, ge=0, le=100)
+    recorded_at: Optional[datetime] = None
+
 # =======================
 # USER ROUTES
 # =======================
@@ -209,13 +645,28 @@ async def create_user(user: UserCreate, db=Depends(get_db)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/users", response_model=APIResponse)
-async def get_all_users(skip: int = 0, limit: int = 100, db=Depends(get_db)):
+@app.get("/users", response_model=PaginatedResponse)
+async def get_all_users(skip: int = 0, limit: int = 100, after: Optional[str] = None, db=Depends(get_db)):
     try:
-        query = "SELECT * FROM users ORDER BY created_at DESC OFFSET $1 LIMIT $2"
-        results = await db.fetch(query, skip, limit)
-        return APIResponse(success=True, message="Users retrieved successfully", 
-                         data=[dict(row) for row in results])
+        where_clause = ""
+        values = []
+        param_count = 1
+        
+        if after:
+            keyset_condition, values, param_count = USERS_KEYSET.condition(after, param_count)
+            where_clause = f"WHERE {keyset_condition}"
+        
+        values.extend([skip, limit])
+        query = f"""
+        SELECT * FROM users {where_clause}
+        ORDER BY {USERS_KEYSET.order_by()}
+        OFFSET ${param_count} LIMIT ${param_count + 1}
+        """
+        rows = await db.fetch(query, *values)
+        return api_response(True, "Users retrieved successfully",
+                            data=rows, next_cursor=USERS_KEYSET.next_cursor(rows, limit))
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -255,6 +706,8 @@ async def update_user(user_id: UUID, user_update: UserUpdate, db=Depends(get_db)
         
         if not result:
             raise HTTPException(status_code=404, detail="User not found")
+        if dispatcher.ready:
+            dispatcher.update_user(result)
         
         return APIResponse(success=True, message="User updated successfully", data=dict(result))
     except HTTPException:
@@ -277,21 +730,55 @@ async def create_facility(facility: FacilityCreate, db=Depends(get_db)):
         result = await db.fetchrow(query, facility.type, facility.name, facility.description,
                                  facility.icon, facility.lat, facility.lng, 
                                  facility.open_hours, facility.rating)
+        index_row("facilities", result)
+        await response_cache.invalidate("facilities")
         return APIResponse(success=True, message="Facility created successfully", data=dict(result))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/facilities", response_model=APIResponse)
+@app.get("/facilities", response_model=PaginatedResponse)
 async def get_facilities(
+    request: Request,
+    response: Response,
     type: Optional[str] = None,
     lat: Optional[float] = None,
     lng: Optional[float] = None,
     radius: Optional[float] = None,
     skip: int = 0,
     limit: int = 100,
+    after: Optional[str] = None,
     db=Depends(get_db)
 ):
     try:
+        nearby = bool(lat and lng and radius)
+        if after and nearby:
+            raise InvalidCursor("Cursor pagination is not supported with a radius search")
+        
+        if facility_index.ready:
+            predicate = (lambda record: record["type"] == type) if type else None
+            if nearby:
+                rows = [{**record, "distance": distance}
+                        for distance, record in facility_index.within(lat, lng, radius, predicate)]
+            else:
+                # The index keeps facilities in keyset order, so a page starts with a bisection
+                boundary = tuple(FACILITIES_KEYSET.decode(after)) if after else None
+                records = facility_index.ordered(descending=True, after=boundary, predicate=predicate)
+                rows = [{**record, "distance": None} for record in islice(records, skip + limit)]
+            rows = rows[skip:skip + limit]
+            next_cursor = None if nearby else FACILITIES_KEYSET.next_cursor(rows, limit)
+            # Hashed from the page: the index may lag the table counters for a moment
+            etag = content_etag(dumps([rows, next_cursor]))
+            if etag_matches(request, etag):
+                return not_modified(etag)
+            set_etag(response, etag)
+            return PaginatedResponse(success=True, message="Facilities retrieved successfully",
+                                     data=rows, next_cursor=next_cursor)
+        
+        etag = await table_versions_etag(db, ["facilities"])
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        set_etag(response, etag)
+        
         conditions = []
         values = []
         param_count = 1
@@ -301,45 +788,82 @@ async def get_facilities(
             values.append(type)
             param_count += 1
         
-        # Nearby search using Haversine formula
-        if lat and lng and radius:
-            conditions.append(f"""
-                (6371 * acos(cos(radians(${param_count})) * cos(radians(lat)) * 
-                cos(radians(lng) - radians(${param_count + 1})) + 
-                sin(radians(${param_count})) * sin(radians(lat)))) <= ${param_count + 2}
-            """)
-            values.extend([lat, lng, radius])
-            param_count += 3
+        # Nearby search: bounding box on idx_facilities_location, then exact Haversine
+        distance_expr = "NULL::float8"
+        if nearby:
+            geo_conditions, geo_values, distance_expr, param_count = nearby_filter(
+                "lat", "lng", lat, lng, radius, param_count)
+            conditions.extend(geo_conditions)
+            values.extend(geo_values)
+            order_by = "distance ASC, created_at DESC"
+        else:
+            order_by = FACILITIES_KEYSET.order_by()
+        
+        if after:
+            keyset_condition, keyset_values, param_count = FACILITIES_KEYSET.condition(after, param_count)
+            conditions.append(keyset_condition)
+            values.extend(keyset_values)
         
         where_clause = "WHERE " + " AND ".join(conditions) if conditions else ""
         
         values.extend([skip, limit])
         query = f"""
-        SELECT *, 
-        CASE WHEN ${param_count - 2 if lat and lng and radius else 'NULL'} IS NOT NULL THEN
-            (6371 * acos(cos(radians(${param_count - 2 if lat and lng and radius else 'NULL'})) * cos(radians(lat)) * 
-            cos(radians(lng) - radians(${param_count - 1 if lat and lng and radius else 'NULL'})) + 
-            sin(radians(${param_count - 2 if lat and lng and radius else 'NULL'})) * sin(radians(lat))))
-        ELSE NULL END as distance
+        SELECT *, {distance_expr} as distance
         FROM facilities {where_clause}
-        ORDER BY distance ASC NULLS LAST, created_at DESC
+        ORDER BY {order_by}
         OFFSET ${param_count} LIMIT ${param_count + 1}
         """
         
-        results = await db.fetch(query, *values)
-        return APIResponse(success=True, message="Facilities retrieved successfully", 
-                         data=[dict(row) for row in results])
+        rows = [dict(row) for row in await db.fetch(query, *values)]
+        return PaginatedResponse(success=True, message="Facilities retrieved successfully", 
+                                 data=rows,
+                                 next_cursor=None if nearby else FACILITIES_KEYSET.next_cursor(rows, limit))
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/facilities/{facility_id}", response_model=APIResponse)
-async def get_facility_by_id(facility_id: UUID, db=Depends(get_db)):
+@app.get("/facilities/nearest", response_model=APIResponse)
+async def get_nearest_facilities(
+    lat: float,
+    lng: float,
+    k: int = Query(5, ge=1, le=100),
+    type: Optional[List[str]] = Query(None),
+    max_radius: float = Query(NEAREST_MAX_RADIUS_KM, gt=0),
+    db=Depends(get_db)
+):
     try:
+        if facility_index.ready:
+            types = set(type or [])
+            predicate = (lambda record: record["type"] in types) if types else None
+            rows = [{**record, "distance": distance}
+                    for distance, record in facility_index.nearest(lat, lng, k, predicate, max_radius)]
+        else:
+            conditions = []
+            values = []
+            if type:
+                conditions.append("type = ANY($1::varchar[])")
+                values.append(type)
+            results = await fetch_nearest(db, "facilities", "", conditions, values,
+                                          lat, lng, k, max_radius)
+            rows = [dict(row) for row in results]
+        
+        return APIResponse(success=True, message="Nearest facilities retrieved successfully", data=rows)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/facilities/{facility_id}", response_model=APIResponse)
+async def get_facility_by_id(facility_id: UUID):
+    async def fetch_facility():
         query = "SELECT * FROM facilities WHERE facility_id = $1"
-        result = await db.fetchrow(query, facility_id)
+        result = await db_pool.fetchrow(query, facility_id)
         if not result:
             raise HTTPException(status_code=404, detail="Facility not found")
-        return APIResponse(success=True, message="Facility retrieved successfully", data=dict(result))
+        return dict(result)
+
+    try:
+        data = await response_cache.get_or_compute("facilities", {"facility_id": facility_id}, fetch_facility)
+        return APIResponse(success=True, message="Facility retrieved successfully", data=data)
     except HTTPException:
         raise
     except Exception as e:
@@ -374,8 +898,7 @@ async def get_shuttles(status: Optional[str] = None, db=Depends(get_db)):
             query = "SELECT * FROM shuttles ORDER BY updated_at DESC"
             results = await db.fetch(query)
         
-        return APIResponse(success=True, message="Shuttles retrieved successfully", 
-                         data=[dict(row) for row in results])
+        return api_response(True, "Shuttles retrieved successfully", data=results)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -422,12 +945,21 @@ async def create_parking(parking: ParkingCreate, db=Depends(get_db)):
         """
         result = await db.fetchrow(query, parking.parking_area_name, parking.lat, parking.lng,
                                  parking.total_capacity, parking.available_capacity, parking.price_per_hour)
+        index_row("parking_slots", result)
         return APIResponse(success=True, message="Parking slot created successfully", data=dict(result))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def parking_view(record, distance):
+    # Mirrors ROUND((available_capacity::decimal / total_capacity) * 100, 2)
+    total = record["total_capacity"]
+    percentage = round(Decimal(record["available_capacity"]) / Decimal(total) * 100, 2) if total else None
+    return {**record, "distance": distance, "availability_percentage": percentage}
+
 @app.get("/parking", response_model=APIResponse)
 async def get_parking_slots(
+    request: Request,
+    response: Response,
     available_only: bool = False,
     lat: Optional[float] = None,
     lng: Optional[float] = None,
@@ -435,6 +967,29 @@ async def get_parking_slots(
     db=Depends(get_db)
 ):
     try:
+        if parking_index.ready:
+            predicate = (lambda record: record["available_capacity"] > 0) if available_only else None
+            if lat and lng and radius:
+                rows = [parking_view(record, distance)
+                        for distance, record in parking_index.within(lat, lng, radius, predicate)]
+            else:
+                rows = [parking_view(record, None) for record in parking_index.all(predicate)]
+            rows.sort(key=lambda row: (
+                row["distance"] if row["distance"] is not None else float("inf"),
+                -(row["availability_percentage"] or 0),
+            ))
+            # Hashed from the rows: the index may lag the table counters for a moment
+            etag = content_etag(dumps(rows))
+            if etag_matches(request, etag):
+                return not_modified(etag)
+            set_etag(response, etag)
+            return APIResponse(success=True, message="Parking slots retrieved successfully", data=rows)
+        
+        etag = await table_versions_etag(db, ["parking_slots"])
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        set_etag(response, etag)
+        
         conditions = []
         values = []
         param_count = 1
@@ -442,24 +997,17 @@ async def get_parking_slots(
         if available_only:
             conditions.append("available_capacity > 0")
         
+        distance_expr = "NULL::float8"
         if lat and lng and radius:
-            conditions.append(f"""
-                (6371 * acos(cos(radians(${param_count})) * cos(radians(lat)) * 
-                cos(radians(lng) - radians(${param_count + 1})) + 
-                sin(radians(${param_count})) * sin(radians(lat)))) <= ${param_count + 2}
-            """)
-            values.extend([lat, lng, radius])
-            param_count += 3
+            geo_conditions, geo_values, distance_expr, param_count = nearby_filter(
+                "lat", "lng", lat, lng, radius, param_count)
+            conditions.extend(geo_conditions)
+            values.extend(geo_values)
         
         where_clause = "WHERE " + " AND ".join(conditions) if conditions else ""
         
         query = f"""
-        SELECT *, 
-        CASE WHEN ${param_count - 2 if lat and lng and radius else 'NULL'} IS NOT NULL THEN
-            (6371 * acos(cos(radians(${param_count - 2 if lat and lng and radius else 'NULL'})) * cos(radians(lat)) * 
-            cos(radians(lng) - radians(${param_count - 1 if lat and lng and radius else 'NULL'})) + 
-            sin(radians(${param_count - 2 if lat and lng and radius else 'NULL'})) * sin(radians(lat))))
-        ELSE NULL END as distance,
+        SELECT *, {distance_expr} as distance,
         ROUND((available_capacity::decimal / total_capacity) * 100, 2) as availability_percentage
         FROM parking_slots {where_clause}
         ORDER BY distance ASC NULLS LAST, availability_percentage DESC
@@ -471,6 +1019,32 @@ async def get_parking_slots(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/parking/nearest", response_model=APIResponse)
+async def get_nearest_parking(
+    lat: float,
+    lng: float,
+    k: int = Query(5, ge=1, le=100),
+    available_only: bool = True,
+    max_radius: float = Query(NEAREST_MAX_RADIUS_KM, gt=0),
+    db=Depends(get_db)
+):
+    try:
+        if parking_index.ready:
+            predicate = (lambda record: record["available_capacity"] > 0) if available_only else None
+            rows = [parking_view(record, distance)
+                    for distance, record in parking_index.nearest(lat, lng, k, predicate, max_radius)]
+        else:
+            conditions = ["available_capacity > 0"] if available_only else []
+            results = await fetch_nearest(
+                db, "parking_slots",
+                ", ROUND((available_capacity::decimal / total_capacity) * 100, 2) as availability_percentage",
+                conditions, [], lat, lng, k, max_radius)
+            rows = [dict(row) for row in results]
+        
+        return APIResponse(success=True, message="Nearest parking slots retrieved successfully", data=rows)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.put("/parking/{slot_id}", response_model=APIResponse)
 async def update_parking(slot_id: UUID, parking_update: ParkingUpdate, db=Depends(get_db)):
     try:
@@ -494,6 +1068,7 @@ async def update_parking(slot_id: UUID, parking_update: ParkingUpdate, db=Depend
         if not result:
             raise HTTPException(status_code=404, detail="Parking slot not found")
         
+        index_row("parking_slots", result)
         return APIResponse(success=True, message="Parking slot updated successfully", data=dict(result))
     except HTTPException:
         raise
@@ -523,19 +1098,69 @@ async def create_crowd_data(crowd: CrowdCreate, db=Depends(get_db)):
         RETURNING *
         """
         result = await db.fetchrow(query, crowd.location_id, crowd.people_count, crowd.density_level)
+        await response_cache.invalidate("crowd")
         return APIResponse(success=True, message="Crowd data updated successfully", data=dict(result))
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/crowd/batch", response_model=APIResponse)
+async def create_crowd_data_batch(readings: List[CrowdCreate], db=Depends(get_db)):
+    """
+    Upsert many crowd readings in one statement. Each item gets a status:
+    "stored", "unknown_facility", or "superseded" when a later item in the same
+    batch is for the same location (only the last reading per location is written).
+    """
+    if len(readings) > CROWD_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {CROWD_BATCH_MAX_ITEMS} readings per batch")
+    try:
+        statuses = ["superseded"] * len(readings)
+        latest = {}
+        for position, reading in enumerate(readings):
+            latest[reading.location_id] = position
+        if facility_index.ready:
+            # Unknown facilities are rejected here; the statement below still checks the rest
+            for location_id, position in list(latest.items()):
+                if facility_index.get(location_id) is None:
+                    statuses[position] = "unknown_facility"
+                    del latest[location_id]
+        
+        batch = [readings[position] for position in latest.values()]
+        stored = set()
+        if batch:
+            rows = await db.fetch("""
+            INSERT INTO crowd_density (location_id, people_count, density_level)
+            SELECT r.location_id, r.people_count, r.density_level
+            FROM unnest($1::uuid[], $2::int[], $3::text[]) AS r(location_id, people_count, density_level)
+            WHERE EXISTS (SELECT 1 FROM facilities f WHERE f.facility_id = r.location_id)
+            ON CONFLICT (location_id) DO UPDATE SET
+            people_count = EXCLUDED.people_count,
+            density_level = EXCLUDED.density_level,
+            updated_at = NOW()
+            RETURNING location_id
+            """, [reading.location_id for reading in batch], [reading.people_count for reading in batch],
+                [reading.density_level for reading in batch])
+            stored = {row["location_id"] for row in rows}
+            await response_cache.invalidate("crowd")
+        for location_id, position in latest.items():
+            statuses[position] = "stored" if location_id in stored else "unknown_facility"
+        
+        items = [{"location_id": reading.location_id, "status": status} for reading, status in zip(readings, statuses)]
+        return api_response(True, "Crowd data batch processed", data=items,
+                            stored=len(stored), rejected=statuses.count("unknown_facility"),
+                            superseded=statuses.count("superseded"))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/crowd", response_model=APIResponse)
 async def get_crowd_data(
+    request: Request,
+    response: Response,
     density_level: Optional[str] = None,
-    location_id: Optional[UUID] = None,
-    db=Depends(get_db)
+    location_id: Optional[UUID] = None
 ):
-    try:
+    async def fetch_crowd():
         conditions = []
         values = []
         param_count = 1
@@ -560,36 +1185,51 @@ async def get_crowd_data(
         ORDER BY cd.updated_at DESC
         """
         
-        results = await db.fetch(query, *values)
-        return APIResponse(success=True, message="Crowd data retrieved successfully", 
-                         data=[dict(row) for row in results])
+        results = await db_pool.fetch(query, *values)
+        return [dict(row) for row in results]
+
+    try:
+        etag = await table_versions_etag(db_pool, ["crowd_density", "facilities"])
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        set_etag(response, etag)
+        
+        # Keyed on the ETag too, so writes from other processes also miss the cache
+        data = await response_cache.get_or_compute(
+            "crowd", {"density_level": density_level, "location_id": location_id, "version": etag}, fetch_crowd)
+        return APIResponse(success=True, message="Crowd data retrieved successfully", data=data)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/crowd/low-density", response_model=APIResponse)
 async def get_low_density_locations(
+    request: Request,
+    response: Response,
     lat: Optional[float] = None,
     lng: Optional[float] = None,
     radius: Optional[float] = 10,
     db=Depends(get_db)
 ):
     try:
+        etag = await table_versions_etag(db, ["crowd_density", "facilities"])
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        set_etag(response, etag)
+        
         # Get facilities with low crowd density, sorted by distance if lat/lng provided
         if lat and lng:
-            query = """
+            geo_conditions, geo_values, distance_expr, _ = nearby_filter(
+                "f.lat", "f.lng", lat, lng, radius, 1)
+            query = f"""
             SELECT cd.*, f.name as facility_name, f.type as facility_type, f.lat, f.lng,
-                   (6371 * acos(cos(radians($1)) * cos(radians(f.lat)) * 
-                   cos(radians(f.lng) - radians($2)) + 
-                   sin(radians($1)) * sin(radians(f.lat)))) as distance
+                   {distance_expr} as distance
             FROM crowd_density cd
             JOIN facilities f ON cd.location_id = f.facility_id
             WHERE cd.density_level IN ('low', 'medium')
-            AND (6371 * acos(cos(radians($1)) * cos(radians(f.lat)) * 
-                cos(radians(f.lng) - radians($2)) + 
-                sin(radians($1)) * sin(radians(f.lat)))) <= $3
+            AND {" AND ".join(geo_conditions)}
             ORDER BY distance ASC, cd.people_count ASC
             """
-            results = await db.fetch(query, lat, lng, radius)
+            results = await db.fetch(query, *geo_values)
         else:
             query = """
             SELECT cd.*, f.name as facility_name, f.type as facility_type, f.lat, f.lng
@@ -605,28 +1245,200 @@ async def get_low_density_locations(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/crowd/{location_id}/history", response_model=APIResponse)
+async def get_crowd_history(
+    location_id: UUID,
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    step: Optional[int] = Query(None, ge=60, description="Bucket size in seconds, a multiple of 60"),
+    db=Depends(get_db)
+):
+    """
+    Crowd build-up at one location: people count min/max/avg and seconds spent at
+    each density level per `step` bucket, from the coarsest rollup that fits the step.
+    Defaults to the last 24 hours.
+    """
+    try:
+        end = end or datetime.now(timezone.utc)
+        start = start or end - timedelta(hours=24)
+        if end.tzinfo is None:
+            end = end.replace(tzinfo=timezone.utc)
+        if start.tzinfo is None:
+            start = start.replace(tzinfo=timezone.utc)
+        if start >= end:
+            raise HTTPException(status_code=400, detail="'from' must be before 'to'")
+        
+        span = (end - start).total_seconds()
+        if step is None:
+            # Finest resolution that keeps the series under the bucket limit
+            fitting = [resolution for resolution in RESOLUTIONS if span / resolution <= CROWD_HISTORY_MAX_BUCKETS]
+            step = fitting[0] if fitting else math.ceil(span / CROWD_HISTORY_MAX_BUCKETS / 3600) * 3600
+        elif resolution_for(step) is None:
+            raise HTTPException(status_code=400, detail="step must be a multiple of 60 seconds")
+        elif span / step > CROWD_HISTORY_MAX_BUCKETS:
+            raise HTTPException(status_code=400,
+                                detail=f"At most {CROWD_HISTORY_MAX_BUCKETS} buckets; use a larger step")
+        
+        resolution, rolled_up_to, rows = await crowd_rollups.history(db, location_id, start, end, step)
+        return api_response(True, "Crowd history retrieved successfully", data=rows,
+                            location_id=location_id, step_seconds=step, resolution_seconds=resolution,
+                            rolled_up_to=rolled_up_to)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/crowd/history/stats", response_model=APIResponse)
+async def get_crowd_history_stats():
+    return APIResponse(success=True, message="Crowd history stats retrieved successfully",
+                       data=crowd_rollups.stats())
+
+@app.get("/crowd/forecast", response_model=APIResponse)
+async def get_crowd_forecast(
+    location_id: Optional[UUID] = None,
+    min_level: Optional[str] = Query(None, description="Only locations forecast to reach this level"),
+    warnings_only: bool = False
+):
+    """
+    Predicted people count and density level per location 15, 30 and 60 minutes
+    ahead, with a warning when a location is expected to go high or critical.
+    Served from the last background fit; `fitted_at` says how old it is.
+    """
+    if min_level is not None and min_level not in LEVEL_ORDER:
+        raise HTTPException(status_code=400, detail=f"min_level must be one of {', '.join(LEVEL_ORDER)}")
+    if not crowd_forecaster.ready:
+        raise HTTPException(status_code=503, detail="Crowd forecasts are not ready yet")
+    try:
+        forecasts = crowd_forecaster.get(location_id, min_level, warnings_only)
+        return api_response(True, "Crowd forecast retrieved successfully", data=forecasts,
+                            fitted_at=crowd_forecaster.fitted_at)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/crowd/forecast/stats", response_model=APIResponse)
+async def get_crowd_forecast_stats():
+    return APIResponse(success=True, message="Crowd forecast stats retrieved successfully",
+                       data=crowd_forecaster.stats())
+
 # =======================
 # EMERGENCY ROUTES
 # =======================
 
+def dispatch_message(emergency_type: str, priority: str, distance_km: float) -> str:
+    return f"{priority.capitalize()} priority {emergency_type.replace('_', ' ')} emergency {distance_km:.1f} km from you"
+
 @app.post("/emergency", response_model=APIResponse)
 async def report_emergency(emergency: EmergencyCreate, db=Depends(get_db)):
     try:
+        # Matched in memory, so the report is stored already assigned and the
+        # responder's notification is written by the same statement
+        match = dispatcher.choose(emergency.lat, emergency.lng, emergency.type) if dispatcher.ready else None
+        responder, distance = match if match is not None else (None, None)
+        assigned_to = responder["user_id"] if responder else None
+        
         query = """
-        INSERT INTO emergency_reports (user_id, lat, lng, type, description, priority)
-        VALUES ($1, $2, $3, $4, $5, $6)
-        RETURNING *
+        WITH report AS (
+            INSERT INTO emergency_reports (user_id, lat, lng, type, description, priority, assigned_to)
+            VALUES ($1, $2, $3, $4, $5, $6, $7)
+            RETURNING *
+        ), notice AS (
+            INSERT INTO notifications (user_id, title, message, type)
+            SELECT assigned_to, 'Emergency assigned to you', $8, 'emergency'
+            FROM report WHERE assigned_to IS NOT NULL
+        )
+        SELECT * FROM report
         """
-        result = await db.fetchrow(query, emergency.user_id, emergency.lat, emergency.lng,
-                                 emergency.type, emergency.description, emergency.priority)
-        
-        # TODO: Add notification logic here to alert nearby responders
+        try:
+            result = await db.fetchrow(query, emergency.user_id, emergency.lat, emergency.lng,
+                                     emergency.type, emergency.description, emergency.priority, assigned_to,
+                                     dispatch_message(emergency.type, emergency.priority, distance) if responder else None)
+        except Exception:
+            dispatcher.released(assigned_to)
+            raise
+        
+        data = dict(result)
+        if responder:
+            data.update(assigned_name=responder["name"], assigned_phone=responder["phone_number"],
+                        assigned_role=responder["role"], assigned_distance_km=round(distance, 3))
+        return APIResponse(success=True, message="Emergency reported successfully", data=data)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/emergency/dispatch", response_model=APIResponse)
+async def dispatch_emergencies(limit: int = Query(500, ge=1, le=5000), db=Depends(get_db)):
+    """
+    Assign open reports that have no responder, or whose responder went off duty,
+    in one pass: most urgent first, all written with a single statement.
+    """
+    try:
+        if not dispatcher.ready:
+            raise HTTPException(status_code=503, detail="Responder index is not loaded")
         
-        return APIResponse(success=True, message="Emergency reported successfully", data=dict(result))
+        reports = await db.fetch(f"""
+        SELECT er.report_id, er.lat, er.lng, er.type, er.priority, er.created_at, er.assigned_to
+        FROM emergency_reports er
+        LEFT JOIN users u ON er.assigned_to = u.user_id
+        WHERE er.status = 'open' AND (er.assigned_to IS NULL OR u.on_duty IS NOT TRUE)
+        ORDER BY {PRIORITY_RANK_SQL}, er.created_at
+        LIMIT $1
+        """, limit)
+        matches = dispatcher.choose_batch([dict(report) for report in reports])
+        
+        assigned = []
+        if matches:
+            try:
+                # Only applied where the assignment is still what was read above
+                rows = await db.fetch("""
+                WITH picked AS (
+                    SELECT * FROM unnest($1::uuid[], $2::uuid[], $3::uuid[], $4::text[])
+                        AS p(report_id, previous_id, responder_id, message)
+                ), updated AS (
+                    UPDATE emergency_reports er SET assigned_to = p.responder_id
+                    FROM picked p
+                    WHERE er.report_id = p.report_id AND er.status = 'open'
+                    AND er.assigned_to IS NOT DISTINCT FROM p.previous_id
+                    RETURNING er.report_id
+                ), notice AS (
+                    INSERT INTO notifications (user_id, title, message, type)
+                    SELECT p.responder_id, 'Emergency assigned to you', p.message, 'emergency'
+                    FROM updated JOIN picked p USING (report_id)
+                )
+                SELECT report_id FROM updated
+                """, [report["report_id"] for report, _, _ in matches],
+                    [report["assigned_to"] for report, _, _ in matches],
+                    [responder["user_id"] for _, responder, _ in matches],
+                    [dispatch_message(report["type"], report["priority"], distance) for report, _, distance in matches])
+            except Exception:
+                for _, responder, _ in matches:
+                    dispatcher.released(responder["user_id"])
+                raise
+            
+            updated = {row["report_id"] for row in rows}
+            for report, responder, distance in matches:
+                if report["report_id"] not in updated:
+                    dispatcher.released(responder["user_id"])
+                    continue
+                dispatcher.released(report["assigned_to"])
+                assigned.append({
+                    "report_id": report["report_id"],
+                    "assigned_to": responder["user_id"],
+                    "assigned_name": responder["name"],
+                    "assigned_role": responder["role"],
+                    "assigned_distance_km": round(distance, 3),
+                })
+        
+        return APIResponse(success=True, message=f"Assigned {len(assigned)} of {len(reports)} emergency reports",
+                           data={"assigned": assigned, "unassigned": len(reports) - len(assigned)})
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/emergency", response_model=APIResponse)
+@app.get("/emergency/dispatch/stats", response_model=APIResponse)
+async def get_dispatch_stats():
+    return APIResponse(success=True, message="Dispatch stats retrieved successfully", data=dispatcher.stats())
+
+@app.get("/emergency", response_model=PaginatedResponse)
 async def get_emergency_reports(
     status: Optional[str] = None,
     type: Optional[str] = None,
@@ -636,9 +1448,14 @@ async def get_emergency_reports(
     radius: Optional[float] = None,
     skip: int = 0,
     limit: int = 50,
+    after: Optional[str] = None,
     db=Depends(get_db)
 ):
     try:
+        nearby = bool(lat and lng and radius)
+        if after and nearby:
+            raise InvalidCursor("Cursor pagination is not supported with a radius search")
+        
         conditions = []
         values = []
         param_count = 1
@@ -658,14 +1475,20 @@ async def get_emergency_reports(
             values.append(priority)
             param_count += 1
         
-        if lat and lng and radius:
-            conditions.append(f"""
-                (6371 * acos(cos(radians(${param_count})) * cos(radians(er.lat)) * 
-                cos(radians(er.lng) - radians(${param_count + 1})) + 
-                sin(radians(${param_count})) * sin(radians(er.lat)))) <= ${param_count + 2}
-            """)
-            values.extend([lat, lng, radius])
-            param_count += 3
+        distance_expr = "NULL::float8"
+        if nearby:
+            geo_conditions, geo_values, distance_expr, param_count = nearby_filter(
+                "er.lat", "er.lng", lat, lng, radius, param_count)
+            conditions.extend(geo_conditions)
+            values.extend(geo_values)
+            order_by = f"{PRIORITY_RANK_SQL}, distance ASC, er.created_at DESC"
+        else:
+            order_by = EMERGENCY_KEYSET.order_by()
+        
+        if after:
+            keyset_condition, keyset_values, param_count = EMERGENCY_KEYSET.condition(after, param_count)
+            conditions.append(keyset_condition)
+            values.extend(keyset_values)
         
         where_clause = "WHERE " + " AND ".join(conditions) if conditions else ""
         values.extend([skip, limit])
@@ -674,30 +1497,21 @@ async def get_emergency_reports(
         SELECT er.*, 
                u1.name as reporter_name, u1.phone_number as reporter_phone,
                u2.name as assigned_name, u2.phone_number as assigned_phone,
-               CASE WHEN ${param_count - 2 if lat and lng and radius else 'NULL'} IS NOT NULL THEN
-                   (6371 * acos(cos(radians(${param_count - 2 if lat and lng and radius else 'NULL'})) * cos(radians(er.lat)) * 
-                   cos(radians(er.lng) - radians(${param_count - 1 if lat and lng and radius else 'NULL'})) + 
-                   sin(radians(${param_count - 2 if lat and lng and radius else 'NULL'})) * sin(radians(er.lat))))
-               ELSE NULL END as distance
+               {distance_expr} as distance
         FROM emergency_reports er
         LEFT JOIN users u1 ON er.user_id = u1.user_id
         LEFT JOIN users u2 ON er.assigned_to = u2.user_id
         {where_clause}
-        ORDER BY 
-            CASE er.priority 
-                WHEN 'critical' THEN 1 
-                WHEN 'high' THEN 2 
-                WHEN 'medium' THEN 3 
-                ELSE 4 
-            END,
-            distance ASC NULLS LAST,
-            er.created_at DESC
+        ORDER BY {order_by}
         OFFSET ${param_count} LIMIT ${param_count + 1}
         """
         
-        results = await db.fetch(query, *values)
-        return APIResponse(success=True, message="Emergency reports retrieved successfully", 
-                         data=[dict(row) for row in results])
+        rows = await db.fetch(query, *values)
+        return api_response(True, "Emergency reports retrieved successfully",
+                            data=rows,
+                            next_cursor=None if nearby else EMERGENCY_KEYSET.next_cursor(rows, limit))
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -720,13 +1534,29 @@ async def update_emergency_report(report_id: UUID, emergency_update: EmergencyUp
             raise HTTPException(status_code=400, detail="No fields to update")
         
         values.append(report_id)
-        query = f"UPDATE emergency_reports SET {', '.join(update_fields)} WHERE report_id = ${param_count} RETURNING *"
+        query = f"""
+        UPDATE emergency_reports er SET {', '.join(update_fields)}
+        FROM (SELECT report_id, assigned_to, status FROM emergency_reports
+              WHERE report_id = ${param_count} FOR UPDATE) prev
+        WHERE er.report_id = prev.report_id
+        RETURNING er.*, prev.assigned_to AS previous_assigned_to, prev.status AS previous_status
+        """
         result = await db.fetchrow(query, *values)
         
         if not result:
             raise HTTPException(status_code=404, detail="Emergency report not found")
         
-        return APIResponse(success=True, message="Emergency report updated successfully", data=dict(result))
+        # Keep the dispatcher's responder loads in step with manual changes
+        data = dict(result)
+        previous_assigned_to = data.pop("previous_assigned_to")
+        previous_status = data.pop("previous_status")
+        old_load = previous_assigned_to if previous_status in OPEN_STATUSES else None
+        new_load = data["assigned_to"] if data["status"] in OPEN_STATUSES else None
+        if old_load != new_load:
+            dispatcher.released(old_load)
+            dispatcher.assigned(new_load)
+        
+        return APIResponse(success=True, message="Emergency report updated successfully", data=data)
     except HTTPException:
         raise
     except Exception as e:
@@ -753,7 +1583,7 @@ async def report_missing_person(missing: MissingPersonCreate, db=Depends(get_db)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/missing", response_model=APIResponse)
+@app.get("/missing", response_model=PaginatedResponse)
 async def get_missing_persons(
     status: Optional[str] = None,
     lat: Optional[float] = None,
@@ -761,9 +1591,14 @@ async def get_missing_persons(
     radius: Optional[float] = None,
     skip: int = 0,
     limit: int = 50,
+    after: Optional[str] = None,
     db=Depends(get_db)
 ):
     try:
+        nearby = bool(lat and lng and radius)
+        if after and nearby:
+            raise InvalidCursor("Cursor pagination is not supported with a radius search")
+        
         conditions = []
         values = []
         param_count = 1
@@ -773,14 +1608,20 @@ async def get_missing_persons(
             values.append(status)
             param_count += 1
         
-        if lat and lng and radius:
-            conditions.append(f"""
-                (6371 * acos(cos(radians(${param_count})) * cos(radians(mp.last_seen_lat)) * 
-                cos(radians(mp.last_seen_lng) - radians(${param_count + 1})) + 
-                sin(radians(${param_count})) * sin(radians(mp.last_seen_lat)))) <= ${param_count + 2}
-            """)
-            values.extend([lat, lng, radius])
-            param_count += 3
+        distance_expr = "NULL::float8"
+        if nearby:
+            geo_conditions, geo_values, distance_expr, param_count = nearby_filter(
+                "mp.last_seen_lat", "mp.last_seen_lng", lat, lng, radius, param_count)
+            conditions.extend(geo_conditions)
+            values.extend(geo_values)
+            order_by = "distance ASC, mp.created_at DESC"
+        else:
+            order_by = MISSING_KEYSET.order_by()
+        
+        if after:
+            keyset_condition, keyset_values, param_count = MISSING_KEYSET.condition(after, param_count)
+            conditions.append(keyset_condition)
+            values.extend(keyset_values)
         
         where_clause = "WHERE " + " AND ".join(conditions) if conditions else ""
         values.extend([skip, limit])
@@ -789,22 +1630,21 @@ async def get_missing_persons(
         SELECT mp.*, 
                u1.name as reporter_name, u1.phone_number as reporter_phone,
                u2.name as volunteer_name, u2.phone_number as volunteer_phone,
-               CASE WHEN ${param_count - 2 if lat and lng and radius else 'NULL'} IS NOT NULL THEN
-                   (6371 * acos(cos(radians(${param_count - 2 if lat and lng and radius else 'NULL'})) * cos(radians(mp.last_seen_lat)) * 
-                   cos(radians(mp.last_seen_lng) - radians(${param_count - 1 if lat and lng and radius else 'NULL'})) + 
-                   sin(radians(${param_count - 2 if lat and lng and radius else 'NULL'})) * sin(radians(mp.last_seen_lat))))
-               ELSE NULL END as distance
+               {distance_expr} as distance
         FROM missing_persons mp
         LEFT JOIN users u1 ON mp.reported_by = u1.user_id
         LEFT JOIN users u2 ON mp.assigned_volunteer = u2.user_id
         {where_clause}
-        ORDER BY distance ASC NULLS LAST, mp.created_at DESC
+        ORDER BY {order_by}
         OFFSET ${param_count} LIMIT ${param_count + 1}
         """
         
-        results = await db.fetch(query, *values)
-        return APIResponse(success=True, message="Missing persons retrieved successfully", 
-                         data=[dict(row) for row in results])
+        rows = await db.fetch(query, *values)
+        return api_response(True, "Missing persons retrieved successfully",
+                            data=rows,
+                            next_cursor=None if nearby else MISSING_KEYSET.next_cursor(rows, limit))
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -858,12 +1698,13 @@ async def create_route(route: RouteCreate, db=Depends(get_db)):
                                  route.end_point_lat, route.end_point_lng, route_points_json,
                                  route.distance, route.estimated_time, route.crowd_avoidance_score,
                                  route.route_type)
+        await response_cache.invalidate("routes")
         
         return APIResponse(success=True, message="Route created successfully", data=dict(result))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/routes", response_model=APIResponse)
+@app.get("/routes", response_model=PaginatedResponse)
 async def get_routes(
     route_type: Optional[str] = None,
     start_lat: Optional[float] = None,
@@ -872,9 +1713,9 @@ async def get_routes(
     end_lng: Optional[float] = None,
     skip: int = 0,
     limit: int = 50,
-    db=Depends(get_db)
+    after: Optional[str] = None
 ):
-    try:
+    async def fetch_routes():
         conditions = []
         values = []
         param_count = 1
@@ -886,22 +1727,21 @@ async def get_routes(
         
         # Find routes near start/end points if provided
         if start_lat and start_lng:
-            conditions.append(f"""
-                (6371 * acos(cos(radians(${param_count})) * cos(radians(start_point_lat)) * 
-                cos(radians(start_point_lng) - radians(${param_count + 1})) + 
-                sin(radians(${param_count})) * sin(radians(start_point_lat)))) <= 5
-            """)
-            values.extend([start_lat, start_lng])
-            param_count += 2
+            geo_conditions, geo_values, _, param_count = nearby_filter(
+                "start_point_lat", "start_point_lng", start_lat, start_lng, 5, param_count)
+            conditions.extend(geo_conditions)
+            values.extend(geo_values)
         
         if end_lat and end_lng:
-            conditions.append(f"""
-                (6371 * acos(cos(radians(${param_count})) * cos(radians(end_point_lat)) * 
-                cos(radians(end_point_lng) - radians(${param_count + 1})) + 
-                sin(radians(${param_count})) * sin(radians(end_point_lat)))) <= 5
-            """)
-            values.extend([end_lat, end_lng])
-            param_count += 2
+            geo_conditions, geo_values, _, param_count = nearby_filter(
+                "end_point_lat", "end_point_lng", end_lat, end_lng, 5, param_count)
+            conditions.extend(geo_conditions)
+            values.extend(geo_values)
+        
+        if after:
+            keyset_condition, keyset_values, param_count = ROUTES_KEYSET.condition(after, param_count)
+            conditions.append(keyset_condition)
+            values.extend(keyset_values)
         
         where_clause = "WHERE " + " AND ".join(conditions) if conditions else ""
         values.extend([skip, limit])
@@ -909,24 +1749,162 @@ async def get_routes(
         query = f"""
         SELECT * FROM routes 
         {where_clause}
-        ORDER BY crowd_avoidance_score DESC, distance ASC, created_at DESC
+        ORDER BY {ROUTES_KEYSET.order_by()}
         OFFSET ${param_count} LIMIT ${param_count + 1}
         """
         
-        results = await db.fetch(query, *values)
-        return APIResponse(success=True, message="Routes retrieved successfully", 
-                         data=[dict(row) for row in results])
+        rows = [dict(row) for row in await db_pool.fetch(query, *values)]
+        # Encoded before caching: the cached copy holds distance as a float, not numeric
+        return {"rows": rows, "next_cursor": ROUTES_KEYSET.next_cursor(rows, limit)}
+
+    try:
+        params = {
+            "route_type": route_type, "start_lat": start_lat, "start_lng": start_lng,
+            "end_lat": end_lat, "end_lng": end_lng, "skip": skip, "limit": limit, "after": after,
+        }
+        page = await response_cache.get_or_compute("routes", params, fetch_routes)
+        return PaginatedResponse(success=True, message="Routes retrieved successfully", 
+                                 data=page["rows"], next_cursor=page["next_cursor"])
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/routes/{route_id}", response_model=APIResponse)
-async def get_route_by_id(route_id: UUID, db=Depends(get_db)):
+async def fetch_camera_scores() -> list:
+    """(camera_id, lat, lng, score) for every camera with a known location"""
+    if not CAMERA_API_URL or not camera_locations:
+        return []
     try:
+        async with httpx.AsyncClient(timeout=2.0) as client:
+            response = await client.get(f"{CAMERA_API_URL.rstrip('/')}/cameras/latest")
+            response.raise_for_status()
+            cameras = response.json()
+    except (httpx.HTTPError, ValueError):
+        # Cameras only refine crowd weights and forecasts; crowd_density readings still apply
+        return []
+    return [
+        (camera["camera_id"], *camera_locations[camera["camera_id"]], float(camera["score"]))
+        for camera in cameras if camera["camera_id"] in camera_locations
+    ]
+
+async def fetch_camera_hotspots() -> list:
+    return [(lat, lng, camera_penalty(score)) for _, lat, lng, score in await fetch_camera_scores()]
+
+async def compute_crowd_weights():
+    # Latest recent reading per location
+    rows = await db_pool.fetch("""
+    SELECT DISTINCT ON (cd.location_id) f.lat, f.lng, cd.density_level
+    FROM crowd_density cd
+    JOIN facilities f ON cd.location_id = f.facility_id
+    WHERE cd.updated_at >= NOW() - make_interval(mins => $1)
+    ORDER BY cd.location_id, cd.updated_at DESC
+    """, CROWD_READING_MAX_AGE_MINUTES)
+    hotspots = [(float(row["lat"]), float(row["lng"]), DENSITY_PENALTY[row["density_level"]]) for row in rows]
+    hotspots.extend(await fetch_camera_hotspots())
+
+    def rebuild():
+        penalties = walk_graph.crowd_penalties(hotspots, CROWD_PENALTY_RADIUS_KM)
+        return penalties, route_cache.advance(penalties)
+
+    return await asyncio.to_thread(rebuild)
+
+# (per-node crowd penalties, crowd epoch) for the routing graph, rebuilt in the background
+crowd_weights = Snapshot(compute_crowd_weights, interval=CROWD_WEIGHTS_INTERVAL)
+
+def parse_point(value: str, name: str) -> tuple:
+    try:
+        lat, lng = (float(part) for part in value.split(","))
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"'{name}' must be 'lat,lng'")
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise HTTPException(status_code=400, detail=f"'{name}' is not a valid coordinate")
+    return lat, lng
+
+@app.get("/routes/compute", response_model=APIResponse)
+async def compute_route(
+    from_point: str = Query(..., alias="from", description="Start as 'lat,lng'"),
+    to: str = Query(..., description="Destination as 'lat,lng'"),
+    mode: str = "walking"
+):
+    """
+    Shortest walking route over the pedestrian graph, steering around crowded areas.
+
+    Edge weights follow the latest crowd_density readings and camera scores, so the
+    route changes as crowds move. The response uses the same fields as a stored route.
+    """
+    try:
+        if mode != "walking":
+            raise HTTPException(status_code=400, detail="Only walking routes can be computed")
+        if walk_graph is None:
+            raise HTTPException(status_code=503, detail="Routing graph is not loaded")
+
+        start = parse_point(from_point, "from")
+        end = parse_point(to, "to")
+        source = walk_graph.snap(*start, ROUTING_SNAP_KM)
+        target = walk_graph.snap(*end, ROUTING_SNAP_KM)
+        if source is None or target is None:
+            raise HTTPException(status_code=404, detail=f"No walkway within {ROUTING_SNAP_KM} km of "
+                                                        f"{'from' if source is None else 'to'}")
+
+        try:
+            penalties, epoch = await crowd_weights.get()
+        except Exception:
+            # No crowd data yet: plain shortest path rather than no route at all
+            penalties, epoch = None, None
+
+        # Nearby requests snap to the same nodes and share one computed path
+        result = route_cache.get(source[0], target[0], mode) if epoch is not None else None
+        if result is None:
+            result = await asyncio.to_thread(walk_graph.shortest_path, source[0], target[0], penalties)
+            if result is not None and epoch is not None:
+                route_cache.put(source[0], target[0], mode, epoch, result)
+        if result is None:
+            raise HTTPException(status_code=404, detail="No walking route between these points")
+        nodes, length_m, cost = result
+
+        # Includes the walk from each point to its nearest walkway node
+        distance_km = length_m / 1000 + source[1] + target[1]
+        route_points = [{"lat": start[0], "lng": start[1]}]
+        route_points.extend({"lat": walk_graph.lats[node], "lng": walk_graph.lngs[node]} for node in nodes)
+        route_points.append({"lat": end[0], "lng": end[1]})
+
+        return APIResponse(success=True, message="Route computed successfully", data={
+            "route_type": "walking",
+            "start_point_lat": start[0],
+            "start_point_lng": start[1],
+            "end_point_lat": end[0],
+            "end_point_lng": end[1],
+            "route_points": route_points,
+            "distance": round(distance_km, 3),
+            "estimated_time": math.ceil(distance_km / WALKING_SPEED_KMH * 60),
+            # 100 when the route meets no crowd penalty at all
+            "crowd_avoidance_score": round(100 * length_m / cost) if cost > 0 else 100,
+            "crowd_aware": penalties is not None,
+            "crowd_as_of": crowd_weights.taken_at if penalties is not None else None,
+        })
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/routes/compute/stats", response_model=APIResponse)
+async def get_route_cache_stats():
+    if route_cache is None:
+        raise HTTPException(status_code=503, detail="Routing graph is not loaded")
+    return APIResponse(success=True, message="Route cache stats retrieved successfully", data=route_cache.stats())
+
+@app.get("/routes/{route_id}", response_model=APIResponse)
+async def get_route_by_id(route_id: UUID):
+    async def fetch_route():
         query = "SELECT * FROM routes WHERE route_id = $1"
-        result = await db.fetchrow(query, route_id)
+        result = await db_pool.fetchrow(query, route_id)
         if not result:
             raise HTTPException(status_code=404, detail="Route not found")
-        return APIResponse(success=True, message="Route retrieved successfully", data=dict(result))
+        return dict(result)
+
+    try:
+        data = await response_cache.get_or_compute("routes", {"route_id": route_id}, fetch_route)
+        return APIResponse(success=True, message="Route retrieved successfully", data=data)
     except HTTPException:
         raise
     except Exception as e:
@@ -988,8 +1966,7 @@ async def get_smart_bands(
         """
         
         results = await db.fetch(query, *values)
-        return APIResponse(success=True, message="Smart bands retrieved successfully", 
-                         data=[dict(row) for row in results])
+        return api_response(True, "Smart bands retrieved successfully", data=results)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -1022,30 +1999,277 @@ async def update_smart_band(band_id: UUID, band_update: SmartBandUpdate, db=Depe
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/smartbands/telemetry", response_model=APIResponse, status_code=202)
+async def ingest_band_telemetry(pings: List[BandPing]):
+    try:
+        received_at = datetime.now(timezone.utc)
+        buffered = []
+        for ping in pings:
+            recorded_at = ping.recorded_at or received_at
+            if recorded_at.tzinfo is None:
+                recorded_at = recorded_at.replace(tzinfo=timezone.utc)
+            buffered.append((ping.band_id, (ping.lat, ping.lng, ping.battery_level, recorded_at)))
+        
+        accepted = telemetry_buffer.add(buffered)
+        dispatcher.move_bands((band_id, ping[0], ping[1]) for band_id, ping in buffered)
+        return APIResponse(success=True, message="Telemetry accepted",
+                         data={"accepted": accepted, "pending_bands": len(telemetry_buffer.pending)})
+    except BufferFull as e:
+        raise HTTPException(status_code=503, detail=str(e),
+                            headers={"Retry-After": str(max(1, round(telemetry_buffer.flush_interval)))})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/smartbands/telemetry/stats", response_model=APIResponse)
+async def get_telemetry_stats():
+    return APIResponse(success=True, message="Telemetry stats retrieved successfully",
+                     data=telemetry_buffer.stats())
+
+@app.get("/smartbands/{band_id}/trail", response_model=APIResponse)
+async def get_band_trail(
+    band_id: UUID,
+    from_: Optional[datetime] = Query(None, alias="from"),
+    to: Optional[datetime] = None,
+    limit: int = Query(5000, ge=1, le=50000),
+    db=Depends(get_db)
+):
+    try:
+        to = to or datetime.now(timezone.utc)
+        from_ = from_ or to - timedelta(hours=6)
+        # Naive timestamps are taken as UTC
+        to = to if to.tzinfo else to.replace(tzinfo=timezone.utc)
+        from_ = from_ if from_.tzinfo else from_.replace(tzinfo=timezone.utc)
+        if from_ >= to:
+            raise HTTPException(status_code=400, detail="'from' must be before 'to'")
+        
+        # The recorded_at range lets Postgres prune to the daily partitions it covers
+        query = """
+        SELECT recorded_at, lat, lng, battery_level
+        FROM band_locations
+        WHERE band_id = $1 AND recorded_at >= $2 AND recorded_at < $3
+        ORDER BY recorded_at ASC
+        LIMIT $4
+        """
+        results = await db.fetch(query, band_id, from_, to, limit)
+        return api_response(True, "Smart band trail retrieved successfully", data=results)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# =======================
+# EXPORT ROUTES
+# =======================
+
+@app.get("/export/emergencies")
+async def export_emergencies(
+    request: Request,
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    status: Optional[str] = None,
+    type: Optional[str] = None,
+    fmt: str = Query("ndjson", alias="format", regex="^(ndjson|csv)$")
+):
+    """Emergency reports created in [from, to), oldest first"""
+    where_clause, values = export_conditions("created_at", start, end, {"status": status, "type": type})
+    query = f"SELECT * FROM emergency_reports {where_clause} ORDER BY created_at"
+    return table_export.response(request, db_pool, query, values, fmt, "emergency_reports")
+
+@app.get("/export/band-locations")
+async def export_band_locations(
+    request: Request,
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    band_id: Optional[UUID] = None,
+    fmt: str = Query("ndjson", alias="format", regex="^(ndjson|csv)$")
+):
+    """
+    Smart band pings recorded in [from, to). Rows come in storage order (daily
+    partitions, roughly by time) rather than sorted, so nothing has to sort
+    millions of rows before the first one is sent; one band's trail is sorted.
+    """
+    where_clause, values = export_conditions("recorded_at", start, end, {"band_id": band_id})
+    order_clause = "ORDER BY recorded_at" if band_id is not None else ""
+    query = f"SELECT * FROM band_locations {where_clause} {order_clause}"
+    return table_export.response(request, db_pool, query, values, fmt, "band_locations")
+
+@app.get("/export/crowd-readings")
+async def export_crowd_readings(
+    request: Request,
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    location_id: Optional[UUID] = None,
+    fmt: str = Query("ndjson", alias="format", regex="^(ndjson|csv)$")
+):
+    """Raw crowd readings recorded in [from, to), in storage order like band pings"""
+    where_clause, values = export_conditions("recorded_at", start, end, {"location_id": location_id})
+    query = f"SELECT * FROM crowd_readings {where_clause}"
+    return table_export.response(request, db_pool, query, values, fmt, "crowd_readings")
+
+@app.get("/export/stats", response_model=APIResponse)
+async def get_export_stats():
+    return APIResponse(success=True, message="Export stats retrieved successfully", data=table_export.stats())
+
+# =======================
+# BULK WRITE ROUTES
+# =======================
+
+# resource -> (table, model whose fields are the copied columns, response cache namespaces to clear)
+BULK_RESOURCES = {
+    "users": ("users", UserCreate, []),
+    "facilities": ("facilities", FacilityCreate, ["facilities", "crowd"]),
+    "shuttles": ("shuttles", ShuttleCreate, []),
+    "parking": ("parking_slots", ParkingCreate, []),
+    "geofences": ("geofences", GeofenceCreate, []),
+    "routes": ("routes", RouteCreate, ["routes"]),
+    "smartbands": ("smart_bands", SmartBandCreate, []),
+    "missing": ("missing_persons", MissingPersonCreate, []),
+}
+
+@app.post("/{resource}/bulk", response_model=APIResponse)
+async def bulk_create(resource: str, request: Request, db=Depends(get_db)):
+    """
+    Insert many rows of one resource: a JSON array, or NDJSON (Content-Type
+    application/x-ndjson) streamed straight into COPY as it is uploaded. Rows are
+    validated with the resource's create model; one invalid row or constraint
+    violation rolls back the whole load.
+    """
+    if resource not in BULK_RESOURCES:
+        raise HTTPException(status_code=404, detail=f"No bulk endpoint for '{resource}'")
+    table, model, namespaces = BULK_RESOURCES[resource]
+    columns = model_columns(model)
+    rows = BulkRows(request, model, columns, BULK_MAX_ROWS)
+    started = time.perf_counter()
+    try:
+        async with db.transaction():
+            if table in SPATIAL_TABLES:
+                # One RELOAD notification for the load instead of one per row (see notify_spatial_change)
+                await db.execute("SET LOCAL app.bulk_load = 'on'")
+            await db.copy_records_to_table(table, records=rows, columns=columns)
+            if table in SPATIAL_TABLES:
+                # Tagged with this worker, which reloads the table itself below
+                await db.execute("SELECT pg_notify($1, $2)", SPATIAL_CHANNEL,
+                                 json.dumps({"table": table, "op": "RELOAD", "instance": INSTANCE_ID}))
+        elapsed = time.perf_counter() - started
+
+        # The post-insert hooks of the single-row endpoints, run once for the whole load.
+        # Live feed events and table_versions bumps come from triggers, which COPY fires too
+        if table in SPATIAL_TABLES and SPATIAL_TABLES[table][0].ready:
+            # COPY returns no rows to index_row(); reload so the new rows are served straight away
+            await load_spatial_index(db, table)
+        if table in ("users", "smart_bands") and dispatcher.ready:
+            # New responders (and their bands) are dispatchable now, not at the next periodic refresh
+            await dispatcher.refresh(db)
+        if namespaces:
+            await response_cache.invalidate(*namespaces)
+        return APIResponse(success=True, message=f"Bulk {resource} load completed", data={
+            "rows": rows.count,
+            "elapsed_ms": round(elapsed * 1000, 2),
+            "rows_per_second": round(rows.count / elapsed) if elapsed > 0 else None,
+        })
+    except BulkRowError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except asyncpg.IntegrityConstraintViolationError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 # =======================
 # ADDITIONAL UTILITY ROUTES
 # =======================
 
+async def compute_dashboard_stats():
+    stats_query = """
+    SELECT 
+        (SELECT COUNT(*) FROM users WHERE role = 'pilgrim') as total_pilgrims,
+        (SELECT COUNT(*) FROM users WHERE role IN ('volunteer', 'police', 'fire', 'doctor')) as total_responders,
+        (SELECT COUNT(*) FROM emergency_reports WHERE status = 'open') as open_emergencies,
+        (SELECT COUNT(*) FROM missing_persons WHERE status = 'open') as open_missing_cases,
+        (SELECT COUNT(*) FROM shuttles WHERE status = 'active') as active_shuttles,
+        (SELECT SUM(available_capacity) FROM parking_slots) as total_parking_available,
+        (SELECT COUNT(*) FROM crowd_density WHERE density_level IN ('high', 'critical')) as high_crowd_areas,
+        (SELECT COUNT(*) FROM smart_bands WHERE status = 'active') as active_bands
+    """
+
+    result = await db_pool.fetchrow(stats_query)
+    return dict(result)
+
+dashboard_stats = Snapshot(compute_dashboard_stats, interval=DASHBOARD_STATS_INTERVAL)
+
+# =======================
+# LIVE UPDATES
+# =======================
+
+@app.get("/live")
+async def live_updates(
+    request: Request,
+    topic: List[str] = Query(["crowd", "shuttles", "emergencies"]),
+    type: Optional[List[str]] = Query(None),
+    min_lat: Optional[float] = None,
+    max_lat: Optional[float] = None,
+    min_lng: Optional[float] = None,
+    max_lng: Optional[float] = None
+):
+    """
+    Server-Sent Events stream of changed crowd_density rows, shuttle positions and
+    new or updated emergency reports, optionally limited to a bounding box and to
+    facility / emergency types. A `resync` event means the client fell behind and
+    should refetch the list endpoints.
+    """
+    unknown = set(topic) - set(LIVE_FILTER_FIELDS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown live topics: {', '.join(sorted(unknown))}")
+    if not live_feed.available:
+        raise HTTPException(status_code=503, detail="Live updates are unavailable; poll the list endpoints instead")
+    
+    region = (min_lat, max_lat, min_lng, max_lng)
+    types = set(type) if type else None
+    
+    def wanted(topic_name: str, data: Dict[str, Any]) -> bool:
+        row = data["row"]
+        lat_field, lng_field, type_field = LIVE_FILTER_FIELDS[topic_name]
+        if types is not None and type_field is not None and row.get(type_field) not in types:
+            return False
+        if any(bound is not None for bound in region):
+            lat, lng = row.get(lat_field), row.get(lng_field)
+            if lat is None or lng is None:
+                return False
+            if ((min_lat is not None and lat < min_lat) or (max_lat is not None and lat > max_lat)
+                    or (min_lng is not None and lng < min_lng) or (max_lng is not None and lng > max_lng)):
+                return False
+        return True
+    
+    subscriber = live_feed.subscribe(set(topic), wanted)
+    return StreamingResponse(
+        live_feed.stream(subscriber, request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/live/stats", response_model=APIResponse)
+async def get_live_stats():
+    return APIResponse(success=True, message="Live feed stats retrieved successfully", data=live_feed.stats())
+
 @app.get("/dashboard/stats", response_model=APIResponse)
-async def get_dashboard_stats(db=Depends(get_db)):
+async def get_dashboard_stats():
     try:
-        stats_query = """
-        SELECT 
-            (SELECT COUNT(*) FROM users WHERE role = 'pilgrim') as total_pilgrims,
-            (SELECT COUNT(*) FROM users WHERE role IN ('volunteer', 'police', 'fire', 'doctor')) as total_responders,
-            (SELECT COUNT(*) FROM emergency_reports WHERE status = 'open') as open_emergencies,
-            (SELECT COUNT(*) FROM missing_persons WHERE status = 'open') as open_missing_cases,
-            (SELECT COUNT(*) FROM shuttles WHERE status = 'active') as active_shuttles,
-            (SELECT SUM(available_capacity) FROM parking_slots) as total_parking_available,
-            (SELECT COUNT(*) FROM crowd_density WHERE density_level IN ('high', 'critical')) as high_crowd_areas,
-            (SELECT COUNT(*) FROM smart_bands WHERE status = 'active') as active_bands
-        """
-        
-        result = await db.fetchrow(stats_query)
-        return APIResponse(success=True, message="Dashboard stats retrieved successfully", data=dict(result))
+        stats = await dashboard_stats.get()
+        age = dashboard_stats.age()
+        data = {
+            **stats,
+            "as_of": dashboard_stats.taken_at,
+            "age_seconds": round(age, 3),
+            "stale": age > dashboard_stats.max_age,
+        }
+        return APIResponse(success=True, message="Dashboard stats retrieved successfully", data=data)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/cache/stats", response_model=APIResponse)
+async def get_cache_stats():
+    return APIResponse(success=True, message="Response cache stats retrieved successfully",
+                       data=response_cache.stats())
+
 @app.get("/health", response_model=APIResponse)
 async def health_check():
     return APIResponse(success=True, message="API is healthy", data={"status": "ok", "timestamp": datetime.now(timezone.utc)})
@@ -0,0 +1,96 @@
+"""
+Benchmark for list response serialization.
+
+Compares the original path (dict(row) -> APIResponse -> FastAPI response_model
+validation -> jsonable_encoder -> JSONResponse) with fast_json.api_response on
+rows shaped like GET /smartbands, checks both produce the same JSON, and prints
+timings.
+
+    python bench_json.py
+"""
+
+import asyncio
+import json
+import random
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Any, Optional
+from uuid import uuid4
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from pydantic import BaseModel
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "shared"))
+from fast_json import api_response
+
+
+class APIResponse(BaseModel):
+    """Same envelope as app.APIResponse (app.py needs a database to import)"""
+    success: bool
+    message: str
+    data: Optional[Any] = None
+
+
+def smart_band_rows(count):
+    now = datetime.now(timezone.utc)
+    return [
+        {
+            "band_id": uuid4(),
+            "assigned_user": uuid4(),
+            "status": random.choice(["active", "inactive", "lost"]),
+            "battery_level": random.randint(0, 100),
+            "last_lat": Decimal(f"{random.uniform(23.1, 23.2):.8f}"),
+            "last_lng": Decimal(f"{random.uniform(75.7, 75.8):.8f}"),
+            "created_at": now - timedelta(days=random.randint(0, 30)),
+            "updated_at": now - timedelta(seconds=random.randint(0, 3600)),
+            "user_name": f"Pilgrim {i}",
+            "user_phone": f"98{random.randint(10000000, 99999999)}",
+        }
+        for i in range(count)
+    ]
+
+
+async def pydantic_path(rows):
+    field = create_response_field(name="bench", type_=APIResponse)
+    content = await serialize_response(
+        field=field,
+        response_content=APIResponse(success=True, message="Smart bands retrieved successfully",
+                                     data=[dict(row) for row in rows]),
+    )
+    return JSONResponse(content).body
+
+
+def fast_path(rows):
+    return api_response(True, "Smart bands retrieved successfully", data=rows).body
+
+
+def time_call(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main():
+    random.seed(2028)
+    loop = asyncio.new_event_loop()
+    for count in (100, 1000, 10000):
+        rows = smart_band_rows(count)
+        old_time, old_body = time_call(lambda: loop.run_until_complete(pydantic_path(rows)), 5)
+        new_time, new_body = time_call(lambda: fast_path(rows), 5)
+
+        identical = json.loads(old_body) == json.loads(new_body)
+        print(f"{count} rows: pydantic {old_time * 1000:.1f} ms, orjson {new_time * 1000:.1f} ms, "
+              f"speedup {old_time / new_time:.0f}x, identical={identical}")
+    loop.close()
+
+
+if __name__ == "__main__":
+    main()
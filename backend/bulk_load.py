@@ -0,0 +1,95 @@
+# Bulk write bodies (JSON array or NDJSON) validated row by row and fed straight into COPY
+
+import json
+from typing import Any, AsyncIterator, List, Tuple, Type
+
+import orjson
+from fastapi import Request
+from pydantic import BaseModel, ValidationError
+
+NDJSON_TYPES = ("application/x-ndjson", "application/jsonl", "application/json-seq")
+
+# req.txt pins pydantic 2, whose model API replaced parse_obj / .dict() / __fields__;
+# pydantic 1 installs keep working through the old names
+PYDANTIC_V2 = hasattr(BaseModel, "model_validate")
+
+
+def model_columns(model: Type[BaseModel]) -> List[str]:
+    """Field names of `model`, in declaration order"""
+    return list(model.model_fields if PYDANTIC_V2 else model.__fields__)
+
+
+def validate_item(model: Type[BaseModel], item: Any) -> dict:
+    if PYDANTIC_V2:
+        return model.model_validate(item).model_dump()
+    return model.parse_obj(item).dict()
+
+
+class BulkRowError(Exception):
+    """A row that cannot be written; aborts the whole bulk load"""
+
+    def __init__(self, row: int, detail: str, status_code: int = 422):
+        super().__init__(f"Row {row}: {detail}" if row else detail)
+        self.row = row
+        self.status_code = status_code
+
+
+class BulkRows:
+    """
+    Async iterable of row tuples for Connection.copy_records_to_table.
+
+    NDJSON bodies are parsed as they arrive, so rows are validated and sent to
+    Postgres while the client is still uploading; a JSON array is parsed once
+    the body is complete. Each item is validated with `model` and laid out in
+    `columns` order. Rows are numbered from 1 in errors; `count` is how many
+    rows have been produced so far.
+    """
+
+    def __init__(self, request: Request, model: Type[BaseModel], columns: List[str], max_rows: int):
+        self.request = request
+        self.model = model
+        self.columns = columns
+        self.max_rows = max_rows
+        self.count = 0
+
+    def _row(self, item: Any) -> Tuple:
+        self.count += 1
+        if self.count > self.max_rows:
+            raise BulkRowError(0, f"At most {self.max_rows} rows per request", status_code=413)
+        try:
+            values = validate_item(self.model, item)
+        except ValidationError as e:
+            raise BulkRowError(self.count, "; ".join(
+                f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in e.errors()))
+        # JSON columns (e.g. route_points) take text in binary COPY
+        return tuple(json.dumps(values[column]) if isinstance(values[column], (list, dict)) else values[column]
+                     for column in self.columns)
+
+    def _parse(self, line: bytes) -> Any:
+        try:
+            return orjson.loads(line)
+        except orjson.JSONDecodeError:
+            raise BulkRowError(self.count + 1, "invalid JSON")
+
+    async def __aiter__(self) -> AsyncIterator[Tuple]:
+        content_type = self.request.headers.get("content-type", "").split(";")[0].strip()
+        if content_type in NDJSON_TYPES:
+            pending = b""
+            async for chunk in self.request.stream():
+                pending += chunk
+                *lines, pending = pending.split(b"\n")
+                for line in lines:
+                    if line.strip():
+                        yield self._row(self._parse(line))
+            if pending.strip():
+                yield self._row(self._parse(pending))
+            return
+
+        try:
+            items = orjson.loads(await self.request.body())
+        except orjson.JSONDecodeError:
+            raise BulkRowError(0, "Body must be a JSON array or NDJSON")
+        if not isinstance(items, list):
+            raise BulkRowError(0, "Body must be a JSON array or NDJSON")
+        for item in items:
+            yield self._row(item)
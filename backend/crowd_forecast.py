@@ -0,0 +1,355 @@
+# Short-horizon crowd forecasts per location, fitted in the background and served from memory
+
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from crowd_history import BUCKET_ORIGIN
+from spatial_index import SpatialGrid
+
+logger = logging.getLogger(__name__)
+
+# Minutes ahead that forecasts are made for
+FORECAST_HORIZONS = (15, 30, 60)
+
+LEVEL_ORDER = ("low", "medium", "high", "critical")
+
+# Forecast levels at or above this, and above the current level, raise a warning
+WARNING_LEVEL = "high"
+
+# Camera 0-100 scores per level, as the camera API grades them (critical at 80, alert at 70)
+CAMERA_LEVELS = (("critical", 80.0), ("high", 70.0), ("medium", 40.0))
+
+# Smoothing parameters tried for every series; the pair with the lowest one-step error wins
+ALPHAS = (0.2, 0.4, 0.6, 0.8)
+BETAS = (0.05, 0.15, 0.3)
+
+# Time-of-day profile slots, in seconds
+SEASON_SLOT_SECONDS = 900
+
+# Fewer observations than this and the forecast is the current reading
+MIN_SAMPLES = 4
+
+# Recent people counts per location, in buckets of $2 seconds from the minute rollups
+RECENT_SQL = f"""
+SELECT location_id,
+       date_bin(make_interval(secs => $2::int), bucket_start, {BUCKET_ORIGIN}) AS bucket_start,
+       SUM(sum_people)::float8 / SUM(samples) AS avg_people
+FROM crowd_rollups
+WHERE bucket_seconds = 60 AND bucket_start >= $1
+GROUP BY 1, 2
+HAVING SUM(samples) > 0
+ORDER BY 1, 2
+"""
+
+# Average people count per location and time of day on earlier days, from the 15 minute rollups
+SEASON_SQL = f"""
+SELECT location_id,
+       (EXTRACT(EPOCH FROM bucket_start)::bigint % 86400) / {SEASON_SLOT_SECONDS} AS slot,
+       SUM(sum_people)::float8 / SUM(samples) AS avg_people,
+       COUNT(DISTINCT date_trunc('day', bucket_start)) AS days
+FROM crowd_rollups
+WHERE bucket_seconds = 900 AND samples > 0 AND bucket_start >= $1 AND bucket_start < $2
+GROUP BY 1, 2
+"""
+
+# People count at which each location usually sits at a level: a low percentile of the
+# 15 minute buckets spent (almost) entirely at that level
+THRESHOLDS_SQL = """
+SELECT location_id,
+       percentile_cont(0.1) WITHIN GROUP (ORDER BY sum_people::float8 / samples)
+           FILTER (WHERE seconds_medium >= $2) AS medium,
+       percentile_cont(0.1) WITHIN GROUP (ORDER BY sum_people::float8 / samples)
+           FILTER (WHERE seconds_high >= $2) AS high,
+       percentile_cont(0.1) WITHIN GROUP (ORDER BY sum_people::float8 / samples)
+           FILTER (WHERE seconds_critical >= $2) AS critical
+FROM crowd_rollups
+WHERE bucket_seconds = 900 AND samples > 0 AND bucket_start >= $1
+GROUP BY location_id
+"""
+
+CURRENT_SQL = """
+SELECT cd.location_id, cd.people_count, cd.density_level, cd.updated_at,
+       f.name AS facility_name, f.type AS facility_type, f.lat, f.lng
+FROM crowd_density cd
+JOIN facilities f ON cd.location_id = f.facility_id
+"""
+
+
+class HoltFit:
+    """Damped-trend exponential smoothing state after the last observation"""
+
+    def __init__(self, level: float, trend: float, alpha: float, beta: float, rmse: float, phi: float):
+        self.level = level
+        self.trend = trend
+        self.alpha = alpha
+        self.beta = beta
+        self.rmse = rmse
+        self.phi = phi
+
+    def forecast(self, steps: float) -> float:
+        """Value `steps` (possibly fractional) observations past the last one"""
+        if steps <= 0:
+            return self.level
+        damped = self.phi * (1 - self.phi ** steps) / (1 - self.phi) if self.phi < 1 else steps
+        return self.level + self.trend * damped
+
+
+def fit_holt(values: List[float], phi: float = 0.9) -> HoltFit:
+    """Grid-search alpha and beta on one-step-ahead squared error; needs two or more values"""
+    best = None
+    for alpha in ALPHAS:
+        for beta in BETAS:
+            level, trend, sse = values[0], 0.0, 0.0
+            for value in values[1:]:
+                predicted = level + phi * trend
+                error = value - predicted
+                sse += error * error
+                new_level = predicted + alpha * error
+                trend = beta * (new_level - level) + (1 - beta) * phi * trend
+                level = new_level
+            if best is None or sse < best[0]:
+                best = (sse, alpha, beta, level, trend)
+    sse, alpha, beta, level, trend = best
+    return HoltFit(level, trend, alpha, beta, math.sqrt(sse / (len(values) - 1)), phi)
+
+
+def level_for(people: float, thresholds: Dict[str, Optional[float]]) -> Optional[str]:
+    """Density level a people count falls in, from the location's learned thresholds"""
+    if not any(value is not None for value in thresholds.values()):
+        return None
+    for level in ("critical", "high", "medium"):
+        threshold = thresholds.get(level)
+        if threshold is not None and people >= threshold:
+            return level
+    return "low"
+
+
+def camera_level(score: float) -> str:
+    for level, threshold in CAMERA_LEVELS:
+        if score >= threshold:
+            return level
+    return "low"
+
+
+def worse(a: Optional[str], b: Optional[str]) -> Optional[str]:
+    if a is None or b is None:
+        return a or b
+    return max(a, b, key=LEVEL_ORDER.index)
+
+
+def slot_of(moment: datetime) -> int:
+    return int(moment.timestamp()) % 86400 // SEASON_SLOT_SECONDS
+
+
+class CrowdForecaster:
+    """
+    Next 15/30/60 minute people counts and density levels for every location.
+
+    Each pass reads the last `history_hours` of minute rollups (averaged into
+    `step` second buckets), a time-of-day profile from the previous `season_days`
+    and per-location level thresholds, then fits a damped Holt model per location:
+    on the deviation from the time-of-day profile when the profile covers the
+    window (so recurring snan peaks are anticipated), on the raw counts otherwise.
+    Camera scores near a location are sampled every pass and forecast the same
+    way; the forecast level is the worse of the two. Fitting runs in a thread and
+    the results replace `forecasts` in one swap, so reads never wait on a fit.
+    """
+
+    def __init__(self, history_hours: float = 6.0, season_days: int = 7, step: int = 300,
+                 min_season_days: int = 2, camera_radius_km: float = 0.25):
+        self.history_hours = history_hours
+        self.season_days = season_days
+        self.step = step
+        self.min_season_days = min_season_days
+        self.camera_radius_km = camera_radius_km
+        self.forecasts: Dict[UUID, Dict[str, Any]] = {}
+        self.fitted_at: Optional[datetime] = None
+        # camera_id -> recent scores, one per pass
+        self.camera_scores: Dict[str, Deque[float]] = {}
+
+        self.passes = 0
+        self.failed_passes = 0
+        self.last_fit_ms = 0.0
+
+    @property
+    def ready(self) -> bool:
+        return self.fitted_at is not None
+
+    async def refresh(self, pool, cameras: List[Tuple[str, float, float, float]], interval: float):
+        """One pass; `cameras` are (camera_id, lat, lng, score) readings taken now"""
+        started = time.perf_counter()
+        now = datetime.now(timezone.utc)
+        window_start = now - timedelta(hours=self.history_hours)
+        async with pool.acquire() as conn:
+            current = await conn.fetch(CURRENT_SQL)
+            recent = await conn.fetch(RECENT_SQL, window_start, self.step)
+            season = await conn.fetch(SEASON_SQL, now - timedelta(days=self.season_days), window_start)
+            thresholds = await conn.fetch(THRESHOLDS_SQL, now - timedelta(days=self.season_days),
+                                          0.8 * SEASON_SLOT_SECONDS)
+
+        max_samples = max(MIN_SAMPLES, int(self.history_hours * 3600 / interval))
+        seen = set()
+        for camera_id, _, _, score in cameras:
+            seen.add(camera_id)
+            history = self.camera_scores.get(camera_id)
+            if history is None or history.maxlen != max_samples:
+                history = self.camera_scores[camera_id] = deque(history or (), maxlen=max_samples)
+            history.append(float(score))
+        for camera_id in list(self.camera_scores):
+            if camera_id not in seen:
+                del self.camera_scores[camera_id]
+
+        self.forecasts = await asyncio.to_thread(
+            self._fit, now, current, recent, season, thresholds, cameras, interval)
+        self.fitted_at = now
+        self.passes += 1
+        self.last_fit_ms = (time.perf_counter() - started) * 1000
+
+    def _fit(self, now: datetime, current, recent, season, thresholds, cameras, interval: float):
+        series: Dict[UUID, List[Tuple[datetime, float]]] = {}
+        for row in recent:
+            series.setdefault(row["location_id"], []).append((row["bucket_start"], row["avg_people"]))
+        profiles: Dict[UUID, Dict[int, float]] = {}
+        for row in season:
+            if row["days"] >= self.min_season_days:
+                profiles.setdefault(row["location_id"], {})[row["slot"]] = row["avg_people"]
+        levels = {row["location_id"]: {level: row[level] for level in ("medium", "high", "critical")}
+                  for row in thresholds}
+
+        # Cameras count towards the nearest location within camera_radius_km
+        camera_fits: Dict[UUID, List[Tuple[float, Optional[HoltFit]]]] = {}
+        if cameras:
+            locations = SpatialGrid()
+            locations.load([(row["location_id"], float(row["lat"]), float(row["lng"]),
+                             {"location_id": row["location_id"]})
+                            for row in current if row["lat"] is not None and row["lng"] is not None])
+            for camera_id, lat, lng, score in cameras:
+                nearest = locations.nearest(lat, lng, 1, max_radius_km=self.camera_radius_km)
+                if not nearest:
+                    continue
+                history = list(self.camera_scores.get(camera_id, ()))
+                fit = fit_holt(history) if len(history) >= MIN_SAMPLES else None
+                camera_fits.setdefault(nearest[0][1]["location_id"], []).append((float(score), fit))
+
+        forecasts = {}
+        for row in current:
+            location_id = row["location_id"]
+            forecasts[location_id] = self._forecast_location(
+                now, row, series.get(location_id, []), profiles.get(location_id),
+                levels.get(location_id, {}), camera_fits.get(location_id, []), interval)
+        return forecasts
+
+    def _forecast_location(self, now: datetime, row, points: List[Tuple[datetime, float]],
+                           profile: Optional[Dict[int, float]], thresholds: Dict[str, Optional[float]],
+                           cameras: List[Tuple[float, Optional[HoltFit]]], interval: float) -> Dict[str, Any]:
+        targets = [(minutes, now + timedelta(minutes=minutes)) for minutes in FORECAST_HORIZONS]
+        # Bucket averages are placed at the middle of their bucket
+        half_step = timedelta(seconds=self.step / 2)
+
+        model: Dict[str, Any] = {"samples": len(points)}
+        if len(points) >= MIN_SAMPLES:
+            slots = {slot_of(moment + half_step) for moment, _ in points}
+            slots.update(slot_of(moment) for _, moment in targets)
+            seasonal = profile is not None and slots.issubset(profile)
+            baseline = (lambda moment: profile[slot_of(moment)]) if seasonal else (lambda moment: 0.0)
+            fit = fit_holt([value - baseline(moment + half_step) for moment, value in points])
+            last = points[-1][0] + half_step
+            people = [
+                max(0.0, baseline(moment) + fit.forecast((moment - last).total_seconds() / self.step))
+                for _, moment in targets
+            ]
+            model.update(method="seasonal_holt" if seasonal else "holt", alpha=fit.alpha, beta=fit.beta,
+                         rmse=round(fit.rmse, 2))
+        else:
+            people = [float(row["people_count"])] * len(targets)
+            model["method"] = "persistence"
+
+        camera_score = max((score for score, _ in cameras), default=None)
+        forecast, warning = [], None
+        current_rank = LEVEL_ORDER.index(row["density_level"]) if row["density_level"] in LEVEL_ORDER else 0
+        for (minutes, moment), count in zip(targets, people):
+            steps = minutes * 60 / interval
+            predicted_score = max(
+                (min(100.0, max(0.0, fit.forecast(steps))) if fit is not None else score
+                 for score, fit in cameras),
+                default=None)
+            level = level_for(count, thresholds)
+            if predicted_score is not None:
+                level = worse(level, camera_level(predicted_score))
+            level = level or row["density_level"]
+            forecast.append({
+                "minutes": minutes,
+                "at": moment,
+                "people_count": round(count),
+                "camera_score": round(predicted_score, 1) if predicted_score is not None else None,
+                "density_level": level,
+            })
+            rank = LEVEL_ORDER.index(level) if level in LEVEL_ORDER else 0
+            if warning is None and rank >= LEVEL_ORDER.index(WARNING_LEVEL) and rank > current_rank:
+                warning = {"density_level": level, "minutes": minutes, "at": moment}
+
+        return {
+            "location_id": row["location_id"],
+            "facility_name": row["facility_name"],
+            "facility_type": row["facility_type"],
+            "lat": row["lat"],
+            "lng": row["lng"],
+            "people_count": row["people_count"],
+            "density_level": row["density_level"],
+            "updated_at": row["updated_at"],
+            "camera_score": camera_score,
+            "forecast": forecast,
+            "warning": warning,
+            "model": model,
+        }
+
+    async def run(self, pool, interval: float, cameras: Callable[[], Awaitable[List[Tuple[str, float, float, float]]]]):
+        """Background loop refitting every `interval` seconds"""
+        while True:
+            try:
+                await self.refresh(pool, await cameras(), interval)
+            except Exception:
+                self.failed_passes += 1
+                logger.exception("Crowd forecast pass failed")
+            await asyncio.sleep(interval)
+
+    def get(self, location_id: Optional[UUID] = None, min_level: Optional[str] = None,
+            warnings_only: bool = False) -> List[Dict[str, Any]]:
+        """Cached forecasts, optionally only one location, a worst forecast level or warnings"""
+        if location_id is not None:
+            entry = self.forecasts.get(location_id)
+            entries = [entry] if entry is not None else []
+        else:
+            entries = list(self.forecasts.values())
+        if min_level is not None:
+            floor = LEVEL_ORDER.index(min_level)
+            entries = [
+                entry for entry in entries
+                if max(LEVEL_ORDER.index(point["density_level"]) if point["density_level"] in LEVEL_ORDER else 0
+                       for point in entry["forecast"]) >= floor
+            ]
+        if warnings_only:
+            entries = [entry for entry in entries if entry["warning"] is not None]
+        return entries
+
+    def stats(self) -> dict:
+        methods: Dict[str, int] = {}
+        for entry in self.forecasts.values():
+            methods[entry["model"]["method"]] = methods.get(entry["model"]["method"], 0) + 1
+        return {
+            "ready": self.ready,
+            "fitted_at": self.fitted_at,
+            "locations": len(self.forecasts),
+            "warnings": sum(1 for entry in self.forecasts.values() if entry["warning"] is not None),
+            "methods": methods,
+            "cameras": len(self.camera_scores),
+            "passes": self.passes,
+            "failed_passes": self.failed_passes,
+            "last_fit_ms": round(self.last_fit_ms, 2),
+        }
@@ -0,0 +1,253 @@
+# Crowd density history: append-only readings rolled up into 1 min / 15 min / 1 h buckets
+
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+from uuid import UUID
+
+logger = logging.getLogger(__name__)
+
+# Rollup resolutions in seconds; each level is built from the one before it
+RESOLUTIONS = (60, 900, 3600)
+
+# pg_try_advisory_lock key held while a worker rolls up
+ROLLUP_LOCK_KEY = 2028021
+
+# Bucket boundaries are aligned to the Unix epoch, like floor_time()
+BUCKET_ORIGIN = "TIMESTAMPTZ '1970-01-01 00:00:00+00'"
+
+ROLLUP_COLUMNS = """location_id, bucket_seconds, bucket_start, samples, min_people, max_people, sum_people,
+    seconds_low, seconds_medium, seconds_high, seconds_critical"""
+
+ROLLUP_CONFLICT = """ON CONFLICT (location_id, bucket_seconds, bucket_start) DO UPDATE SET
+    samples = EXCLUDED.samples,
+    min_people = EXCLUDED.min_people,
+    max_people = EXCLUDED.max_people,
+    sum_people = EXCLUDED.sum_people,
+    seconds_low = EXCLUDED.seconds_low,
+    seconds_medium = EXCLUDED.seconds_medium,
+    seconds_high = EXCLUDED.seconds_high,
+    seconds_critical = EXCLUDED.seconds_critical"""
+
+# Minute buckets straight from crowd_readings. A reading's level holds until the
+# next reading for the location (at most $3 seconds), and that span is split over
+# the buckets it covers to give time-in-level; the people count is a sample in
+# the bucket the reading falls in. The last reading before the window carries its
+# level into the window's first buckets.
+MINUTE_ROLLUP_SQL = f"""
+WITH readings AS (
+    SELECT location_id, recorded_at, people_count, density_level, TRUE AS is_sample
+    FROM crowd_readings
+    WHERE recorded_at >= $1 AND recorded_at < $2
+    UNION ALL
+    (SELECT DISTINCT ON (location_id) location_id, recorded_at, people_count, density_level, FALSE
+     FROM crowd_readings
+     WHERE recorded_at >= $1 - make_interval(secs => $3) AND recorded_at < $1
+     ORDER BY location_id, recorded_at DESC)
+), segments AS (
+    SELECT location_id, recorded_at, people_count, density_level, is_sample,
+           GREATEST(recorded_at, $1) AS seg_start,
+           LEAST(LEAD(recorded_at, 1, $2) OVER (PARTITION BY location_id ORDER BY recorded_at),
+                 recorded_at + make_interval(secs => $3), $2) AS seg_end
+    FROM readings
+), pieces AS (
+    SELECT s.location_id, s.people_count, s.density_level, b.bucket,
+           s.is_sample AND b.bucket = date_bin('1 minute', s.recorded_at, {BUCKET_ORIGIN}) AS is_bucket_sample,
+           EXTRACT(EPOCH FROM LEAST(s.seg_end, b.bucket + INTERVAL '1 minute')
+                              - GREATEST(s.seg_start, b.bucket)) AS seconds
+    FROM segments s
+    CROSS JOIN LATERAL generate_series(
+        date_bin('1 minute', s.seg_start, {BUCKET_ORIGIN}),
+        GREATEST(s.seg_start, s.seg_end - INTERVAL '1 microsecond'),
+        INTERVAL '1 minute'
+    ) AS b(bucket)
+)
+INSERT INTO crowd_rollups ({ROLLUP_COLUMNS})
+SELECT location_id, 60, bucket,
+       COUNT(*) FILTER (WHERE is_bucket_sample),
+       MIN(people_count) FILTER (WHERE is_bucket_sample),
+       MAX(people_count) FILTER (WHERE is_bucket_sample),
+       COALESCE(SUM(people_count) FILTER (WHERE is_bucket_sample), 0),
+       COALESCE(SUM(seconds) FILTER (WHERE density_level = 'low'), 0),
+       COALESCE(SUM(seconds) FILTER (WHERE density_level = 'medium'), 0),
+       COALESCE(SUM(seconds) FILTER (WHERE density_level = 'high'), 0),
+       COALESCE(SUM(seconds) FILTER (WHERE density_level = 'critical'), 0)
+FROM pieces
+GROUP BY location_id, bucket
+{ROLLUP_CONFLICT}
+"""
+
+# Coarser buckets ($3 seconds) merged from the finer rollup ($4 seconds)
+MERGE_ROLLUP_SQL = f"""
+INSERT INTO crowd_rollups ({ROLLUP_COLUMNS})
+SELECT location_id, $3::int, date_bin(make_interval(secs => $3::int), bucket_start, {BUCKET_ORIGIN}) AS bucket,
+       SUM(samples), MIN(min_people), MAX(max_people), SUM(sum_people),
+       SUM(seconds_low), SUM(seconds_medium), SUM(seconds_high), SUM(seconds_critical)
+FROM crowd_rollups
+WHERE bucket_seconds = $4 AND bucket_start >= $1 AND bucket_start < $2
+GROUP BY location_id, bucket
+{ROLLUP_CONFLICT}
+"""
+
+HISTORY_SQL = f"""
+SELECT date_bin(make_interval(secs => $4::int), bucket_start, {BUCKET_ORIGIN}) AS bucket_start,
+       SUM(samples) AS samples,
+       MIN(min_people) AS min_people,
+       MAX(max_people) AS max_people,
+       SUM(sum_people)::float8 / NULLIF(SUM(samples), 0) AS avg_people,
+       SUM(seconds_low) AS seconds_low,
+       SUM(seconds_medium) AS seconds_medium,
+       SUM(seconds_high) AS seconds_high,
+       SUM(seconds_critical) AS seconds_critical
+FROM crowd_rollups
+WHERE location_id = $1 AND bucket_seconds = $5 AND bucket_start >= $2 AND bucket_start < $3
+GROUP BY 1
+ORDER BY 1
+"""
+
+
+def floor_time(value: datetime, seconds: int) -> datetime:
+    timestamp = int(value.timestamp())
+    return datetime.fromtimestamp(timestamp - timestamp % seconds, timezone.utc)
+
+
+def resolution_for(step: int) -> Optional[int]:
+    """Coarsest rollup whose buckets divide `step` evenly"""
+    fitting = [resolution for resolution in RESOLUTIONS if step % resolution == 0]
+    return fitting[-1] if fitting else None
+
+
+class CrowdRollups:
+    """
+    Keeps crowd_rollups up to date from crowd_readings.
+
+    Each resolution has a watermark in crowd_rollup_state: everything before it is
+    rolled up. A pass only processes whole buckets between the watermark and the
+    newest complete bucket (`lag` seconds behind now for minute buckets, so readings
+    still being committed are not missed), then advances the watermark in the same
+    transaction. Upserts make re-running a window harmless.
+    """
+
+    def __init__(self, lag: float = 30.0, carry_seconds: float = 900.0, max_window: float = 6 * 3600):
+        self.lag = lag
+        self.carry_seconds = carry_seconds
+        self.max_window = max_window
+        self.watermarks = {}
+
+        self.passes = 0
+        self.failed_passes = 0
+        self.buckets_written = 0
+        self.last_pass_ms = 0.0
+        # Readings that landed in crowd_readings_default (no daily partition yet)
+        self.default_partition_rows = None
+        self.rows_moved_from_default = 0
+
+    async def _watermark(self, conn, resolution: int, source: Optional[int]) -> Optional[datetime]:
+        watermark = await conn.fetchval(
+            "SELECT rolled_up_to FROM crowd_rollup_state WHERE bucket_seconds = $1", resolution)
+        if watermark is not None:
+            return watermark
+        # First run: start from the oldest data there is
+        if source is None:
+            oldest = await conn.fetchval("SELECT MIN(recorded_at) FROM crowd_readings")
+        else:
+            oldest = await conn.fetchval(
+                "SELECT MIN(bucket_start) FROM crowd_rollups WHERE bucket_seconds = $1", source)
+        return floor_time(oldest, resolution) if oldest is not None else None
+
+    async def roll_up(self, pool) -> int:
+        started = time.perf_counter()
+        async with pool.acquire() as conn:
+            # Every worker runs this loop; one rolls up at a time and the rest skip the pass
+            if not await conn.fetchval("SELECT pg_try_advisory_lock($1)", ROLLUP_LOCK_KEY):
+                return 0
+            try:
+                written = await self._roll_up(conn)
+            finally:
+                await conn.execute("SELECT pg_advisory_unlock($1)", ROLLUP_LOCK_KEY)
+
+        self.passes += 1
+        self.buckets_written += written
+        self.last_pass_ms = (time.perf_counter() - started) * 1000
+        return written
+
+    async def _roll_up(self, conn) -> int:
+        written = 0
+        source_limit = floor_time(datetime.now(timezone.utc) - timedelta(seconds=self.lag), RESOLUTIONS[0])
+        for index, resolution in enumerate(RESOLUTIONS):
+            source = RESOLUTIONS[index - 1] if index else None
+            limit = floor_time(source_limit, resolution)
+            start = await self._watermark(conn, resolution, source)
+            while start is not None and start < limit:
+                end = min(limit, start + timedelta(seconds=self.max_window))
+                async with conn.transaction():
+                    if source is None:
+                        status = await conn.execute(MINUTE_ROLLUP_SQL, start, end, self.carry_seconds)
+                    else:
+                        status = await conn.execute(MERGE_ROLLUP_SQL, start, end, resolution, source)
+                    await conn.execute("""
+                    INSERT INTO crowd_rollup_state (bucket_seconds, rolled_up_to) VALUES ($1, $2)
+                    ON CONFLICT (bucket_seconds) DO UPDATE SET rolled_up_to = EXCLUDED.rolled_up_to
+                    """, resolution, end)
+                written += int(status.split()[-1])
+                start = end
+            if start is not None:
+                self.watermarks[resolution] = start
+            # Coarser rollups only see what the finer one has finished
+            source_limit = self.watermarks.get(resolution, source_limit)
+        return written
+
+    async def run(self, pool, interval: float, readings_retain_days: int, minute_retain_days: int):
+        """Background loop: roll up every `interval` seconds, keep partitions and expire old minute buckets"""
+        last_maintenance = None
+        while True:
+            now = datetime.now(timezone.utc)
+            if last_maintenance is None or now - last_maintenance >= timedelta(hours=1):
+                try:
+                    async with pool.acquire() as conn:
+                        moved = await conn.fetchval("SELECT create_daily_partitions('crowd_readings', 2)")
+                        await conn.fetchval("SELECT drop_daily_partitions('crowd_readings', $1)",
+                                            readings_retain_days)
+                        self.rows_moved_from_default += moved
+                        self.default_partition_rows = await conn.fetchval(
+                            "SELECT COUNT(*) FROM crowd_readings_default")
+                        if self.default_partition_rows:
+                            logger.warning(f"{self.default_partition_rows} crowd readings are in the default partition")
+                        await conn.execute(
+                            "DELETE FROM crowd_rollups WHERE bucket_seconds = 60 AND bucket_start < $1",
+                            now - timedelta(days=minute_retain_days))
+                    last_maintenance = now
+                except Exception:
+                    logger.exception("Crowd history maintenance failed")
+
+            try:
+                await self.roll_up(pool)
+            except Exception:
+                self.failed_passes += 1
+                logger.exception("Crowd rollup pass failed")
+            await asyncio.sleep(interval)
+
+    async def history(self, conn, location_id: UUID, start: datetime, end: datetime,
+                      step: int) -> Tuple[int, Optional[datetime], List]:
+        """
+        Buckets of `step` seconds read from the coarsest rollup that fits.
+        Returns (resolution, rolled_up_to, rows); buckets after rolled_up_to are not in yet.
+        """
+        resolution = resolution_for(step)
+        rolled_up_to = await conn.fetchval(
+            "SELECT rolled_up_to FROM crowd_rollup_state WHERE bucket_seconds = $1", resolution)
+        rows = await conn.fetch(HISTORY_SQL, location_id, floor_time(start, step), end, step, resolution)
+        return resolution, rolled_up_to, rows
+
+    def stats(self) -> dict:
+        return {
+            "rolled_up_to": {str(resolution): watermark for resolution, watermark in self.watermarks.items()},
+            "passes": self.passes,
+            "failed_passes": self.failed_passes,
+            "buckets_written": self.buckets_written,
+            "last_pass_ms": round(self.last_pass_ms, 2),
+            "default_partition_rows": self.default_partition_rows,
+            "rows_moved_from_default": self.rows_moved_from_default,
+        }
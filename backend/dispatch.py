@@ -0,0 +1,216 @@
+# Emergency dispatch: match reports to the best nearby on-duty responder in memory
+
+import asyncio
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from uuid import UUID
+
+from spatial_index import SpatialGrid
+
+logger = logging.getLogger(__name__)
+
+RESPONDER_ROLES = ("volunteer", "police", "fire", "doctor")
+
+# Roles that can take each emergency type, most suitable first
+DISPATCH_ROLES = {
+    "medical": ("doctor", "volunteer"),
+    "fire": ("fire", "police", "volunteer"),
+    "police": ("police",),
+    "accident": ("doctor", "police", "volunteer"),
+    "lost_child": ("police", "volunteer"),
+    "other": ("volunteer", "police"),
+}
+
+PRIORITY_ORDER = {"critical": 0, "high": 1, "medium": 2, "low": 3}
+
+# Report statuses that count towards a responder's load
+OPEN_STATUSES = ("open", "in-progress")
+
+# Band position when the responder wears an active band, else their last app location
+RESPONDERS_QUERY = f"""
+SELECT u.user_id, u.name, u.role, u.phone_number,
+       COALESCE(sb.last_lat, u.location_lat) AS lat,
+       COALESCE(sb.last_lng, u.location_lng) AS lng,
+       sb.band_id,
+       (SELECT COUNT(*) FROM emergency_reports er
+        WHERE er.assigned_to = u.user_id AND er.status IN ('open', 'in-progress')) AS load
+FROM users u
+LEFT JOIN LATERAL (
+    SELECT band_id, last_lat, last_lng FROM smart_bands
+    WHERE assigned_user = u.user_id AND status = 'active' AND last_lat IS NOT NULL
+    ORDER BY updated_at DESC
+    LIMIT 1
+) sb ON TRUE
+WHERE u.role IN ({", ".join(f"'{role}'" for role in RESPONDER_ROLES)}) AND u.on_duty
+"""
+
+
+class Dispatcher:
+    """
+    On-duty responders in a SpatialGrid, with their open assignment counts.
+
+    A candidate's score is the distance to the incident in km, stretched by
+    `load_weight` per open assignment and with `role_step_km` added for each step
+    down the emergency type's role list; the lowest score wins. Responders at
+    `max_load` are skipped. Assigning bumps the responder's load straight away, so
+    a burst of reports spreads over responders instead of piling onto the nearest.
+    """
+
+    def __init__(self, max_radius_km: float = 5.0, candidates: int = 20, max_load: int = 3,
+                 load_weight: float = 0.5, role_step_km: float = 0.5):
+        self.max_radius_km = max_radius_km
+        self.candidates = candidates
+        self.max_load = max_load
+        self.load_weight = load_weight
+        self.role_step_km = role_step_km
+        self.index = SpatialGrid()
+        # band_id -> user_id, so telemetry pings can move responders between refreshes
+        self.bands: Dict[UUID, UUID] = {}
+        self.band_users: Set[UUID] = set()
+        self.loads: Dict[UUID, int] = {}
+        # Bumped by every in-memory assignment change; see refresh()
+        self.changes = 0
+
+        self.dispatched = 0
+        self.unmatched = 0
+        self.refreshes = 0
+
+    @property
+    def ready(self) -> bool:
+        return self.index.ready
+
+    def load(self, rows: Iterable[Dict[str, Any]], keep_loads: bool = False):
+        items, bands, loads = [], {}, {}
+        for row in rows:
+            if row["lat"] is None or row["lng"] is None:
+                continue
+            record = {
+                "user_id": row["user_id"],
+                "name": row["name"],
+                "role": row["role"],
+                "phone_number": row["phone_number"],
+            }
+            items.append((row["user_id"], float(row["lat"]), float(row["lng"]), record))
+            if row["band_id"] is not None:
+                bands[row["band_id"]] = row["user_id"]
+            loads[row["user_id"]] = int(row["load"])
+        if keep_loads:
+            loads = {user_id: self.loads.get(user_id, load) for user_id, load in loads.items()}
+        self.index.load(items)
+        self.bands = bands
+        self.band_users = set(bands.values())
+        self.loads = loads
+
+    async def refresh(self, pool):
+        """Reload responders, positions and loads from the database"""
+        changes = self.changes
+        rows = await pool.fetch(RESPONDERS_QUERY)
+        # Assignments made while the query ran may be missing from its counts
+        self.load(rows, keep_loads=self.changes != changes)
+        self.refreshes += 1
+
+    async def run(self, pool, interval: float):
+        """Background loop picking up duty changes and positions written by other workers"""
+        while True:
+            try:
+                await self.refresh(pool)
+            except Exception:
+                logger.exception("Responder refresh failed")
+            await asyncio.sleep(interval)
+
+    def move_bands(self, positions: Iterable[Tuple[UUID, float, float]]):
+        """Apply (band_id, lat, lng) pings; bands not worn by a responder are ignored"""
+        for band_id, lat, lng in positions:
+            user_id = self.bands.get(band_id)
+            if user_id is None:
+                continue
+            record = self.index.get(user_id)
+            if record is not None:
+                self.index.upsert(user_id, lat, lng, record)
+
+    def update_user(self, row: Dict[str, Any]):
+        """Apply a changed users row (duty status, role or app location)"""
+        user_id = row["user_id"]
+        if row["role"] not in RESPONDER_ROLES or not row.get("on_duty", True):
+            self.index.remove(user_id)
+            return
+        record = {
+            "user_id": user_id,
+            "name": row["name"],
+            "role": row["role"],
+            "phone_number": row["phone_number"],
+        }
+        position = self.index.position(user_id)
+        if position is not None and user_id in self.band_users:
+            # A worn band is fresher than the app location; keep its position
+            lat, lng = position
+        elif row["location_lat"] is not None and row["location_lng"] is not None:
+            lat, lng = float(row["location_lat"]), float(row["location_lng"])
+        else:
+            self.index.remove(user_id)
+            return
+        self.index.upsert(user_id, lat, lng, record)
+        self.loads.setdefault(user_id, 0)
+
+    def rank(self, lat: float, lng: float, emergency_type: str) -> List[Tuple[float, float, Dict[str, Any]]]:
+        """(score, distance_km, responder) candidates for an incident, best first"""
+        roles = DISPATCH_ROLES.get(emergency_type, DISPATCH_ROLES["other"])
+        role_steps = {role: step for step, role in enumerate(roles)}
+
+        def available(record: Dict[str, Any]) -> bool:
+            return record["role"] in role_steps and self.loads.get(record["user_id"], 0) < self.max_load
+
+        ranked = []
+        for distance, record in self.index.nearest(lat, lng, self.candidates, available,
+                                                   max_radius_km=self.max_radius_km):
+            load = self.loads.get(record["user_id"], 0)
+            score = distance * (1 + self.load_weight * load) + self.role_step_km * role_steps[record["role"]]
+            ranked.append((score, distance, record))
+        ranked.sort(key=lambda candidate: candidate[0])
+        return ranked
+
+    def choose(self, lat: float, lng: float, emergency_type: str) -> Optional[Tuple[Dict[str, Any], float]]:
+        """Pick and reserve the best responder; returns (responder, distance_km) or None"""
+        ranked = self.rank(lat, lng, emergency_type)
+        if not ranked:
+            self.unmatched += 1
+            return None
+        _, distance, responder = ranked[0]
+        self.assigned(responder["user_id"])
+        self.dispatched += 1
+        return responder, distance
+
+    def choose_batch(self, reports: List[Dict[str, Any]]) -> List[Tuple[Dict[str, Any], Dict[str, Any], float]]:
+        """
+        Match many reports in one pass, most urgent and oldest first, so scarce
+        responders go to critical incidents. Returns (report, responder, distance_km).
+        """
+        ordered = sorted(reports, key=lambda report: (PRIORITY_ORDER.get(report["priority"], 2),
+                                                      report["created_at"]))
+        matches = []
+        for report in ordered:
+            match = self.choose(float(report["lat"]), float(report["lng"]), report["type"])
+            if match is not None:
+                matches.append((report, *match))
+        return matches
+
+    def assigned(self, user_id: Optional[UUID]):
+        if user_id is not None:
+            self.loads[user_id] = self.loads.get(user_id, 0) + 1
+            self.changes += 1
+
+    def released(self, user_id: Optional[UUID]):
+        if user_id is not None and self.loads.get(user_id, 0) > 0:
+            self.loads[user_id] -= 1
+            self.changes += 1
+
+    def stats(self) -> dict:
+        return {
+            "ready": self.ready,
+            "responders": len(self.index),
+            "busy_responders": sum(1 for load in self.loads.values() if load >= self.max_load),
+            "open_assignments": sum(self.loads.values()),
+            "dispatched": self.dispatched,
+            "unmatched": self.unmatched,
+            "refreshes": self.refreshes,
+        }
@@ -0,0 +1,75 @@
+# Geo query helpers shared by the nearby-search endpoints in app.py
+
+import math
+from typing import List, Tuple
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def haversine_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Great-circle distance in kilometres between two points"""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bounding_box(lat: float, lng: float, radius_km: float) -> Tuple[float, float, float, float]:
+    """Smallest (min_lat, max_lat, min_lng, max_lng) box containing the radius circle"""
+    angular = radius_km / EARTH_RADIUS_KM
+    lat_delta = math.degrees(angular)
+    min_lat = max(-90.0, lat - lat_delta)
+    max_lat = min(90.0, lat + lat_delta)
+
+    # Circle touches a pole or is larger than a hemisphere: every meridian qualifies
+    if min_lat <= -90.0 or max_lat >= 90.0 or angular >= math.pi / 2:
+        return min_lat, max_lat, -180.0, 180.0
+
+    lng_delta = math.degrees(math.asin(min(1.0, math.sin(angular) / math.cos(math.radians(lat)))))
+    min_lng = lng - lng_delta
+    max_lng = lng + lng_delta
+
+    # Boxes crossing the antimeridian can't be expressed as one BETWEEN
+    if min_lng < -180.0 or max_lng > 180.0:
+        return min_lat, max_lat, -180.0, 180.0
+
+    return min_lat, max_lat, min_lng, max_lng
+
+
+def distance_sql(lat_col: str, lng_col: str, lat_param: str, lng_param: str) -> str:
+    """SQL expression for the Haversine distance (km) between a column pair and a point"""
+    # LEAST() guards acos() against rounding pushing the cosine just above 1
+    return f"""(6371 * acos(LEAST(1.0, cos(radians({lat_param})) * cos(radians({lat_col})) *
+            cos(radians({lng_col}) - radians({lng_param})) +
+            sin(radians({lat_param})) * sin(radians({lat_col})))))"""
+
+
+def nearby_filter(
+    lat_col: str,
+    lng_col: str,
+    lat: float,
+    lng: float,
+    radius_km: float,
+    param_count: int,
+) -> Tuple[List[str], list, str, int]:
+    """
+    Build the WHERE conditions for a radius search starting at placeholder $param_count.
+
+    The bounding-box range on (lat_col, lng_col) lets Postgres answer the search from
+    the composite B-tree location indexes; the exact Haversine check then only runs on
+    the rows inside the box.
+
+    Returns (conditions, values, distance_expr, next_param_count).
+    """
+    min_lat, max_lat, min_lng, max_lng = bounding_box(lat, lng, radius_km)
+    p = param_count
+    distance_expr = distance_sql(lat_col, lng_col, f"${p}::float8", f"${p + 1}::float8")
+    conditions = [
+        f"{lat_col} BETWEEN ${p + 3} AND ${p + 4}",
+        f"{lng_col} BETWEEN ${p + 5} AND ${p + 6}",
+        f"{distance_expr} <= ${p + 2}::float8",
+    ]
+    values = [lat, lng, radius_km, min_lat, max_lat, min_lng, max_lng]
+    return conditions, values, distance_expr, p + 7
@@ -0,0 +1,79 @@
+# Opaque keyset (cursor) pagination helpers for the list endpoints in app.py
+
+import base64
+import json
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class SortKey:
+    expr: str                      # SQL expression used in ORDER BY
+    field: str                     # Key holding the value in each returned row
+    descending: bool
+    parse: Callable[[Any], Any]    # Turns the JSON value back into a query parameter
+
+
+def parse_timestamp(value: str) -> datetime:
+    return datetime.fromisoformat(value)
+
+
+class Keyset:
+    """
+    A total ordering over a result set, ending in a unique column.
+
+    The cursor is the sort-key values of the last row on a page; the next page is
+    everything strictly after it, which an index on the same columns answers without
+    walking the skipped rows the way OFFSET does.
+    """
+
+    def __init__(self, *keys: SortKey):
+        self.keys = keys
+
+    def order_by(self) -> str:
+        return ", ".join(f"{key.expr} {'DESC' if key.descending else 'ASC'}" for key in self.keys)
+
+    def encode(self, row: Dict[str, Any]) -> str:
+        raw = json.dumps([row[key.field] for key in self.keys], default=str, separators=(",", ":"))
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+    def decode(self, cursor: str) -> List[Any]:
+        try:
+            raw = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+            if not isinstance(raw, list) or len(raw) != len(self.keys):
+                raise ValueError("cursor has the wrong shape")
+            return [key.parse(value) for key, value in zip(self.keys, raw)]
+        except (ValueError, TypeError) as e:
+            raise InvalidCursor("Invalid pagination cursor") from e
+
+    def condition(self, cursor: str, param_count: int) -> Tuple[str, List[Any], int]:
+        """WHERE condition selecting rows after `cursor`; returns (sql, values, next_param_count)"""
+        values = self.decode(cursor)
+        terms = [
+            (key.expr, "<" if key.descending else ">", f"${param_count + i}")
+            for i, key in enumerate(self.keys)
+        ]
+
+        if len({key.descending for key in self.keys}) == 1:
+            # Uniform direction: a row comparison maps straight onto a composite index
+            exprs = ", ".join(expr for expr, _, _ in terms)
+            params = ", ".join(param for _, _, param in terms)
+            sql = f"({exprs}) {terms[0][1]} ({params})"
+        else:
+            expr, op, param = terms[-1]
+            sql = f"{expr} {op} {param}"
+            for expr, op, param in reversed(terms[:-1]):
+                sql = f"({expr} {op} {param} OR ({expr} = {param} AND {sql}))"
+
+        return sql, values, param_count + len(values)
+
+    def next_cursor(self, rows: List[Dict[str, Any]], limit: int) -> Optional[str]:
+        """Cursor for the page after `rows`, or None when this was the last page"""
+        if not rows or len(rows) < limit:
+            return None
+        return self.encode(rows[-1])
@@ -0,0 +1,161 @@
+# Read-through cache for GET responses, invalidated per resource by the write handlers
+
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from fastapi.encoders import jsonable_encoder
+
+
+class LRUBackend:
+    """
+    In-process LRU with per-entry TTL, bounded by the total size of the cached values.
+
+    Generations are per process: with more than one worker, ResponseCache.broadcast
+    has to carry invalidations to the others (or use RedisBackend).
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.entries: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+        self.generations: Dict[str, int] = {}
+        self.bytes_used = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    async def get(self, key: str) -> Optional[bytes]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            self._drop(key)
+            self.expirations += 1
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        size = len(key) + len(value)
+        if size > self.max_bytes:
+            return
+        if key in self.entries:
+            self._drop(key)
+        while self.entries and self.bytes_used + size > self.max_bytes:
+            self._drop(next(iter(self.entries)))
+            self.evictions += 1
+        self.entries[key] = (time.monotonic() + ttl, value)
+        self.bytes_used += size
+
+    def _drop(self, key: str):
+        _, value = self.entries.pop(key)
+        self.bytes_used -= len(key) + len(value)
+
+    async def generation(self, namespace: str) -> int:
+        return self.generations.get(namespace, 0)
+
+    async def bump(self, namespace: str):
+        self.generations[namespace] = self.generations.get(namespace, 0) + 1
+
+    def stats(self) -> dict:
+        return {
+            "backend": "lru",
+            "entries": len(self.entries),
+            "bytes_used": self.bytes_used,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class RedisBackend:
+    """
+    Redis (or any Redis-protocol server) shared by every worker process, so an
+    invalidation in one worker is seen by all. Memory is bounded by the server's
+    maxmemory / eviction policy.
+    """
+
+    def __init__(self, url: str, prefix: str = "response_cache:"):
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError("RESPONSE_CACHE_URL points at Redis but the redis package is not installed") from e
+        self.client = redis.from_url(url)
+        self.prefix = prefix
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self.client.get(self.prefix + key)
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        await self.client.set(self.prefix + key, value, px=int(ttl * 1000))
+
+    async def generation(self, namespace: str) -> int:
+        return int(await self.client.get(f"{self.prefix}gen:{namespace}") or 0)
+
+    async def bump(self, namespace: str):
+        await self.client.incr(f"{self.prefix}gen:{namespace}")
+
+    def stats(self) -> dict:
+        return {"backend": "redis"}
+
+
+class ResponseCache:
+    """
+    Caches the JSON-ready `data` of GET responses under a resource namespace.
+
+    Keys embed the namespace's generation number, so invalidating a resource is a
+    single counter bump: entries from older generations are never read again and
+    age out of the backend on their own. The generation is read before computing,
+    so a response computed across a concurrent write is stored under the old one.
+
+    `broadcast`, when set, is awaited with the namespaces of every local
+    invalidation so other processes can bump them too.
+    """
+
+    def __init__(self, backend, ttl: float = 30.0):
+        self.backend = backend
+        self.ttl = ttl
+        self.broadcast: Optional[Callable[[Tuple[str, ...]], Awaitable[None]]] = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _params_key(params: Dict[str, Any]) -> str:
+        # Normalized: order-independent, unset params dropped, values as strings
+        return json.dumps({k: str(v) for k, v in params.items() if v is not None},
+                          sort_keys=True, separators=(",", ":"))
+
+    async def get_or_compute(self, namespace: str, params: Dict[str, Any],
+                             compute: Callable[[], Awaitable[Any]], ttl: Optional[float] = None) -> Any:
+        generation = await self.backend.generation(namespace)
+        key = f"{namespace}:{generation}:{self._params_key(params)}"
+
+        cached = await self.backend.get(key)
+        if cached is not None:
+            self.hits += 1
+            return json.loads(cached)
+
+        self.misses += 1
+        value = jsonable_encoder(await compute())
+        await self.backend.set(key, json.dumps(value, separators=(",", ":")).encode(), ttl or self.ttl)
+        return value
+
+    async def invalidate(self, *namespaces: str, broadcast: bool = True):
+        for namespace in namespaces:
+            await self.backend.bump(namespace)
+            self.invalidations += 1
+        if broadcast and self.broadcast is not None:
+            await self.broadcast(namespaces)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            **self.backend.stats(),
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "invalidations": self.invalidations,
+        }
@@ -0,0 +1,368 @@
+# Walkable graph of the Mela area and crowd-aware shortest paths over it
+
+import heapq
+import json
+import math
+import struct
+import sys
+import xml.etree.ElementTree as ET
+from array import array
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from geo import haversine_km
+from spatial_index import SpatialGrid
+
+GRAPH_MAGIC = b"SMWG"
+GRAPH_FORMAT_VERSION = 1
+# magic, format version, node count, adjacency entry count
+GRAPH_HEADER = struct.Struct("<4sIII")
+
+# OSM highway values a pedestrian may use
+WALKABLE_HIGHWAYS = {
+    "footway", "pedestrian", "path", "steps", "living_street", "residential", "service",
+    "unclassified", "tertiary", "tertiary_link", "secondary", "secondary_link", "primary",
+    "primary_link", "track", "corridor", "crossing", "bridleway", "road",
+}
+
+# Extra cost multiplier for walking through a location at each density level
+DENSITY_PENALTY = {"low": 0.0, "medium": 0.5, "high": 2.0, "critical": 6.0}
+
+WALKING_SPEED_KMH = 4.5
+
+Point = Tuple[float, float]
+# (nodes, length_m, cost) as returned by WalkGraph.shortest_path
+PathResult = Tuple[List[int], float, float]
+
+
+def _little_endian(values: array) -> array:
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+class WalkGraph:
+    """
+    Undirected walking graph in compressed sparse row form.
+
+    The neighbours of node i are targets[offsets[i]:offsets[i + 1]], with the edge
+    lengths in metres at the same positions in `lengths`. Flat typed arrays keep the
+    graph compact and let `load` read a prebuilt file with a handful of bulk reads.
+    """
+
+    def __init__(self, lats: array, lngs: array, offsets: array, targets: array, lengths: array):
+        self.lats = lats
+        self.lngs = lngs
+        self.offsets = offsets
+        self.targets = targets
+        self.lengths = lengths
+        # Snaps request coordinates to the nearest node
+        self.grid = SpatialGrid(cell_size_deg=0.002)
+        self.grid.load([(node, lats[node], lngs[node], {"node": node}) for node in range(len(lats))])
+
+    def __len__(self) -> int:
+        return len(self.lats)
+
+    @property
+    def edge_count(self) -> int:
+        return len(self.targets) // 2
+
+    @classmethod
+    def from_polylines(cls, polylines: Iterable[Sequence[Point]]) -> "WalkGraph":
+        """Build from (lat, lng) polylines; polylines sharing a vertex are joined there"""
+        node_ids: Dict[Point, int] = {}
+        lats, lngs = array("d"), array("d")
+        adjacency: List[Dict[int, float]] = []
+
+        def node_for(point: Point) -> int:
+            # ~1 cm: vertices shared between ways are the same point in the source data
+            key = (round(point[0], 7), round(point[1], 7))
+            node = node_ids.get(key)
+            if node is None:
+                node = node_ids[key] = len(lats)
+                lats.append(key[0])
+                lngs.append(key[1])
+                adjacency.append({})
+            return node
+
+        for polyline in polylines:
+            previous = None
+            for point in polyline:
+                node = node_for(point)
+                if previous is not None and previous != node:
+                    length = haversine_km(lats[previous], lngs[previous], lats[node], lngs[node]) * 1000
+                    # Parallel ways between the same vertices: keep the shorter one
+                    if length < adjacency[previous].get(node, float("inf")):
+                        adjacency[previous][node] = length
+                        adjacency[node][previous] = length
+                previous = node
+
+        offsets, targets, lengths = array("I", [0]), array("I"), array("f")
+        for neighbours in adjacency:
+            for target, length in sorted(neighbours.items()):
+                targets.append(target)
+                lengths.append(length)
+            offsets.append(len(targets))
+        return cls(lats, lngs, offsets, targets, lengths)
+
+    @classmethod
+    def from_geojson(cls, path: str) -> "WalkGraph":
+        """LineString / MultiLineString features; GeoJSON positions are [lng, lat]"""
+        with open(path) as f:
+            collection = json.load(f)
+
+        def polylines():
+            for feature in collection.get("features", []):
+                geometry = feature.get("geometry") or {}
+                if geometry.get("type") == "LineString":
+                    lines = [geometry["coordinates"]]
+                elif geometry.get("type") == "MultiLineString":
+                    lines = geometry["coordinates"]
+                else:
+                    continue
+                for line in lines:
+                    yield [(position[1], position[0]) for position in line]
+
+        return cls.from_polylines(polylines())
+
+    @classmethod
+    def from_osm(cls, path: str) -> "WalkGraph":
+        """Walkable ways from an OSM XML extract (.osm), e.g. exported with osmium or Overpass"""
+        nodes: Dict[str, Point] = {}
+        ways: List[List[str]] = []
+        for _, element in ET.iterparse(path):
+            if element.tag == "node":
+                nodes[element.get("id")] = (float(element.get("lat")), float(element.get("lon")))
+            elif element.tag == "way":
+                tags = {tag.get("k"): tag.get("v") for tag in element.iter("tag")}
+                if (tags.get("highway") in WALKABLE_HIGHWAYS and tags.get("foot") != "no"
+                        and tags.get("access") not in ("private", "no")):
+                    ways.append([ref.get("ref") for ref in element.iter("nd")])
+                element.clear()
+            elif element.tag == "relation":
+                element.clear()
+
+        return cls.from_polylines(
+            [nodes[ref] for ref in refs if ref in nodes] for refs in ways
+        )
+
+    def save(self, path: str):
+        with open(path, "wb") as f:
+            f.write(GRAPH_HEADER.pack(GRAPH_MAGIC, GRAPH_FORMAT_VERSION, len(self.lats), len(self.targets)))
+            for values in (self.lats, self.lngs, self.offsets, self.targets, self.lengths):
+                f.write(_little_endian(array(values.typecode, values)).tobytes())
+
+    @classmethod
+    def load(cls, path: str) -> "WalkGraph":
+        """Load a graph file written by `save`, or build one from a .geojson/.osm source"""
+        if path.endswith((".geojson", ".json")):
+            return cls.from_geojson(path)
+        if path.endswith(".osm"):
+            return cls.from_osm(path)
+
+        with open(path, "rb") as f:
+            magic, version, node_count, entry_count = GRAPH_HEADER.unpack(f.read(GRAPH_HEADER.size))
+            if magic != GRAPH_MAGIC or version != GRAPH_FORMAT_VERSION:
+                raise ValueError(f"{path} is not a version {GRAPH_FORMAT_VERSION} walk graph file")
+
+            def read(typecode: str, count: int) -> array:
+                values = array(typecode)
+                values.frombytes(f.read(values.itemsize * count))
+                if len(values) != count:
+                    raise ValueError(f"{path} is truncated")
+                return _little_endian(values)
+
+            lats = read("d", node_count)
+            lngs = read("d", node_count)
+            offsets = read("I", node_count + 1)
+            targets = read("I", entry_count)
+            lengths = read("f", entry_count)
+        return cls(lats, lngs, offsets, targets, lengths)
+
+    def snap(self, lat: float, lng: float, max_km: float) -> Optional[Tuple[int, float]]:
+        """(node, distance_km) of the node nearest to the point, if one is within max_km"""
+        nearest = self.grid.nearest(lat, lng, 1, max_radius_km=max_km)
+        if not nearest:
+            return None
+        distance, record = nearest[0]
+        return record["node"], distance
+
+    def shortest_path(self, source: int, target: int,
+                      penalties: Optional[array] = None) -> Optional[PathResult]:
+        """
+        A* from source to target; returns (nodes, length_m, cost) or None if unreachable.
+
+        An edge costs its length times 1 + the mean penalty of its two ends. Penalties
+        are never negative, so the straight-line distance stays an admissible heuristic.
+        """
+        lats, lngs = self.lats, self.lngs
+        offsets, targets, lengths = self.offsets, self.targets, self.lengths
+        target_lat, target_lng = lats[target], lngs[target]
+
+        def heuristic(node: int) -> float:
+            return haversine_km(lats[node], lngs[node], target_lat, target_lng) * 1000
+
+        best = {source: 0.0}
+        previous = {source: -1}
+        frontier = [(heuristic(source), 0.0, source)]
+        while frontier:
+            _, cost, node = heapq.heappop(frontier)
+            if node == target:
+                break
+            if cost > best[node]:
+                continue
+            node_penalty = penalties[node] if penalties is not None else 0.0
+            for position in range(offsets[node], offsets[node + 1]):
+                neighbour = targets[position]
+                step = lengths[position]
+                if penalties is not None:
+                    step *= 1.0 + (node_penalty + penalties[neighbour]) / 2
+                candidate = cost + step
+                if candidate < best.get(neighbour, float("inf")):
+                    best[neighbour] = candidate
+                    previous[neighbour] = node
+                    heapq.heappush(frontier, (candidate + heuristic(neighbour), candidate, neighbour))
+        if target not in best:
+            return None
+
+        path = [target]
+        while previous[path[-1]] != -1:
+            path.append(previous[path[-1]])
+        path.reverse()
+
+        length = 0.0
+        for a, b in zip(path, path[1:]):
+            for position in range(offsets[a], offsets[a + 1]):
+                if targets[position] == b:
+                    length += lengths[position]
+                    break
+        return path, length, best[target]
+
+    def crowd_penalties(self, hotspots: Iterable[Tuple[float, float, float]], radius_km: float) -> array:
+        """
+        Per-node penalty from (lat, lng, penalty) crowd readings.
+
+        A reading applies in full at its location and fades linearly to nothing at
+        radius_km; a node near several readings takes the largest.
+        """
+        penalties = array("f", bytes(4 * len(self.lats)))
+        for lat, lng, penalty in hotspots:
+            if penalty <= 0:
+                continue
+            for distance, record in self.grid.within(lat, lng, radius_km):
+                node = record["node"]
+                penalties[node] = max(penalties[node], penalty * (1 - distance / radius_km))
+        return penalties
+
+
+class RouteCache:
+    """
+    Computed paths keyed on (source node, target node, mode), kept while the crowd
+    around them is unchanged.
+
+    `advance` is given every rebuilt penalty array. The epoch moves on when some node's
+    penalty has drifted by at least `threshold` since the last time it counted, and
+    each coarse cell remembers the epoch of its last such change. A cached path stays
+    valid until a cell in its bounding box, widened by one cell, changes after the
+    epoch the path was computed at; congestion elsewhere in the Mela leaves it alone.
+    """
+
+    def __init__(self, graph: WalkGraph, cell_size_deg: float = 0.005, threshold: float = 0.25,
+                 max_entries: int = 20_000):
+        self.graph = graph
+        self.cell_size_deg = cell_size_deg
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.epoch = 0
+        # Penalty each node had when it last counted as a change
+        self.baseline: Optional[array] = None
+        self.cell_epochs: Dict[Tuple[int, int], int] = {}
+        self.entries: "OrderedDict[tuple, Tuple[int, List[Tuple[int, int]], PathResult]]" = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+
+    def _cell(self, lat: float, lng: float) -> Tuple[int, int]:
+        return (math.floor(lat / self.cell_size_deg), math.floor(lng / self.cell_size_deg))
+
+    def advance(self, penalties: array) -> int:
+        """Record a rebuilt penalty array; returns the epoch it belongs to"""
+        if self.baseline is None:
+            self.baseline = array("f", penalties)
+            self.epoch += 1
+            return self.epoch
+
+        lats, lngs, baseline = self.graph.lats, self.graph.lngs, self.baseline
+        changed = set()
+        for node, penalty in enumerate(penalties):
+            if abs(penalty - baseline[node]) >= self.threshold:
+                baseline[node] = penalty
+                changed.add(self._cell(lats[node], lngs[node]))
+        if changed:
+            self.epoch += 1
+            for cell in changed:
+                self.cell_epochs[cell] = self.epoch
+        return self.epoch
+
+    def get(self, source: int, target: int, mode: str) -> Optional[PathResult]:
+        entry = self.entries.get((source, target, mode))
+        if entry is None:
+            self.misses += 1
+            return None
+        epoch, cells, result = entry
+        if any(self.cell_epochs.get(cell, 0) > epoch for cell in cells):
+            del self.entries[(source, target, mode)]
+            self.stale += 1
+            self.misses += 1
+            return None
+        self.entries.move_to_end((source, target, mode))
+        self.hits += 1
+        return result
+
+    def put(self, source: int, target: int, mode: str, epoch: int, result: PathResult):
+        """Cache a path computed with the penalties of `epoch` (read before computing)"""
+        nodes = result[0]
+        lats = [self.graph.lats[node] for node in nodes]
+        lngs = [self.graph.lngs[node] for node in nodes]
+        min_x, min_y = self._cell(min(lats), min(lngs))
+        max_x, max_y = self._cell(max(lats), max(lngs))
+        cells = [(x, y) for x in range(min_x - 1, max_x + 2) for y in range(min_y - 1, max_y + 2)]
+
+        self.entries[(source, target, mode)] = (epoch, cells, result)
+        self.entries.move_to_end((source, target, mode))
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "epoch": self.epoch,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+def camera_penalty(score: float) -> float:
+    """Penalty for a camera's 0-100 crowd score, on the same scale as DENSITY_PENALTY"""
+    return DENSITY_PENALTY["critical"] * max(0.0, min(float(score), 100.0)) / 100
+
+
+if __name__ == "__main__":
+    # Precompute the graph file workers load at startup:
+    #   python routing.py mela.osm mela_walk.graph
+    import time
+
+    if len(sys.argv) != 3:
+        sys.exit("usage: python routing.py <source.osm|source.geojson> <output.graph>")
+    started = time.perf_counter()
+    graph = WalkGraph.load(sys.argv[1])
+    graph.save(sys.argv[2])
+    print(f"Built {len(graph)} nodes / {graph.edge_count} edges in {time.perf_counter() - started:.1f} s")
+    started = time.perf_counter()
+    WalkGraph.load(sys.argv[2])
+    print(f"Reloaded {sys.argv[2]} in {(time.perf_counter() - started) * 1000:.0f} ms")
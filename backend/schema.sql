@@ -14,6 +14,7 @@ CREATE TABLE users (
     location_lat DECIMAL(10, 8),
     location_lng DECIMAL(11, 8),
     device_id VARCHAR(255),
+    on_duty BOOLEAN NOT NULL DEFAULT TRUE, -- responders available for dispatch
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
@@ -60,12 +61,46 @@ CREATE TABLE parking_slots (
 -- 5. Crowd density table
 CREATE TABLE crowd_density (
     density_id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
-    location_id UUID REFERENCES facilities(facility_id) ON DELETE CASCADE,
+    location_id UUID UNIQUE REFERENCES facilities(facility_id) ON DELETE CASCADE, -- current reading per location
     people_count INTEGER NOT NULL DEFAULT 0,
     density_level VARCHAR(10) NOT NULL CHECK (density_level IN ('low', 'medium', 'high', 'critical')),
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
+-- 5b. Crowd reading history (append-only, one partition per UTC day), filled by a trigger on crowd_density
+CREATE TABLE crowd_readings (
+    recorded_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    location_id UUID NOT NULL,
+    people_count INTEGER NOT NULL,
+    density_level VARCHAR(10) NOT NULL
+) PARTITION BY RANGE (recorded_at);
+
+-- Catches readings if the daily partitions were not created in time, so crowd writes never fail
+CREATE TABLE crowd_readings_default PARTITION OF crowd_readings DEFAULT;
+
+-- 5c. Crowd history rolled up into 60 / 900 / 3600 second buckets by crowd_history.py
+CREATE TABLE crowd_rollups (
+    location_id UUID NOT NULL,
+    bucket_seconds INTEGER NOT NULL,
+    bucket_start TIMESTAMP WITH TIME ZONE NOT NULL,
+    samples INTEGER NOT NULL,
+    min_people INTEGER,
+    max_people INTEGER,
+    sum_people BIGINT NOT NULL,
+    -- Seconds of the bucket spent at each density level
+    seconds_low REAL NOT NULL,
+    seconds_medium REAL NOT NULL,
+    seconds_high REAL NOT NULL,
+    seconds_critical REAL NOT NULL,
+    PRIMARY KEY (location_id, bucket_seconds, bucket_start)
+);
+
+-- Everything before rolled_up_to has been rolled up at that resolution
+CREATE TABLE crowd_rollup_state (
+    bucket_seconds INTEGER PRIMARY KEY,
+    rolled_up_to TIMESTAMP WITH TIME ZONE NOT NULL
+);
+
 -- 6. Emergency reports table
 CREATE TABLE emergency_reports (
     report_id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
@@ -127,6 +162,16 @@ CREATE TABLE smart_bands (
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
+-- 9b. Smart band location history (append-only, one partition per UTC day)
+-- Compact fixed-width rows: binary UUID, REAL coordinates (~1 m), SMALLINT battery
+CREATE TABLE band_locations (
+    recorded_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    band_id UUID NOT NULL,
+    lat REAL NOT NULL,
+    lng REAL NOT NULL,
+    battery_level SMALLINT
+) PARTITION BY RANGE (recorded_at);
+
 -- Additional useful tables for enhanced functionality
 
 -- 10. Notifications table
@@ -156,32 +201,52 @@ CREATE TABLE geofences (
 CREATE INDEX idx_users_phone ON users(phone_number);
 CREATE INDEX idx_users_role ON users(role);
 CREATE INDEX idx_users_location ON users(location_lat, location_lng);
+CREATE INDEX idx_users_created_keyset ON users(created_at DESC, user_id DESC);
 
 CREATE INDEX idx_facilities_type ON facilities(type);
 CREATE INDEX idx_facilities_location ON facilities(lat, lng);
+CREATE INDEX idx_facilities_created_keyset ON facilities(created_at DESC, facility_id DESC);
 
 CREATE INDEX idx_shuttles_location ON shuttles(current_lat, current_lng);
 CREATE INDEX idx_shuttles_status ON shuttles(status);
 
 CREATE INDEX idx_parking_location ON parking_slots(lat, lng);
 
-CREATE INDEX idx_crowd_location ON crowd_density(location_id);
+-- Also serves the latest-reading-per-location lookup for routing crowd weights
+CREATE INDEX idx_crowd_location ON crowd_density(location_id, updated_at DESC);
 CREATE INDEX idx_crowd_updated ON crowd_density(updated_at);
 
+CREATE INDEX idx_crowd_readings_time ON crowd_readings USING BRIN (recorded_at);
+CREATE INDEX idx_crowd_rollups_bucket ON crowd_rollups(bucket_seconds, bucket_start);
+
 CREATE INDEX idx_emergency_status ON emergency_reports(status);
 CREATE INDEX idx_emergency_type ON emergency_reports(type);
 CREATE INDEX idx_emergency_location ON emergency_reports(lat, lng);
 CREATE INDEX idx_emergency_created ON emergency_reports(created_at);
+-- Open assignments per responder (dispatch load)
+CREATE INDEX idx_emergency_assigned_open ON emergency_reports(assigned_to)
+    WHERE status IN ('open', 'in-progress');
+CREATE INDEX idx_emergency_priority_keyset ON emergency_reports(
+    (CASE priority WHEN 'critical' THEN 1 WHEN 'high' THEN 2 WHEN 'medium' THEN 3 ELSE 4 END),
+    created_at DESC, report_id DESC);
 
 CREATE INDEX idx_missing_status ON missing_persons(status);
 CREATE INDEX idx_missing_location ON missing_persons(last_seen_lat, last_seen_lng);
+CREATE INDEX idx_missing_created_keyset ON missing_persons(created_at DESC, missing_id DESC);
 
 CREATE INDEX idx_routes_points ON routes(start_point_lat, start_point_lng, end_point_lat, end_point_lng);
+CREATE INDEX idx_routes_end_points ON routes(end_point_lat, end_point_lng);
+CREATE INDEX idx_routes_score_keyset ON routes(
+    COALESCE(crowd_avoidance_score, 2147483647) DESC, COALESCE(distance, 'NaN'::numeric),
+    created_at DESC, route_id DESC);
 
 CREATE INDEX idx_bands_user ON smart_bands(assigned_user);
 CREATE INDEX idx_bands_status ON smart_bands(status);
 CREATE INDEX idx_bands_location ON smart_bands(last_lat, last_lng);
 
+CREATE INDEX idx_band_locations_time ON band_locations USING BRIN (recorded_at);
+CREATE INDEX idx_band_locations_band ON band_locations(band_id, recorded_at);
+
 -- Triggers for automatic updated_at
 CREATE OR REPLACE FUNCTION update_updated_at_column()
 RETURNS TRIGGER AS $$
@@ -195,4 +260,186 @@ CREATE TRIGGER update_users_updated_at BEFORE UPDATE ON users FOR EACH ROW EXECU
 CREATE TRIGGER update_shuttles_updated_at BEFORE UPDATE ON shuttles FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
 CREATE TRIGGER update_parking_updated_at BEFORE UPDATE ON parking_slots FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
 CREATE TRIGGER update_crowd_updated_at BEFORE UPDATE ON crowd_density FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
-CREATE TRIGGER update_bands_updated_at BEFORE UPDATE ON smart_bands FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
\ No newline at end of file
+CREATE TRIGGER update_bands_updated_at BEFORE UPDATE ON smart_bands FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
+
+-- Every crowd_density write is also appended to crowd_readings
+CREATE OR REPLACE FUNCTION record_crowd_reading()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO crowd_readings (recorded_at, location_id, people_count, density_level)
+    VALUES (COALESCE(NEW.updated_at, NOW()), NEW.location_id, NEW.people_count, NEW.density_level);
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+CREATE TRIGGER record_crowd_history AFTER INSERT OR UPDATE ON crowd_density FOR EACH ROW EXECUTE FUNCTION record_crowd_reading();
+
+-- Change notifications for the in-memory spatial indexes in app.py
+CREATE OR REPLACE FUNCTION notify_spatial_change()
+RETURNS TRIGGER AS $$
+DECLARE
+    changed JSONB;
+BEGIN
+    -- Bulk loads (POST /{resource}/bulk) send one RELOAD for the table instead of a notify per row
+    IF current_setting('app.bulk_load', true) = 'on' THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP = 'DELETE' THEN
+        changed := to_jsonb(OLD);
+    ELSE
+        changed := to_jsonb(NEW);
+    END IF;
+    PERFORM pg_notify('spatial_index_changes', json_build_object(
+        'table', TG_TABLE_NAME,
+        'op', TG_OP,
+        'id', changed ->> TG_ARGV[0]
+    )::text);
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+CREATE TRIGGER notify_facilities_spatial AFTER INSERT OR UPDATE OR DELETE ON facilities FOR EACH ROW EXECUTE FUNCTION notify_spatial_change('facility_id');
+CREATE TRIGGER notify_parking_spatial AFTER INSERT OR UPDATE OR DELETE ON parking_slots FOR EACH ROW EXECUTE FUNCTION notify_spatial_change('slot_id');
+
+-- Change notifications for the /live push feed in app.py (only ids, to stay under the NOTIFY size limit)
+CREATE OR REPLACE FUNCTION notify_live_change()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('live_changes', json_build_object(
+        'table', TG_TABLE_NAME,
+        'op', TG_OP,
+        'id', to_jsonb(NEW) ->> TG_ARGV[0]
+    )::text);
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+CREATE TRIGGER notify_crowd_live AFTER INSERT OR UPDATE ON crowd_density FOR EACH ROW EXECUTE FUNCTION notify_live_change('density_id');
+CREATE TRIGGER notify_shuttles_live AFTER INSERT OR UPDATE ON shuttles FOR EACH ROW EXECUTE FUNCTION notify_live_change('shuttle_id');
+CREATE TRIGGER notify_emergency_live AFTER INSERT OR UPDATE ON emergency_reports FOR EACH ROW EXECUTE FUNCTION notify_live_change('report_id');
+
+-- Change counters behind the list endpoint ETags in app.py (bumped once per writing statement).
+-- Each table's counter is split over 64 slots, one per backend (pid % 64), and read as their
+-- sum: concurrent writers bump different rows instead of queuing on one row lock until commit
+CREATE TABLE table_versions (
+    table_name VARCHAR(63) NOT NULL,
+    slot SMALLINT NOT NULL,
+    version BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (table_name, slot)
+);
+
+INSERT INTO table_versions (table_name, slot)
+SELECT table_name, slot
+FROM unnest(ARRAY['facilities', 'parking_slots', 'crowd_density']) AS table_name,
+     generate_series(0, 63) AS slot;
+
+CREATE OR REPLACE FUNCTION bump_table_version()
+RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE table_versions SET version = version + 1
+    WHERE table_name = TG_TABLE_NAME AND slot = pg_backend_pid() % 64;
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+CREATE TRIGGER bump_facilities_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON facilities FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+CREATE TRIGGER bump_parking_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON parking_slots FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+CREATE TRIGGER bump_crowd_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON crowd_density FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+
+-- Daily partitions (<parent>_YYYYMMDD) for the append-only history tables (range on recorded_at), maintained by app.py
+-- Returns how many rows were moved out of the parent's default partition into the new days
+CREATE OR REPLACE FUNCTION create_daily_partitions(parent TEXT, days_ahead INTEGER DEFAULT 2)
+RETURNS INTEGER AS $$
+DECLARE
+    default_part REGCLASS;
+    part_day DATE;
+    part_name TEXT;
+    day_start TIMESTAMP WITH TIME ZONE;
+    day_end TIMESTAMP WITH TIME ZONE;
+    moved_rows INTEGER;
+    moved INTEGER := 0;
+BEGIN
+    SELECT NULLIF(partdefid, 0)::regclass INTO default_part
+    FROM pg_partitioned_table WHERE partrelid = parent::regclass;
+
+    FOR offset_days IN -1..days_ahead LOOP
+        part_day := (NOW() AT TIME ZONE 'UTC')::date + offset_days;
+        part_name := parent || '_' || to_char(part_day, 'YYYYMMDD');
+        day_start := part_day::timestamp AT TIME ZONE 'UTC';
+        day_end := (part_day + 1)::timestamp AT TIME ZONE 'UTC';
+        CONTINUE WHEN to_regclass(quote_ident(part_name)) IS NOT NULL;
+
+        -- One block per day, so a day that cannot be created does not stop the others
+        BEGIN
+            IF default_part IS NULL THEN
+                EXECUTE format('CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                               part_name, parent, day_start, day_end);
+            ELSE
+                -- Rows for the day already in the default partition would make PARTITION OF fail:
+                -- build the day as a plain table, move them in, then attach it
+                EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS INCLUDING CONSTRAINTS)',
+                               part_name, parent);
+                EXECUTE format(
+                    'WITH moved AS (DELETE FROM %s WHERE recorded_at >= %L AND recorded_at < %L RETURNING *) '
+                    'INSERT INTO %I SELECT * FROM moved',
+                    default_part, day_start, day_end, part_name);
+                GET DIAGNOSTICS moved_rows = ROW_COUNT;
+                EXECUTE format('ALTER TABLE %I ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                               parent, part_name, day_start, day_end);
+                moved := moved + moved_rows;
+            END IF;
+        EXCEPTION WHEN OTHERS THEN
+            RAISE WARNING 'Could not create partition %: %', part_name, SQLERRM;
+        END;
+    END LOOP;
+    RETURN moved;
+END;
+$$ language 'plpgsql';
+
+-- Drops expired days, and deletes expired rows left in the default partition
+CREATE OR REPLACE FUNCTION drop_daily_partitions(parent TEXT, retain_days INTEGER DEFAULT 30)
+RETURNS INTEGER AS $$
+DECLARE
+    part RECORD;
+    default_part REGCLASS;
+    cutoff_day DATE := (NOW() AT TIME ZONE 'UTC')::date - retain_days;
+    cutoff TEXT := parent || '_' || to_char(cutoff_day, 'YYYYMMDD');
+    dropped INTEGER := 0;
+BEGIN
+    FOR part IN
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = parent::regclass AND c.relname ~ ('^' || parent || '_[0-9]{8}$')
+        AND c.relname < cutoff
+    LOOP
+        EXECUTE format('DROP TABLE %I', part.relname);
+        dropped := dropped + 1;
+    END LOOP;
+
+    SELECT NULLIF(partdefid, 0)::regclass INTO default_part
+    FROM pg_partitioned_table WHERE partrelid = parent::regclass;
+    IF default_part IS NOT NULL THEN
+        EXECUTE format('DELETE FROM %s WHERE recorded_at < %L',
+                       default_part, cutoff_day::timestamp AT TIME ZONE 'UTC');
+    END IF;
+    RETURN dropped;
+END;
+$$ language 'plpgsql';
+
+CREATE OR REPLACE FUNCTION create_band_location_partitions(days_ahead INTEGER DEFAULT 2)
+RETURNS void AS $$
+BEGIN
+    PERFORM create_daily_partitions('band_locations', days_ahead);
+END;
+$$ language 'plpgsql';
+
+CREATE OR REPLACE FUNCTION drop_band_location_partitions(retain_days INTEGER DEFAULT 30)
+RETURNS INTEGER AS $$
+BEGIN
+    RETURN drop_daily_partitions('band_locations', retain_days);
+END;
+$$ language 'plpgsql';
+
+SELECT create_band_location_partitions(2);
+SELECT create_daily_partitions('crowd_readings', 2);
@@ -0,0 +1,84 @@
+# Periodically refreshed snapshot of an expensive query, with single-flight refresh
+
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class Snapshot:
+    """
+    Holds the last result of `compute` and when it was taken.
+
+    `run()` refreshes it every `interval` seconds in the background, so readers
+    normally get the cached value straight away. A reader only waits when there is
+    no snapshot yet or it is older than `max_age` (e.g. the refresh loop is failing);
+    concurrent readers then share one in-flight recomputation.
+    """
+
+    def __init__(self, compute: Callable[[], Awaitable[Any]], interval: float = 5.0,
+                 max_age: Optional[float] = None):
+        self.compute = compute
+        self.interval = interval
+        self.max_age = max_age if max_age is not None else interval * 3
+        self.value: Any = None
+        self.taken_at: Optional[datetime] = None
+        self._taken_monotonic = 0.0
+        self._refreshing: Optional[asyncio.Future] = None
+
+        self.refreshes = 0
+        self.failed_refreshes = 0
+        self.last_refresh_ms = 0.0
+
+    def age(self) -> Optional[float]:
+        if self.taken_at is None:
+            return None
+        return time.monotonic() - self._taken_monotonic
+
+    async def refresh(self) -> Any:
+        """Recompute the snapshot, joining a recomputation already in flight"""
+        if self._refreshing is None:
+            self._refreshing = asyncio.ensure_future(self._compute())
+        # shield: one cancelled reader must not cancel the others' recomputation
+        return await asyncio.shield(self._refreshing)
+
+    async def _compute(self) -> Any:
+        started = time.perf_counter()
+        try:
+            value = await self.compute()
+        except Exception:
+            self.failed_refreshes += 1
+            raise
+        finally:
+            self._refreshing = None
+        self.value = value
+        self.taken_at = datetime.now(timezone.utc)
+        self._taken_monotonic = time.monotonic()
+        self.refreshes += 1
+        self.last_refresh_ms = (time.perf_counter() - started) * 1000
+        return value
+
+    async def get(self) -> Any:
+        age = self.age()
+        if age is not None and age <= self.max_age:
+            return self.value
+        try:
+            return await self.refresh()
+        except Exception:
+            if self.taken_at is None:
+                raise
+            # Better an old snapshot (its age is reported) than an error
+            logger.exception("Snapshot refresh failed; serving the previous one")
+            return self.value
+
+    async def run(self):
+        """Background loop keeping the snapshot at most `interval` seconds old"""
+        while True:
+            try:
+                await self.refresh()
+            except Exception:
+                logger.exception("Snapshot refresh failed")
+            await asyncio.sleep(self.interval)
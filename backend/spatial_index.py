@@ -0,0 +1,215 @@
+# In-memory uniform lat/lng grid for serving nearby searches without the database
+
+import bisect
+import heapq
+import math
+from typing import Any, Callable, Dict, Hashable, Iterator, List, Optional, Tuple
+
+from geo import bounding_box, haversine_km
+
+Predicate = Optional[Callable[[Dict[str, Any]], bool]]
+
+
+class SpatialGrid:
+    """
+    Points bucketed into square cells of `cell_size_deg` degrees.
+
+    Each entry keeps the full row dict so results can be returned as-is. The grid is
+    only touched from the event loop, so no locking is needed.
+
+    With `order_key`, entries are also kept sorted by order_key(record) (sorted once
+    on load, then kept in place on each change), so ordered() can page through them
+    from a keyset cursor without sorting per request.
+    """
+
+    def __init__(self, cell_size_deg: float = 0.01, order_key: Optional[Callable[[Dict[str, Any]], Any]] = None):
+        self.cell_size_deg = cell_size_deg
+        self.cells: Dict[Tuple[int, int], Dict[Hashable, Tuple[float, float, Dict[str, Any]]]] = {}
+        self.entries: Dict[Hashable, Tuple[int, int]] = {}
+        self.order_key = order_key
+        # Parallel lists: order keys ascending, and the entry key at each position
+        self._order: List[Any] = []
+        self._order_keys: List[Hashable] = []
+        # Bumped on every change
+        self.version = 0
+        self.ready = False
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def _cell(self, lat: float, lng: float) -> Tuple[int, int]:
+        return (math.floor(lat / self.cell_size_deg), math.floor(lng / self.cell_size_deg))
+
+    def load(self, items: List[Tuple[Hashable, float, float, Dict[str, Any]]]):
+        """Replace the whole grid with (key, lat, lng, record) items"""
+        self.cells = {}
+        self.entries = {}
+        for key, lat, lng, record in items:
+            cell = self._cell(lat, lng)
+            self.cells.setdefault(cell, {})[key] = (lat, lng, record)
+            self.entries[key] = cell
+        self._order, self._order_keys = [], []
+        if self.order_key is not None:
+            ordered = sorted(((self.order_key(record), key)
+                              for bucket in self.cells.values() for key, (_, _, record) in bucket.items()),
+                             key=lambda item: item[0])
+            self._order = [order for order, _ in ordered]
+            self._order_keys = [key for _, key in ordered]
+        self.version += 1
+        self.ready = True
+
+    def upsert(self, key: Hashable, lat: float, lng: float, record: Dict[str, Any]):
+        self.remove(key)
+        cell = self._cell(lat, lng)
+        self.cells.setdefault(cell, {})[key] = (lat, lng, record)
+        self.entries[key] = cell
+        if self.order_key is not None:
+            order = self.order_key(record)
+            index = bisect.bisect_right(self._order, order)
+            self._order.insert(index, order)
+            self._order_keys.insert(index, key)
+        self.version += 1
+
+    def remove(self, key: Hashable):
+        cell = self.entries.pop(key, None)
+        if cell is None:
+            return
+        bucket = self.cells[cell]
+        _, _, record = bucket.pop(key)
+        if not bucket:
+            del self.cells[cell]
+        if self.order_key is not None:
+            index = bisect.bisect_left(self._order, self.order_key(record))
+            while self._order_keys[index] != key:
+                index += 1
+            del self._order[index]
+            del self._order_keys[index]
+        self.version += 1
+
+    def get(self, key: Hashable) -> Optional[Dict[str, Any]]:
+        cell = self.entries.get(key)
+        if cell is None:
+            return None
+        return self.cells[cell][key][2]
+
+    def position(self, key: Hashable) -> Optional[Tuple[float, float]]:
+        cell = self.entries.get(key)
+        if cell is None:
+            return None
+        lat, lng, _ = self.cells[cell][key]
+        return lat, lng
+
+    def all(self, predicate: Predicate = None) -> List[Dict[str, Any]]:
+        return [
+            record
+            for bucket in self.cells.values()
+            for _, _, record in bucket.values()
+            if predicate is None or predicate(record)
+        ]
+
+    def ordered(self, descending: bool = False, after: Any = None,
+                predicate: Predicate = None) -> Iterator[Dict[str, Any]]:
+        """
+        Records lazily in order_key order (requires order_key). With `after`, starts
+        strictly past that order key in the direction of travel, found by bisection.
+        """
+        if descending:
+            end = len(self._order) if after is None else bisect.bisect_left(self._order, after)
+            positions = range(end - 1, -1, -1)
+        else:
+            start = 0 if after is None else bisect.bisect_right(self._order, after)
+            positions = range(start, len(self._order))
+        for position in positions:
+            record = self.get(self._order_keys[position])
+            if predicate is None or predicate(record):
+                yield record
+
+    def within(self, lat: float, lng: float, radius_km: float,
+               predicate: Predicate = None) -> List[Tuple[float, Dict[str, Any]]]:
+        """(distance_km, record) pairs within radius_km, nearest first"""
+        min_lat, max_lat, min_lng, max_lng = bounding_box(lat, lng, radius_km)
+        min_cell = self._cell(min_lat, min_lng)
+        max_cell = self._cell(max_lat, max_lng)
+        span = (max_cell[0] - min_cell[0] + 1) * (max_cell[1] - min_cell[1] + 1)
+
+        # Huge radius: walking the occupied cells is cheaper than the covering range
+        if span > len(self.cells):
+            buckets = [
+                bucket for (ix, iy), bucket in self.cells.items()
+                if min_cell[0] <= ix <= max_cell[0] and min_cell[1] <= iy <= max_cell[1]
+            ]
+        else:
+            buckets = [
+                self.cells[(ix, iy)]
+                for ix in range(min_cell[0], max_cell[0] + 1)
+                for iy in range(min_cell[1], max_cell[1] + 1)
+                if (ix, iy) in self.cells
+            ]
+
+        results = []
+        for bucket in buckets:
+            for p_lat, p_lng, record in bucket.values():
+                if predicate is not None and not predicate(record):
+                    continue
+                distance = haversine_km(lat, lng, p_lat, p_lng)
+                if distance <= radius_km:
+                    results.append((distance, record))
+        results.sort(key=lambda item: item[0])
+        return results
+
+    @staticmethod
+    def _ring_cells(cx: int, cy: int, ring: int):
+        """Cells on the border of the square `ring` cells out from (cx, cy)"""
+        if ring == 0:
+            yield cx, cy
+            return
+        for ix in range(cx - ring, cx + ring + 1):
+            yield ix, cy - ring
+            yield ix, cy + ring
+        for iy in range(cy - ring + 1, cy + ring):
+            yield cx - ring, iy
+            yield cx + ring, iy
+
+    def nearest(self, lat: float, lng: float, k: int, predicate: Predicate = None,
+                max_radius_km: Optional[float] = None) -> List[Tuple[float, Dict[str, Any]]]:
+        """
+        k nearest (distance_km, record) pairs, nearest first.
+
+        Rings of cells are visited outwards from the query cell until k candidates are
+        seen; the k-th candidate distance then bounds one exact `within` pass, so cells
+        are never scanned beyond the k-th neighbour.
+        """
+        if k <= 0 or not self.cells:
+            return []
+
+        cx, cy = self._cell(lat, lng)
+        candidates: List[float] = []
+        visited = 0
+        ring = 0
+        while len(candidates) < k:
+            # Sparse data far away: scanning every occupied cell is cheaper than more rings
+            visited += max(1, 8 * ring)
+            if visited > len(self.cells):
+                candidates = [
+                    haversine_km(lat, lng, p_lat, p_lng)
+                    for bucket in self.cells.values()
+                    for p_lat, p_lng, record in bucket.values()
+                    if predicate is None or predicate(record)
+                ]
+                break
+            for ix, iy in self._ring_cells(cx, cy, ring):
+                bucket = self.cells.get((ix, iy))
+                if not bucket:
+                    continue
+                for p_lat, p_lng, record in bucket.values():
+                    if predicate is None or predicate(record):
+                        candidates.append(haversine_km(lat, lng, p_lat, p_lng))
+            ring += 1
+
+        if not candidates:
+            return []
+
+        bound = heapq.nsmallest(k, candidates)[-1]
+        if max_radius_km is not None:
+            bound = min(bound, max_radius_km)
+        return self.within(lat, lng, bound, predicate)[:k]
@@ -0,0 +1,235 @@
+# Buffered smart band telemetry ingest: coalesce pings in memory, flush set-based
+
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+from uuid import UUID
+
+logger = logging.getLogger(__name__)
+
+# (lat, lng, battery_level, recorded_at)
+Ping = Tuple[float, float, Optional[int], datetime]
+
+# band_locations partitions exist from yesterday up to this many days ahead (UTC)
+HISTORY_DAYS_AHEAD = 2
+
+
+class BufferFull(Exception):
+    pass
+
+
+class TelemetryBuffer:
+    """
+    Last-write-wins buffer of band positions, written to smart_bands in bulk.
+
+    Each flush COPYs the coalesced pings into a temp staging table and applies them
+    with a single UPDATE ... FROM, so the per-row cost is one trigger call instead of
+    one round trip and statement per ping. Every ping (not just the latest) is also
+    COPYed into the partitioned band_locations history, in its own transaction: a
+    history batch that keeps failing (a missing partition, a bad row) is retried on
+    later flushes and dropped after `max_history_attempts`, without holding up the
+    position updates.
+    """
+
+    STAGING_TABLE = "band_telemetry_staging"
+
+    def __init__(self, flush_interval: float = 1.0, flush_threshold: int = 20_000,
+                 max_pending: int = 500_000, max_history_attempts: int = 5):
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self.max_pending = max_pending
+        self.max_history_attempts = max_history_attempts
+        self.pending: Dict[UUID, Ping] = {}
+        # (recorded_at, band_id, lat, lng, battery_level) in band_locations column order
+        self.history: List[tuple] = []
+        # History batches whose write failed, with their failed attempts so far
+        self.history_retry: List[Tuple[List[tuple], int]] = []
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+
+        self.pings_received = 0
+        self.pings_coalesced = 0
+        self.batches_rejected = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.rows_flushed = 0
+        self.rows_unmatched = 0
+        self.history_rows = 0
+        self.history_dropped = 0
+        self.failed_history_writes = 0
+        self.history_discarded = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+        self.last_flush_at: Optional[datetime] = None
+
+    def add(self, pings: List[Tuple[UUID, Ping]]) -> int:
+        """Buffer (band_id, ping) pairs; raises BufferFull instead of growing past max_pending"""
+        new_bands = {band_id for band_id, _ in pings if band_id not in self.pending}
+        if (len(self.pending) + len(new_bands) > self.max_pending
+                or len(self.history) + self.history_retry_rows + len(pings) > self.max_pending * 10):
+            self.batches_rejected += 1
+            self._wakeup.set()
+            raise BufferFull(f"Telemetry buffer is full ({len(self.pending)} bands pending)")
+
+        # Only keep history that lands in an existing daily partition
+        today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+        history_start = today - timedelta(days=1)
+        history_end = today + timedelta(days=HISTORY_DAYS_AHEAD + 1)
+
+        for band_id, ping in pings:
+            lat, lng, battery_level, recorded_at = ping
+            if history_start <= recorded_at < history_end:
+                self.history.append((recorded_at, band_id, lat, lng, battery_level))
+            else:
+                self.history_dropped += 1
+
+            current = self.pending.get(band_id)
+            if current is not None:
+                self.pings_coalesced += 1
+                if current[3] > ping[3]:
+                    continue
+            self.pending[band_id] = ping
+        self.pings_received += len(pings)
+
+        if len(self.pending) >= self.flush_threshold:
+            self._wakeup.set()
+        return len(pings)
+
+    @property
+    def history_retry_rows(self) -> int:
+        return sum(len(rows) for rows, _ in self.history_retry)
+
+    async def flush(self, pool) -> int:
+        async with self._flush_lock:
+            if not self.pending and not self.history and not self.history_retry:
+                return 0
+            batch, self.pending = self.pending, {}
+            history, self.history = self.history, []
+            started = time.perf_counter()
+
+            retry, self.history_retry = self.history_retry, []
+            if history:
+                retry.append((history, 0))
+            for rows, attempts in retry:
+                await self._flush_history(pool, rows, attempts)
+
+            try:
+                updated = await self._write(pool, batch) if batch else 0
+            except Exception:
+                self.failed_flushes += 1
+                # Put the batch back unless newer pings arrived meanwhile
+                for band_id, ping in batch.items():
+                    current = self.pending.get(band_id)
+                    if current is None or current[3] < ping[3]:
+                        self.pending[band_id] = ping
+                raise
+
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.flushes += 1
+            self.rows_flushed += updated
+            self.rows_unmatched += len(batch) - updated
+            self.last_flush_ms = elapsed_ms
+            self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+            self.total_flush_ms += elapsed_ms
+            self.last_flush_at = datetime.now(timezone.utc)
+            return updated
+
+    async def _flush_history(self, pool, rows: List[tuple], attempts: int):
+        try:
+            async with pool.acquire() as conn:
+                await conn.copy_records_to_table(
+                    "band_locations", records=rows,
+                    columns=["recorded_at", "band_id", "lat", "lng", "battery_level"])
+        except Exception:
+            self.failed_history_writes += 1
+            attempts += 1
+            if attempts >= self.max_history_attempts:
+                self.history_discarded += len(rows)
+                logger.exception(f"Discarding {len(rows)} band_locations rows after {attempts} failed writes")
+            else:
+                self.history_retry.append((rows, attempts))
+                logger.exception(f"band_locations write failed ({attempts}/{self.max_history_attempts}); will retry")
+            return
+        self.history_rows += len(rows)
+
+    async def _write(self, pool, batch: Dict[UUID, Ping]) -> int:
+        records = [
+            (band_id, lat, lng, battery_level, recorded_at)
+            for band_id, (lat, lng, battery_level, recorded_at) in batch.items()
+        ]
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(f"""
+                CREATE TEMP TABLE IF NOT EXISTS {self.STAGING_TABLE} (
+                    band_id UUID,
+                    lat DOUBLE PRECISION,
+                    lng DOUBLE PRECISION,
+                    battery_level INTEGER,
+                    recorded_at TIMESTAMP WITH TIME ZONE
+                ) ON COMMIT DELETE ROWS
+                """)
+                await conn.copy_records_to_table(
+                    self.STAGING_TABLE, records=records,
+                    columns=["band_id", "lat", "lng", "battery_level", "recorded_at"])
+                status = await conn.execute(f"""
+                UPDATE smart_bands sb
+                SET last_lat = s.lat,
+                    last_lng = s.lng,
+                    battery_level = COALESCE(s.battery_level, sb.battery_level)
+                FROM {self.STAGING_TABLE} s
+                WHERE sb.band_id = s.band_id
+                """)
+        return int(status.split()[-1])
+
+    async def run(self, pool):
+        """Background loop: flush every flush_interval, or sooner once the threshold is hit"""
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush(pool)
+            except Exception:
+                logger.exception("Telemetry flush failed; batch kept for retry")
+
+    def stats(self) -> dict:
+        return {
+            "pending_bands": len(self.pending),
+            "max_pending": self.max_pending,
+            "pings_received": self.pings_received,
+            "pings_coalesced": self.pings_coalesced,
+            "batches_rejected": self.batches_rejected,
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+            "rows_flushed": self.rows_flushed,
+            "rows_unmatched": self.rows_unmatched,
+            "pending_history": len(self.history),
+            "history_rows": self.history_rows,
+            "history_dropped": self.history_dropped,
+            "retry_history": self.history_retry_rows,
+            "failed_history_writes": self.failed_history_writes,
+            "history_discarded": self.history_discarded,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "max_flush_ms": round(self.max_flush_ms, 2),
+            "avg_flush_ms": round(self.total_flush_ms / self.flushes, 2) if self.flushes else 0.0,
+            "last_flush_at": self.last_flush_at,
+        }
+
+
+async def maintain_history_partitions(pool, retain_days: int, interval: float = 3600.0):
+    """Keep band_locations partitions created ahead of time and drop expired days"""
+    while True:
+        try:
+            async with pool.acquire() as conn:
+                await conn.execute("SELECT create_band_location_partitions($1)", HISTORY_DAYS_AHEAD)
+                dropped = await conn.fetchval("SELECT drop_band_location_partitions($1)", retain_days)
+            if dropped:
+                logger.info(f"Dropped {dropped} expired band_locations partitions")
+        except Exception:
+            logger.exception("band_locations partition maintenance failed")
+        await asyncio.sleep(interval)
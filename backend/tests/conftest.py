@@ -0,0 +1,42 @@
+# Fixtures for the backend tests: a throwaway Postgres database with schema.sql applied
+#
+# Tests that need Postgres run against the server in TEST_DATABASE_URL, which must let the
+# user create databases, e.g.
+#   TEST_DATABASE_URL=postgresql://postgres@localhost:5432/postgres pytest backend/tests
+# Without it they are skipped; the pure-Python tests still run.
+
+import os
+import sys
+from uuid import uuid4
+
+import asyncpg
+import pytest
+import pytest_asyncio
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BACKEND_DIR)
+sys.path.append(os.path.join(BACKEND_DIR, os.pardir, "shared"))
+
+SCHEMA_PATH = os.path.join(BACKEND_DIR, "schema.sql")
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+
+@pytest_asyncio.fixture
+async def db_pool():
+    """Pool on a fresh database holding schema.sql, dropped again after the test"""
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    name = f"test_{uuid4().hex[:12]}"
+    admin = await asyncpg.connect(TEST_DATABASE_URL)
+    try:
+        await admin.execute(f'CREATE DATABASE "{name}"')
+        pool = await asyncpg.create_pool(TEST_DATABASE_URL, database=name, min_size=1, max_size=4)
+        try:
+            with open(SCHEMA_PATH) as schema_file:
+                await pool.execute(schema_file.read())
+            yield pool
+        finally:
+            await pool.close()
+            await admin.execute(f'DROP DATABASE "{name}" WITH (FORCE)')
+    finally:
+        await admin.close()
@@ -0,0 +1,93 @@
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from uuid import UUID, uuid4
+
+import pytest
+
+from pagination import InvalidCursor, Keyset, SortKey, parse_timestamp
+
+FACILITIES = Keyset(
+    SortKey("created_at", "created_at", True, parse_timestamp),
+    SortKey("facility_id", "facility_id", True, UUID),
+)
+# Same shape as ROUTES_KEYSET in app.py: mixed directions and stand-ins for NULL
+ROUTES = Keyset(
+    SortKey("COALESCE(crowd_avoidance_score, 2147483647)", "crowd_avoidance_score",
+            True, lambda score: score if score is not None else 2147483647),
+    SortKey("COALESCE(distance, 'NaN'::numeric)", "distance",
+            False, lambda distance: Decimal(distance if distance is not None else "NaN")),
+    SortKey("created_at", "created_at", True, parse_timestamp),
+    SortKey("route_id", "route_id", True, UUID),
+)
+
+
+async def walk(conn, table: str, keyset: Keyset, limit: int):
+    """Every row of `table`, fetched a page at a time by following next_cursor"""
+    rows, cursor = [], None
+    while True:
+        where_clause, values = "", []
+        if cursor:
+            condition, values, _ = keyset.condition(cursor, 1)
+            where_clause = f"WHERE {condition}"
+        page = [dict(row) for row in await conn.fetch(
+            f"SELECT * FROM {table} {where_clause} ORDER BY {keyset.order_by()} LIMIT {limit}", *values)]
+        rows.extend(page)
+        cursor = keyset.next_cursor(page, limit)
+        if cursor is None:
+            return rows
+
+
+def test_cursor_round_trip():
+    row = {"created_at": datetime(2028, 4, 1, 6, 30, tzinfo=timezone.utc), "facility_id": uuid4()}
+    assert FACILITIES.decode(FACILITIES.encode(row)) == [row["created_at"], row["facility_id"]]
+
+
+def test_invalid_cursor():
+    with pytest.raises(InvalidCursor):
+        FACILITIES.decode("not-a-cursor")
+    with pytest.raises(InvalidCursor):
+        FACILITIES.decode(ROUTES.encode({"crowd_avoidance_score": 1, "distance": None,
+                                         "created_at": "2028-04-01T00:00:00+00:00", "route_id": uuid4()}))
+
+
+def test_next_cursor_only_for_full_pages():
+    rows = [{"created_at": datetime(2028, 4, 1, tzinfo=timezone.utc), "facility_id": uuid4()}]
+    assert FACILITIES.next_cursor(rows, 2) is None
+    assert FACILITIES.next_cursor(rows, 1) is not None
+
+
+@pytest.mark.asyncio
+async def test_uniform_keyset_pages_match_order_by(db_pool):
+    # Shared timestamps, so the facility_id tiebreak decides page boundaries
+    created = datetime(2028, 4, 1, tzinfo=timezone.utc)
+    await db_pool.executemany(
+        "INSERT INTO facilities (type, name, lat, lng, created_at) VALUES ('washroom', $1, 23.18, 75.77, $2)",
+        [(f"Facility {i}", created + timedelta(minutes=i // 4)) for i in range(25)])
+
+    async with db_pool.acquire() as conn:
+        expected = [dict(row) for row in await conn.fetch(f"SELECT * FROM facilities ORDER BY {FACILITIES.order_by()}")]
+        assert await walk(conn, "facilities", FACILITIES, 4) == expected
+
+
+@pytest.mark.asyncio
+async def test_mixed_keyset_pages_keep_null_placement(db_pool):
+    created = datetime(2028, 4, 1, tzinfo=timezone.utc)
+    scores = [None, 10, 50, 50, None, 90]
+    distances = [None, Decimal("1.50"), Decimal("0.75"), None]
+    await db_pool.executemany("""
+        INSERT INTO routes (start_point_lat, start_point_lng, end_point_lat, end_point_lng,
+                            crowd_avoidance_score, distance, created_at)
+        VALUES (23.18, 75.77, 23.19, 75.78, $1, $2, $3)
+        """, [(scores[i % len(scores)], distances[i % len(distances)], created + timedelta(minutes=i // 3))
+              for i in range(30)])
+
+    async with db_pool.acquire() as conn:
+        rows = await walk(conn, "routes", ROUTES, 7)
+        # The baseline order: "crowd_avoidance_score DESC" puts NULLs first, "distance ASC" last
+        expected = [dict(row) for row in await conn.fetch("""
+            SELECT * FROM routes
+            ORDER BY crowd_avoidance_score DESC NULLS FIRST, distance ASC NULLS LAST,
+                     created_at DESC, route_id DESC
+            """)]
+        assert rows == expected
+        assert rows[0]["crowd_avoidance_score"] is None
@@ -0,0 +1,60 @@
+from datetime import datetime, timedelta, timezone
+from uuid import uuid4
+
+import pytest
+
+
+def day_start(offset_days: int) -> datetime:
+    today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    return today + timedelta(days=offset_days)
+
+
+async def insert_reading(pool, recorded_at: datetime):
+    await pool.execute(
+        "INSERT INTO crowd_readings (recorded_at, location_id, people_count, density_level) VALUES ($1, $2, 120, 'low')",
+        recorded_at, uuid4())
+
+
+async def partition_of(pool, table: str, recorded_at: datetime) -> str:
+    return await pool.fetchval(
+        f"SELECT tableoid::regclass::text FROM {table} WHERE recorded_at = $1", recorded_at)
+
+
+@pytest.mark.asyncio
+async def test_schema_creates_todays_partitions(db_pool):
+    for table in ("band_locations", "crowd_readings"):
+        for offset_days in range(-1, 3):
+            name = f"{table}_{day_start(offset_days):%Y%m%d}"
+            assert await db_pool.fetchval("SELECT to_regclass($1)", name) is not None
+
+    # Re-running is a no-op
+    assert await db_pool.fetchval("SELECT create_daily_partitions('crowd_readings', 2)") == 0
+    await db_pool.execute("SELECT create_band_location_partitions(2)")
+
+
+@pytest.mark.asyncio
+async def test_create_moves_rows_out_of_default(db_pool):
+    recorded_at = day_start(3) + timedelta(hours=6)
+    await insert_reading(db_pool, recorded_at)
+    assert await partition_of(db_pool, "crowd_readings", recorded_at) == "crowd_readings_default"
+
+    assert await db_pool.fetchval("SELECT create_daily_partitions('crowd_readings', 3)") == 1
+    assert await partition_of(db_pool, "crowd_readings", recorded_at) == f"crowd_readings_{recorded_at:%Y%m%d}"
+    assert await db_pool.fetchval("SELECT COUNT(*) FROM crowd_readings_default") == 0
+
+
+@pytest.mark.asyncio
+async def test_drop_removes_expired_days_and_default_rows(db_pool):
+    expired_day = day_start(-40)
+    await db_pool.execute(
+        f"CREATE TABLE crowd_readings_{expired_day:%Y%m%d} PARTITION OF crowd_readings "
+        "FOR VALUES FROM ($$" + expired_day.isoformat() + "$$) TO ($$" + day_start(-39).isoformat() + "$$)")
+    await insert_reading(db_pool, expired_day + timedelta(hours=1))
+    await insert_reading(db_pool, day_start(-45))
+    await insert_reading(db_pool, day_start(-10))
+
+    assert await db_pool.fetchval("SELECT drop_daily_partitions('crowd_readings', 30)") == 1
+    assert await db_pool.fetchval("SELECT to_regclass($1)", f"crowd_readings_{expired_day:%Y%m%d}") is None
+    # Only the reading inside the retention window is left in the default partition
+    assert await db_pool.fetchval("SELECT COUNT(*) FROM crowd_readings_default") == 1
+    assert await db_pool.fetchval("SELECT drop_band_location_partitions(30)") == 0
@@ -0,0 +1,70 @@
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from uuid import uuid4
+
+import pytest
+
+from telemetry import TelemetryBuffer
+
+
+async def add_bands(pool, count: int):
+    rows = await pool.fetch(
+        "INSERT INTO smart_bands (band_code) SELECT 'BAND-' || n FROM generate_series(1, $1) n RETURNING band_id",
+        count)
+    return [row["band_id"] for row in rows]
+
+
+@pytest.mark.asyncio
+async def test_flush_updates_positions_and_history(db_pool):
+    first, second = await add_bands(db_pool, 2)
+    now = datetime.now(timezone.utc)
+    buffer = TelemetryBuffer()
+    buffer.add([
+        (first, (23.1801, 75.7701, 90, now - timedelta(seconds=2))),
+        (first, (23.1802, 75.7702, 89, now)),
+        # An older ping arriving late does not overwrite the newer position
+        (first, (23.1800, 75.7700, 91, now - timedelta(seconds=5))),
+        (second, (23.1900, 75.7800, None, now)),
+        (uuid4(), (23.2000, 75.7900, 50, now)),
+    ])
+
+    assert await buffer.flush(db_pool) == 2
+    bands = {row["band_id"]: row for row in await db_pool.fetch("SELECT * FROM smart_bands")}
+    assert (bands[first]["last_lat"], bands[first]["last_lng"]) == (Decimal("23.18020000"), Decimal("75.77020000"))
+    assert bands[first]["battery_level"] == 89
+    assert bands[second]["battery_level"] == 100
+    assert await db_pool.fetchval("SELECT COUNT(*) FROM band_locations") == 5
+
+    stats = buffer.stats()
+    assert stats["history_rows"] == 5
+    assert buffer.rows_unmatched == 1
+    assert not buffer.pending and not buffer.history
+    assert await buffer.flush(db_pool) == 0
+
+
+@pytest.mark.asyncio
+async def test_failed_history_is_retried_then_discarded(db_pool):
+    (band,) = await add_bands(db_pool, 1)
+    recorded_at = datetime.now(timezone.utc) + timedelta(days=2)
+    buffer = TelemetryBuffer(max_history_attempts=2)
+    buffer.add([(band, (23.18, 75.77, 80, recorded_at))])
+    # The day's partition goes missing between buffering and flushing
+    await db_pool.execute(f"DROP TABLE band_locations_{recorded_at:%Y%m%d}")
+
+    # Positions are still written while the history waits for a retry
+    assert await buffer.flush(db_pool) == 1
+    assert await db_pool.fetchval("SELECT battery_level FROM smart_bands WHERE band_id = $1", band) == 80
+    assert buffer.history_retry_rows == 1
+    assert buffer.failed_history_writes == 1
+
+    assert await buffer.flush(db_pool) == 0
+    assert buffer.history_retry == []
+    assert buffer.history_discarded == 1
+
+
+def test_history_outside_partitions_is_dropped():
+    buffer = TelemetryBuffer()
+    buffer.add([(uuid4(), (23.18, 75.77, 80, datetime.now(timezone.utc) - timedelta(days=3)))])
+    assert buffer.history == []
+    assert buffer.history_dropped == 1
+    assert len(buffer.pending) == 1
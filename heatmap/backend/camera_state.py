@@ -0,0 +1,111 @@
+# Latest analysis per camera, held in memory and kept current by the ingest path
+
+import bisect
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class CameraLatest:
+    """
+    One row per camera plus a score-ordered index of camera ids.
+
+    Serves /cameras/latest and /cameras/ranking in O(cameras) without touching
+    camera_data, and keeps running totals so the overview is O(1). Only mutated
+    from the event loop, so no locking.
+    """
+
+    CRITICAL_SCORE = 80
+
+    def __init__(self):
+        self.rows: Dict[str, Dict[str, Any]] = {}
+        # (-score, camera_id): highest score first, ties by camera id
+        self._ranking: List[Tuple[float, str]] = []
+        self.total_people = 0
+        self.score_sum = 0.0
+        self.level_counts: Counter = Counter()
+        self.critical_cameras = 0
+        # Bumped on every change, so a reload can tell it raced with a write
+        self.version = 0
+        self.ready = False
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def load(self, rows: List[Dict[str, Any]]):
+        self.rows = {row["camera_id"]: row for row in rows}
+        self._ranking = sorted((-row["score"], camera_id) for camera_id, row in self.rows.items())
+        self.total_people = 0
+        self.score_sum = 0.0
+        self.level_counts = Counter()
+        self.critical_cameras = 0
+        for row in self.rows.values():
+            self._count(row, 1)
+        self.version += 1
+        self.ready = True
+
+    def _count(self, row: Dict[str, Any], sign: int):
+        self.total_people += sign * row["people_count"]
+        self.score_sum += sign * row["score"]
+        self.level_counts[row["level"]] += sign
+        if row["score"] >= self.CRITICAL_SCORE:
+            self.critical_cameras += sign
+
+    def apply(self, row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Insert or replace a camera's row; returns the row it replaced, if any.
+        A row older than the stored one (a delayed batch) is ignored.
+        """
+        current = self.rows.get(row["camera_id"])
+        if current is not None and row["timestamp"] < current["timestamp"]:
+            return None
+        previous = self.remove(row["camera_id"])
+        self.rows[row["camera_id"]] = row
+        bisect.insort(self._ranking, (-row["score"], row["camera_id"]))
+        self._count(row, 1)
+        self.version += 1
+        return previous
+
+    def remove(self, camera_id: str) -> Optional[Dict[str, Any]]:
+        previous = self.rows.pop(camera_id, None)
+        if previous is not None:
+            key = (-previous["score"], camera_id)
+            del self._ranking[bisect.bisect_left(self._ranking, key)]
+            self._count(previous, -1)
+            self.version += 1
+        return previous
+
+    def latest(self) -> List[Dict[str, Any]]:
+        return [self.rows[camera_id] for camera_id in sorted(self.rows)]
+
+    def ranked(self) -> List[Dict[str, Any]]:
+        return [self.rows[camera_id] for _, camera_id in self._ranking]
+
+    def overview(self) -> Dict[str, Any]:
+        total_cameras = len(self.rows)
+        return {
+            "total_cameras": total_cameras,
+            "total_people": self.total_people,
+            "high_density_cameras": self.level_counts["HIGH"],
+            "average_score": self.score_sum / total_cameras if total_cameras > 0 else 0,
+            "critical_cameras": self.critical_cameras,
+        }
+
+
+class ActiveAlerts:
+    """Running count of active alerts, adjusted as alerts are raised and resolved"""
+
+    def __init__(self):
+        self.count = 0
+        self.version = 0
+        # Writes that may have committed without being counted yet
+        self.pending = 0
+        self.ready = False
+
+    def load(self, count: int):
+        self.count = count
+        self.version += 1
+        self.ready = True
+
+    def add(self, n: int):
+        self.count += n
+        self.version += 1
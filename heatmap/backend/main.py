@@ -1,33 +1,84 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 from datetime import datetime, timezone, timedelta
+import asyncio
 import os
-from supabase import create_client, Client
+import time
+import asyncpg
 import logging
 import uvicorn
 from contextlib import asynccontextmanager
+import sys
+
+# Modules shared between backend/ and heatmap/backend/ live in the repository's shared/ directory
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, "shared"))
+
+from camera_state import ActiveAlerts, CameraLatest
+from etag import content_etag, etag_matches, not_modified, set_etag
+from export_stream import TableExport, export_conditions
+from fast_json import dumps
+from live_feed import LiveFeed
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Supabase configuration - IMPORTANT: Set these in your .env file
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_ANON_KEY = os.getenv("SUPABASE_ANON_KEY")
-SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
+# Database configuration - IMPORTANT: Set this in your .env file
+# The Supabase Postgres connection string, or a local Postgres loaded with schema.sql
+DATABASE_URL = os.getenv("DATABASE_URL")
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "5"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "20"))
+# How often the in-memory overview is recomputed from the database to correct drift
+RECONCILE_INTERVAL = float(os.getenv("OVERVIEW_RECONCILE_INTERVAL", "60"))
+# Apply schema.sql on startup (handy for a local stand-in database)
+INIT_SCHEMA = os.getenv("INIT_SCHEMA", "").lower() in ("1", "true", "yes")
 
 # Validate required environment variables
-if not SUPABASE_URL:
-    raise ValueError("SUPABASE_URL environment variable is required")
-if not SUPABASE_ANON_KEY:
-    raise ValueError("SUPABASE_ANON_KEY environment variable is required")
-if not SUPABASE_SERVICE_KEY:
-    raise ValueError("SUPABASE_SERVICE_KEY environment variable is required")
+if not DATABASE_URL:
+    raise ValueError("DATABASE_URL environment variable is required")
+
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "schema.sql")
+
+# Database connection pool
+db_pool = None
+
+# Latest row per camera and running overview totals, served from memory once loaded
+camera_latest = CameraLatest()
+active_alerts = ActiveAlerts()
+# (camera_latest.version, ETag of /cameras/latest at that version)
+latest_etag = (-1, "")
+
+# Server-Sent Events push of stored camera rows and new alerts (GET /cameras/live)
+LIVE_TOPICS = {"cameras", "alerts"}
+live_feed = LiveFeed(dumps)
+
+# Streaming NDJSON/CSV downloads of camera rows and alerts (GET /export/...)
+table_export = TableExport(dumps,
+                           chunk_rows=int(os.getenv("EXPORT_CHUNK_ROWS", "5000")),
+                           max_active=int(os.getenv("EXPORT_MAX_ACTIVE", "4")))
+
+# Column order of the unnest() arrays in write_camera_batch
+CAMERA_COLUMNS = [
+    "camera_id", "camera_name", "density_type", "score", "level", "color", "priority",
+    "people_count", "max_density", "mean_density", "timestamp", "updated_at",
+]
+ALERT_COLUMNS = ["camera_id", "camera_name", "alert_type", "message", "severity", "timestamp"]
 
-# Initialize Supabase client
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+# Bulk ingest metrics for POST /cameras/data
+ingest_metrics = {
+    "batches": 0,
+    "cameras_stored": 0,
+    "alerts_created": 0,
+    "failed_batches": 0,
+    "last_batch_size": 0,
+    "max_batch_size": 0,
+    "last_latency_ms": 0.0,
+    "max_latency_ms": 0.0,
+    "total_latency_ms": 0.0,
+}
 
 # Pydantic models
 class CameraAnalysis(BaseModel):
@@ -84,12 +135,23 @@ class SystemOverview(BaseModel):
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    global db_pool
     # Startup
     logger.info("Starting up FastAPI application...")
+    db_pool = await asyncpg.create_pool(DATABASE_URL, min_size=DB_POOL_MIN_SIZE, max_size=DB_POOL_MAX_SIZE)
     await create_tables()
+    try:
+        await reconcile_state()
+    except Exception as e:
+        logger.error(f"Could not load latest camera state, serving from the database: {e}")
+    reconcile_task = asyncio.create_task(reconcile_loop())
+    # Events come straight from this process's write path
+    live_feed.available = True
     yield
     # Shutdown
     logger.info("Shutting down FastAPI application...")
+    reconcile_task.cancel()
+    await db_pool.close()
 
 # Create FastAPI app
 app = FastAPI(
@@ -110,33 +172,118 @@ app.add_middleware(
 
 async def create_tables():
     """
-    Placeholder for table creation logic.
-    In a real-world scenario, this would be handled by a migration tool like Alembic.
-    For this example, we assume tables are created via the Supabase SQL editor.
+    Apply schema.sql when INIT_SCHEMA is set, e.g. against a local Postgres.
+    In production the tables are managed in the Supabase SQL editor.
     """
-    logger.info("Skipping table creation. Assuming tables exist in Supabase.")
+    if not INIT_SCHEMA:
+        logger.info("Skipping table creation. Assuming tables exist in the database.")
+        return
+    with open(SCHEMA_PATH) as schema_file:
+        schema = schema_file.read()
+    async with db_pool.acquire() as conn:
+        await conn.execute(schema)
+    logger.info("Applied schema.sql")
+
+async def get_db():
+    async with db_pool.acquire() as connection:
+        yield connection
+
+async def reconcile_state():
+    """Recompute the in-memory camera state and alert count from scratch"""
+    camera_version, alert_version = camera_latest.version, active_alerts.version
+    async with db_pool.acquire() as conn:
+        rows = await conn.fetch("SELECT * FROM camera_data")
+        alert_count = await conn.fetchval("SELECT COUNT(*) FROM alerts WHERE is_active")
+
+    # Skip whatever changed while we were reading; the next round catches up
+    if camera_latest.version == camera_version:
+        before = camera_latest.overview() if camera_latest.ready else None
+        camera_latest.load([dict(row) for row in rows])
+        after = camera_latest.overview()
+        # Float sums pick up rounding noise; only report real differences
+        if before is not None and ({**before, "average_score": round(before["average_score"], 6)}
+                                   != {**after, "average_score": round(after["average_score"], 6)}):
+            logger.warning(f"Camera overview drifted: {before} -> {after}")
+    if active_alerts.version == alert_version and not active_alerts.pending:
+        if active_alerts.ready and active_alerts.count != alert_count:
+            logger.warning(f"Active alert count drifted: {active_alerts.count} -> {alert_count}")
+        active_alerts.load(alert_count)
+
+async def reconcile_loop():
+    while True:
+        await asyncio.sleep(RECONCILE_INTERVAL)
+        try:
+            await reconcile_state()
+        except Exception as e:
+            logger.error(f"Error reconciling overview state: {e}")
 
-def get_supabase() -> Client:
-    return supabase
+def as_utc(value: datetime) -> datetime:
+    """Naive timestamps from cameras are taken as UTC"""
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
 
 @app.get("/")
 async def root():
     return {"message": "Multi-Camera Crowd Monitoring API", "status": "active", "version": "1.0.0"}
 
+async def write_camera_batch(db, records: List[Dict[str, Any]], alerts: List[Dict[str, Any]]):
+    """
+    Upsert a batch of camera records and raise alerts for newly seen cameras in one transaction.
+    Records older than the stored row for their camera are skipped and not returned.
+    """
+    async with db.transaction():
+        rows = await db.fetch("""
+        INSERT INTO camera_data (camera_id, camera_name, density_type, score, level, color, priority,
+                                 people_count, max_density, mean_density, timestamp, updated_at)
+        SELECT * FROM unnest($1::varchar[], $2::varchar[], $3::varchar[], $4::float8[], $5::varchar[],
+                             $6::varchar[], $7::varchar[], $8::int[], $9::float8[], $10::float8[],
+                             $11::timestamptz[], $12::timestamptz[])
+        ON CONFLICT (camera_id) DO UPDATE SET
+            camera_name = EXCLUDED.camera_name,
+            density_type = EXCLUDED.density_type,
+            score = EXCLUDED.score,
+            level = EXCLUDED.level,
+            color = EXCLUDED.color,
+            priority = EXCLUDED.priority,
+            people_count = EXCLUDED.people_count,
+            max_density = EXCLUDED.max_density,
+            mean_density = EXCLUDED.mean_density,
+            timestamp = EXCLUDED.timestamp,
+            updated_at = EXCLUDED.updated_at
+        -- A delayed frame older than the stored one is neither written nor returned
+        WHERE camera_data.timestamp <= EXCLUDED.timestamp
+        RETURNING *, (xmax = 0) AS inserted
+        """, *[[record[column] for record in records] for column in CAMERA_COLUMNS])
+
+        # xmax is 0 only for rows this statement inserted rather than updated
+        new_ids = {row["camera_id"] for row in rows if row["inserted"]}
+        new_alerts = [alert for alert in alerts if alert["camera_id"] in new_ids]
+        if new_alerts:
+            alert_rows = await db.fetch("""
+            INSERT INTO alerts (camera_id, camera_name, alert_type, message, severity, timestamp)
+            SELECT * FROM unnest($1::varchar[], $2::varchar[], $3::varchar[], $4::text[], $5::varchar[],
+                                 $6::timestamptz[])
+            RETURNING *
+            """, *[[alert[column] for alert in new_alerts] for column in ALERT_COLUMNS])
+        else:
+            alert_rows = []
+
+    return rows, alert_rows
+
 @app.post("/cameras/data", response_model=dict)
-async def store_camera_data(cameras: List[CameraData], db: Client = Depends(get_supabase)):
+async def store_camera_data(cameras: List[CameraData], db=Depends(get_db)):
     """Store multiple camera data entries"""
+    started = time.perf_counter()
     try:
-        stored_data = []
         current_time = datetime.now(timezone.utc)
-        current_time_iso = current_time.isoformat()
+        records = {}
+        alerts = {}
 
         for camera in cameras:
             # Prepare data for insertion
-            # Ensure timestamp is in ISO format for Supabase
-            timestamp_iso = (camera.timestamp or current_time).isoformat()
+            timestamp = as_utc(camera.timestamp or current_time)
 
-            camera_record = {
+            # Keyed by camera_id: one statement can't upsert the same row twice
+            records[camera.camera_id] = {
                 "camera_id": camera.camera_id,
                 "camera_name": camera.camera_name,
                 "density_type": camera.density_type,
@@ -147,100 +294,168 @@ async def store_camera_data(cameras: List[CameraData], db: Client = Depends(get_
                 "people_count": camera.analysis.people_count,
                 "max_density": camera.analysis.max_density,
                 "mean_density": camera.analysis.mean_density,
-                "timestamp": timestamp_iso,
-                "updated_at": current_time_iso
+                "timestamp": timestamp,
+                "updated_at": current_time
             }
-            
-            # Manual upsert: Try to update first, if no rows are affected, then insert.
-            update_result = db.table("camera_data").update(camera_record).eq("camera_id", camera.camera_id).execute()
 
-            if update_result.data:
-                stored_data.append(update_result.data[0])
+            # Create alert if high priority (only raised for cameras seen for the first time)
+            if camera.analysis.score >= 70:
+                alerts[camera.camera_id] = {
+                    "camera_id": camera.camera_id,
+                    "camera_name": camera.camera_name,
+                    "alert_type": "HIGH_CROWD_DENSITY",
+                    "message": f"High crowd density detected: {camera.analysis.score}/100 score with {camera.analysis.people_count} people",
+                    "severity": "HIGH" if camera.analysis.score >= 80 else "MEDIUM",
+                    "timestamp": current_time
+                }
             else:
-                # If update didn't affect any rows, insert a new record
-                insert_result = db.table("camera_data").insert(camera_record).execute()
-                if insert_result.data:
-                    stored_data.append(insert_result.data[0])
-                
-                # Create alert if high priority
-                if camera.analysis.score >= 70:
-                    alert_data = {
-                        "camera_id": camera.camera_id,
-                        "camera_name": camera.camera_name,
-                        "alert_type": "HIGH_CROWD_DENSITY",
-                        "message": f"High crowd density detected: {camera.analysis.score}/100 score with {camera.analysis.people_count} people",
-                        "severity": "HIGH" if camera.analysis.score >= 80 else "MEDIUM",
-                        "timestamp": current_time_iso
-                    }
-                    db.table("alerts").insert(alert_data).execute()
-        
+                alerts.pop(camera.camera_id, None)
+
+        stored_data, alert_rows = [], []
+        if records:
+            active_alerts.pending += 1
+            try:
+                stored_data, alert_rows = await write_camera_batch(db, list(records.values()), list(alerts.values()))
+                active_alerts.add(len(alert_rows))
+            finally:
+                active_alerts.pending -= 1
+            for row in stored_data:
+                latest_row = dict(row)
+                inserted = latest_row.pop("inserted")
+                if camera_latest.ready:
+                    camera_latest.apply(latest_row)
+                live_feed.publish("cameras", {"op": "INSERT" if inserted else "UPDATE", "row": latest_row})
+            for row in alert_rows:
+                live_feed.publish("alerts", {"op": "INSERT", "row": dict(row)})
+        alert_count = len(alert_rows)
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        ingest_metrics["batches"] += 1
+        ingest_metrics["cameras_stored"] += len(stored_data)
+        ingest_metrics["alerts_created"] += alert_count
+        ingest_metrics["last_batch_size"] = len(cameras)
+        ingest_metrics["max_batch_size"] = max(ingest_metrics["max_batch_size"], len(cameras))
+        ingest_metrics["last_latency_ms"] = elapsed_ms
+        ingest_metrics["max_latency_ms"] = max(ingest_metrics["max_latency_ms"], elapsed_ms)
+        ingest_metrics["total_latency_ms"] += elapsed_ms
+        logger.info(f"Stored {len(stored_data)} cameras and {alert_count} alerts in {elapsed_ms:.1f} ms")
+
         return {
             "message": f"Successfully stored data for {len(stored_data)} cameras",
             "stored_count": len(stored_data),
+            "alerts_created": alert_count,
+            "elapsed_ms": round(elapsed_ms, 2),
             "timestamp": current_time.isoformat()
         }
         
     except Exception as e:
+        ingest_metrics["failed_batches"] += 1
         logger.error(f"Error storing camera data: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/cameras/data/metrics")
+async def get_ingest_metrics():
+    """Get batch size and latency metrics for camera data ingest"""
+    batches = ingest_metrics["batches"]
+    return {
+        **{key: round(value, 2) if isinstance(value, float) else value for key, value in ingest_metrics.items()},
+        "avg_batch_size": round(ingest_metrics["cameras_stored"] / batches, 1) if batches else 0.0,
+        "avg_latency_ms": round(ingest_metrics["total_latency_ms"] / batches, 2) if batches else 0.0,
+    }
+
 @app.get("/cameras/data", response_model=List[CameraDataResponse])
 async def get_camera_data(
     limit: int = 100,
     camera_id: Optional[str] = None,
-    db: Client = Depends(get_supabase)
+    db=Depends(get_db)
 ):
     """Get camera data with optional filtering"""
     try:
-        query = db.table("camera_data").select("*").order("timestamp", desc=True)
-        
         if camera_id:
-            query = query.eq("camera_id", camera_id)
-            
-        result = query.limit(limit).execute()
-        return result.data
+            rows = await db.fetch(
+                "SELECT * FROM camera_data WHERE camera_id = $1 ORDER BY timestamp DESC LIMIT $2",
+                camera_id, limit
+            )
+        else:
+            rows = await db.fetch("SELECT * FROM camera_data ORDER BY timestamp DESC LIMIT $1", limit)
+        return [dict(row) for row in rows]
         
     except Exception as e:
         logger.error(f"Error fetching camera data: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/cameras/latest", response_model=List[CameraDataResponse])
-async def get_latest_camera_data(db: Client = Depends(get_supabase)):
+async def get_latest_camera_data(request: Request, response: Response, db=Depends(get_db)):
     """Get the latest data for each camera"""
+    global latest_etag
     try:
-        # Get latest record for each camera
-        result = db.rpc("get_latest_camera_data").execute()
-        return result.data
+        if camera_latest.ready:
+            # Conditional GET: the dashboard polls this; skip the body when nothing changed.
+            # Hashed from the rows, so it matches whichever worker answers; rehashed only on change
+            if latest_etag[0] != camera_latest.version:
+                latest_etag = (camera_latest.version, content_etag(dumps(camera_latest.latest())))
+            etag = latest_etag[1]
+            if etag_matches(request, etag):
+                return not_modified(etag)
+            set_etag(response, etag)
+            return camera_latest.latest()
+
+        # camera_data holds one row per camera (upserted on camera_id)
+        rows = await db.fetch("SELECT * FROM camera_data ORDER BY camera_id")
+        return [dict(row) for row in rows]
         
     except Exception as e:
-        # Fallback query if RPC doesn't exist
-        try:
-            result = db.table("camera_data").select("*").order("camera_id,timestamp", desc=True).execute()
-            
-            # Group by camera_id and get latest for each
-            latest_data = {}
-            for record in result.data:
-                camera_id = record['camera_id']
-                if camera_id not in latest_data:
-                    latest_data[camera_id] = record
-            
-            return list(latest_data.values())
-            
-        except Exception as fallback_e:
-            logger.error(f"Error fetching latest camera data: {fallback_e}")
-            raise HTTPException(status_code=500, detail=str(fallback_e))
+        logger.error(f"Error fetching latest camera data: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/cameras/live")
+async def camera_live_feed(
+    request: Request,
+    topic: Optional[List[str]] = Query(None),
+    camera_id: Optional[List[str]] = Query(None),
+    level: Optional[List[str]] = Query(None)
+):
+    """Stream stored camera rows and new alerts as Server-Sent Events"""
+    topics = set(topic or LIVE_TOPICS)
+    unknown = topics - LIVE_TOPICS
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown topics: {', '.join(sorted(unknown))}")
+    if not live_feed.available:
+        raise HTTPException(status_code=503, detail="Live feed is not available")
+
+    camera_ids = set(camera_id) if camera_id else None
+    levels = set(level) if level else None
+
+    def wanted(event_topic: str, data: Dict[str, Any]) -> bool:
+        row = data["row"]
+        if camera_ids is not None and row.get("camera_id") not in camera_ids:
+            return False
+        # Level filters camera rows; alerts carry a severity instead
+        if levels is not None and event_topic == "cameras" and row.get("level") not in levels:
+            return False
+        return True
+
+    subscriber = live_feed.subscribe(topics, wanted)
+    return StreamingResponse(
+        live_feed.stream(subscriber, request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/cameras/live/stats")
+async def get_live_feed_stats():
+    """Get live feed subscriber and delivery counters"""
+    return live_feed.stats()
 
 @app.get("/cameras/ranking", response_model=List[CameraDataResponse])
-async def get_camera_ranking(db: Client = Depends(get_supabase)):
+async def get_camera_ranking(db=Depends(get_db)):
     """Get cameras ranked by crowd density score"""
     try:
-        # Get latest data and sort by score at the database level
-        latest_data = await get_latest_camera_data(db)
-        
-        # Sort the fetched data in Python
-        # Note: A more efficient approach would be a dedicated SQL function 
-        # or view that returns ranked data directly from the database.
-        return sorted(latest_data, key=lambda x: x['score'], reverse=True)
+        if camera_latest.ready:
+            return camera_latest.ranked()
+
+        rows = await db.fetch("SELECT * FROM camera_data ORDER BY score DESC, camera_id")
+        return [dict(row) for row in rows]
         
     except Exception as e:
         logger.error(f"Error fetching camera ranking: {e}")
@@ -250,33 +465,41 @@ async def get_camera_ranking(db: Client = Depends(get_supabase)):
 async def get_alerts(
     active_only: bool = True,
     limit: int = 50,
-    db: Client = Depends(get_supabase)
+    db=Depends(get_db)
 ):
     """Get alerts with optional filtering"""
     try:
-        query = db.table("alerts").select("*").order("timestamp", desc=True)
-        
         if active_only:
-            query = query.eq("is_active", True)
-            
-        result = query.limit(limit).execute()
-        return result.data
+            rows = await db.fetch(
+                "SELECT * FROM alerts WHERE is_active = TRUE ORDER BY timestamp DESC LIMIT $1", limit
+            )
+        else:
+            rows = await db.fetch("SELECT * FROM alerts ORDER BY timestamp DESC LIMIT $1", limit)
+        return [dict(row) for row in rows]
         
     except Exception as e:
         logger.error(f"Error fetching alerts: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.put("/alerts/{alert_id}/resolve")
-async def resolve_alert(alert_id: int, db: Client = Depends(get_supabase)):
+async def resolve_alert(alert_id: int, db=Depends(get_db)):
     """Mark an alert as resolved"""
     try:
-        result = db.table("alerts").update({
-            "is_active": False,
-            "resolved_at": datetime.now(timezone.utc)
-        }).eq("id", alert_id).execute()
-        
-        if not result.data:
-            raise HTTPException(status_code=404, detail="Alert not found")
+        active_alerts.pending += 1
+        try:
+            resolved = await db.fetchrow("""
+            UPDATE alerts a SET is_active = FALSE, resolved_at = $1
+            FROM (SELECT id, is_active FROM alerts WHERE id = $2 FOR UPDATE) prev
+            WHERE a.id = prev.id
+            RETURNING prev.is_active AS was_active
+            """, datetime.now(timezone.utc), alert_id)
+            
+            if resolved is None:
+                raise HTTPException(status_code=404, detail="Alert not found")
+            if resolved["was_active"]:
+                active_alerts.add(-1)
+        finally:
+            active_alerts.pending -= 1
             
         return {"message": "Alert resolved successfully"}
         
@@ -287,29 +510,31 @@ async def resolve_alert(alert_id: int, db: Client = Depends(get_supabase)):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/system/overview", response_model=SystemOverview)
-async def get_system_overview(db: Client = Depends(get_supabase)):
+async def get_system_overview(db=Depends(get_db)):
     """Get system overview statistics"""
     try:
-        # Get latest camera data
-        latest_cameras = await get_latest_camera_data(db)
-        
-        # Get active alerts
-        active_alerts = await get_alerts(active_only=True, db=db)
-        
-        # Calculate statistics
-        total_cameras = len(latest_cameras)
-        total_people = sum(camera['people_count'] for camera in latest_cameras)
-        high_density_cameras = len([c for c in latest_cameras if c['level'] == 'HIGH'])
-        average_score = sum(camera['score'] for camera in latest_cameras) / total_cameras if total_cameras > 0 else 0
-        critical_cameras = len([c for c in latest_cameras if c['score'] >= 80])
-        active_alert_count = len(active_alerts)
+        # Running totals kept by the write paths
+        if camera_latest.ready and active_alerts.ready:
+            overview = camera_latest.overview()
+            active_alert_count = active_alerts.count
+        else:
+            overview = dict(await db.fetchrow("""
+            SELECT
+                COUNT(*) AS total_cameras,
+                COALESCE(SUM(people_count), 0) AS total_people,
+                COUNT(*) FILTER (WHERE level = 'HIGH') AS high_density_cameras,
+                COALESCE(AVG(score), 0) AS average_score,
+                COUNT(*) FILTER (WHERE score >= $1) AS critical_cameras
+            FROM camera_data
+            """, CameraLatest.CRITICAL_SCORE))
+            active_alert_count = await db.fetchval("SELECT COUNT(*) FROM alerts WHERE is_active")
         
         return SystemOverview(
-            total_cameras=total_cameras,
-            total_people=total_people,
-            high_density_cameras=high_density_cameras,
-            average_score=round(average_score, 1),
-            critical_cameras=critical_cameras,
+            total_cameras=overview["total_cameras"],
+            total_people=overview["total_people"],
+            high_density_cameras=overview["high_density_cameras"],
+            average_score=round(overview["average_score"], 1),
+            critical_cameras=overview["critical_cameras"],
             active_alerts=active_alert_count,
             last_updated=datetime.now(timezone.utc)
         )
@@ -319,28 +544,63 @@ async def get_system_overview(db: Client = Depends(get_supabase)):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.delete("/cameras/data")
-async def clear_old_data(days: int = 7, db: Client = Depends(get_supabase)):
+async def clear_old_data(days: int = 7, db=Depends(get_db)):
     """Clear camera data older than specified days"""
     try:
         cutoff_date = datetime.now(timezone.utc) - timedelta(days=days)
         
-        result = db.table("camera_data").delete().lt("timestamp", cutoff_date.isoformat()).execute()
+        deleted = await db.fetch("DELETE FROM camera_data WHERE timestamp < $1 RETURNING camera_id", cutoff_date)
+        for row in deleted:
+            camera_latest.remove(row["camera_id"])
         
         return {
             "message": f"Cleared camera data older than {days} days",
-            "deleted_count": len(result.data) if result.data else 0
+            "deleted_count": len(deleted)
         }
         
     except Exception as e:
         logger.error(f"Error clearing old data: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/export/cameras")
+async def export_camera_data(
+    request: Request,
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    camera_id: Optional[str] = None,
+    level: Optional[str] = None,
+    fmt: str = Query("ndjson", alias="format", regex="^(ndjson|csv)$")
+):
+    """Stored camera rows (the latest reading per camera) with a timestamp in [from, to)"""
+    where_clause, values = export_conditions("timestamp", start, end, {"camera_id": camera_id, "level": level})
+    query = f"SELECT * FROM camera_data {where_clause} ORDER BY timestamp"
+    return table_export.response(request, db_pool, query, values, fmt, "camera_data")
+
+@app.get("/export/alerts")
+async def export_alerts(
+    request: Request,
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    camera_id: Optional[str] = None,
+    severity: Optional[str] = None,
+    fmt: str = Query("ndjson", alias="format", regex="^(ndjson|csv)$")
+):
+    """Alerts raised in [from, to), oldest first"""
+    where_clause, values = export_conditions("timestamp", start, end, {"camera_id": camera_id, "severity": severity})
+    query = f"SELECT * FROM alerts {where_clause} ORDER BY timestamp"
+    return table_export.response(request, db_pool, query, values, fmt, "alerts")
+
+@app.get("/export/stats")
+async def get_export_stats():
+    """Streaming export counters"""
+    return table_export.stats()
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
     try:
         # Test database connection
-        result = supabase.table("camera_data").select("id").limit(1).execute()
+        await db_pool.fetchval("SELECT 1")
         return {
             "status": "healthy",
             "database": "connected",
@@ -0,0 +1,49 @@
+-- Multi-Camera Crowd Monitoring API - SQL Schema
+-- Run against the Supabase database, or a local Postgres for development and tests:
+--   createdb crowd && psql crowd -f schema.sql
+--   DATABASE_URL=postgresql://localhost/crowd python main.py
+
+-- 1. Latest analysis per camera (one row per camera, upserted on camera_id)
+CREATE TABLE IF NOT EXISTS camera_data (
+    id BIGSERIAL PRIMARY KEY,
+    camera_id VARCHAR(100) UNIQUE NOT NULL,
+    camera_name VARCHAR(255) NOT NULL,
+    density_type VARCHAR(50) NOT NULL,
+    score DOUBLE PRECISION NOT NULL,
+    level VARCHAR(20) NOT NULL,
+    color VARCHAR(20) NOT NULL,
+    priority VARCHAR(20) NOT NULL,
+    people_count INTEGER NOT NULL,
+    max_density DOUBLE PRECISION NOT NULL,
+    mean_density DOUBLE PRECISION NOT NULL,
+    timestamp TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+);
+
+-- 2. Alerts table
+CREATE TABLE IF NOT EXISTS alerts (
+    id BIGSERIAL PRIMARY KEY,
+    camera_id VARCHAR(100) NOT NULL,
+    camera_name VARCHAR(255) NOT NULL,
+    alert_type VARCHAR(50) NOT NULL,
+    message TEXT NOT NULL,
+    severity VARCHAR(20) NOT NULL,
+    timestamp TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    is_active BOOLEAN NOT NULL DEFAULT TRUE,
+    resolved_at TIMESTAMP WITH TIME ZONE,
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+);
+
+-- Indexes
+CREATE INDEX IF NOT EXISTS idx_camera_data_timestamp ON camera_data(timestamp DESC);
+CREATE INDEX IF NOT EXISTS idx_camera_data_score ON camera_data(score DESC, camera_id);
+CREATE INDEX IF NOT EXISTS idx_alerts_active_timestamp ON alerts(is_active, timestamp DESC);
+
+-- Latest record for each camera
+CREATE OR REPLACE FUNCTION get_latest_camera_data()
+RETURNS SETOF camera_data AS $$
+    SELECT DISTINCT ON (camera_id) *
+    FROM camera_data
+    ORDER BY camera_id, timestamp DESC;
+$$ LANGUAGE sql STABLE;
@@ -0,0 +1,71 @@
+"""
+Benchmark for MultiCameraCrowdAnalyzer.generate_heatmap_from_positions.
+
+Compares the stamped-kernel implementation in crowd_analyzer.py against the original
+per-pixel Python loop, checks both give identical heatmaps, and prints timings.
+
+    python bench_heatmap.py
+"""
+
+import random
+import time
+
+import numpy as np
+from scipy.ndimage import gaussian_filter
+
+from crowd_analyzer import MultiCameraCrowdAnalyzer
+
+
+def reference_heatmap(width, height, positions):
+    """The original per-pixel loop, kept only as the baseline"""
+    heatmap = np.zeros((height, width), dtype=np.float32)
+    for x, y in positions:
+        heat_radius = 20
+        y_start = max(0, y - heat_radius)
+        y_end = min(height, y + heat_radius)
+        x_start = max(0, x - heat_radius)
+        x_end = min(width, x + heat_radius)
+        for py in range(y_start, y_end):
+            for px in range(x_start, x_end):
+                distance = np.sqrt((px - x)**2 + (py - y)**2)
+                if distance <= heat_radius:
+                    heat_value = max(0, 1 - distance/heat_radius)
+                    heatmap[py, px] += heat_value
+    return gaussian_filter(heatmap, sigma=8)
+
+
+def time_call(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main():
+    random.seed(2028)
+    analyzer = MultiCameraCrowdAnalyzer()
+    scenarios = [
+        ("12 cameras x 25 people, 400x300", 400, 300, 25, 12),
+        ("1 camera x 300 people, 1920x1080", 1920, 1080, 300, 1),
+    ]
+
+    for label, width, height, people, cameras in scenarios:
+        frames = [
+            [(random.randint(-10, width + 10), random.randint(-10, height + 10)) for _ in range(people)]
+            for _ in range(cameras)
+        ]
+
+        old_time, old_maps = time_call(
+            lambda: [reference_heatmap(width, height, positions) for positions in frames], 1)
+        new_time, new_maps = time_call(
+            lambda: [analyzer.generate_heatmap_from_positions(width, height, positions) for positions in frames], 5)
+
+        identical = all(np.array_equal(a, b) for a, b in zip(old_maps, new_maps))
+        print(f"{label}: loop {old_time * 1000:.1f} ms, stamped {new_time * 1000:.1f} ms, "
+              f"speedup {old_time / new_time:.0f}x, identical={identical}")
+
+
+if __name__ == "__main__":
+    main()
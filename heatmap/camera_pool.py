@@ -0,0 +1,127 @@
+# Parallel camera analysis: fan cameras out to worker processes, heatmaps back via shared memory
+
+import multiprocessing
+import os
+import queue
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from crowd_analyzer import MultiCameraCrowdAnalyzer
+
+# Set in each worker by _init_worker
+_worker_heatmaps = None
+_worker_analyzer = None
+
+
+def _init_worker(heatmaps):
+    global _worker_heatmaps, _worker_analyzer
+    _worker_heatmaps = heatmaps
+    _worker_analyzer = MultiCameraCrowdAnalyzer()
+
+
+def _heatmap_view(heatmap_buffer, height, width):
+    return np.frombuffer(heatmap_buffer, dtype=np.float32, count=height * width).reshape(height, width)
+
+
+def _analyze_slot(slot: int, height: int, width: int, positions: List[Tuple[int, int]]):
+    """Runs in a worker: build the heatmap from the detected positions into `slot`"""
+    started = time.perf_counter()
+    heatmap_out = _heatmap_view(_worker_heatmaps[slot], height, width)
+    heatmap = _worker_analyzer.generate_heatmap_from_positions(width, height, positions)
+    heatmap_out[:] = heatmap
+    analysis = _worker_analyzer.analyze_crowd_density(len(positions), heatmap)
+    return analysis, (time.perf_counter() - started) * 1000
+
+
+@dataclass
+class CameraResult:
+    camera_id: str
+    heatmap: np.ndarray
+    analysis: dict
+    compute_ms: float   # time spent analysing in the worker
+    latency_ms: float   # submit-to-result, including waiting for a free slot
+
+
+class CameraAnalysisPool:
+    """
+    Process pool around MultiCameraCrowdAnalyzer.
+
+    The analyzer works from detected positions, so only the frame's shape and the
+    positions are sent to a worker; the frame itself never leaves this process.
+    Heatmaps come back through a fixed set of shared-memory slots handed to the
+    workers at start-up instead of being pickled. Slots bound the number of
+    cameras in flight across all callers (the dashboard shares one pool between
+    sessions); a slot goes back to the pool-wide free queue as soon as its
+    heatmap has been copied out.
+    """
+
+    def __init__(self, workers: Optional[int] = None, max_frame_shape: Tuple[int, int] = (1080, 1920),
+                 slots: Optional[int] = None):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_height, self.max_width = max_frame_shape
+        self.slots = slots or self.workers * 2
+
+        pixels = self.max_height * self.max_width
+        self._heatmaps = [multiprocessing.RawArray('f', pixels) for _ in range(self.slots)]
+        self._free_slots: "queue.Queue[int]" = queue.Queue()
+        for slot in range(self.slots):
+            self._free_slots.put(slot)
+        # spawn: the dashboard process runs threads, which don't mix well with fork
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self._heatmaps,),
+        )
+        self.last_latencies: Dict[str, Dict[str, float]] = {}
+
+    def analyze(self, cameras: Dict[str, Tuple[np.ndarray, List[Tuple[int, int]]]]) -> Iterator[CameraResult]:
+        """Analyse {camera_id: (frame, positions)}, yielding results in completion order; frames only give the size"""
+        pending = list(cameras.items())
+        in_flight = {}
+        self.last_latencies = {}
+
+        try:
+            yield from self._drain(pending, in_flight)
+        finally:
+            # Never hand a slot to another caller while a worker may still write into it
+            wait(in_flight)
+            for _, slot, _, _, _ in in_flight.values():
+                self._free_slots.put(slot)
+
+    def _drain(self, pending, in_flight) -> Iterator[CameraResult]:
+        while pending or in_flight:
+            while pending:
+                camera_id, (image, positions) = pending[0]
+                height, width = image.shape[:2]
+                if height > self.max_height or width > self.max_width:
+                    raise ValueError(f"Frame for {camera_id} is {width}x{height}, "
+                                     f"larger than the pool's {self.max_width}x{self.max_height}")
+                # With nothing of our own in flight, wait for another caller to free a slot
+                try:
+                    slot = self._free_slots.get(block=not in_flight)
+                except queue.Empty:
+                    break
+                pending.pop(0)
+                future = self._executor.submit(_analyze_slot, slot, height, width, list(positions))
+                in_flight[future] = (camera_id, slot, height, width, time.perf_counter())
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                camera_id, slot, height, width, submitted = in_flight.pop(future)
+                try:
+                    analysis, compute_ms = future.result()
+                    heatmap = _heatmap_view(self._heatmaps[slot], height, width).copy()
+                finally:
+                    self._free_slots.put(slot)
+
+                latency_ms = (time.perf_counter() - submitted) * 1000
+                self.last_latencies[camera_id] = {"compute_ms": compute_ms, "latency_ms": latency_ms}
+                yield CameraResult(camera_id, heatmap, analysis, compute_ms, latency_ms)
+
+    def close(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,117 @@
+# Crowd analysis shared by the Streamlit dashboard and the camera analysis pool
+
+import random
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+from scipy.ndimage import gaussian_filter
+
+class MultiCameraCrowdAnalyzer:
+    def __init__(self):
+        self.cameras = {}
+        self.crowd_levels = {}
+    
+    def create_sample_camera_feed(self, camera_id, crowd_density='medium'):
+        """Create sample camera feed with different crowd densities"""
+        width, height = 400, 300
+        
+        # Create base image (representing camera view)
+        img = Image.new('RGB', (width, height), color=(240, 240, 240))
+        draw = ImageDraw.Draw(img)
+        
+        # Add camera frame
+        draw.rectangle([0, 0, width-1, height-1], outline=(0, 0, 0), width=3)
+        
+        # Add camera label
+        try:
+            font = ImageFont.truetype("arial.ttf", 20)
+        except:
+            font = ImageFont.load_default()
+        
+        draw.text((10, 10), f"Camera {camera_id}", fill=(0, 0, 0), font=font)
+        
+        # Generate people based on density
+        if crowd_density == 'high':
+            num_people = random.randint(15, 25)
+            colors = [(255, 0, 0), (255, 100, 100), (200, 0, 0)]  # Red shades
+        elif crowd_density == 'medium':
+            num_people = random.randint(8, 15)
+            colors = [(255, 165, 0), (255, 200, 0), (200, 150, 0)]  # Orange shades
+        else:  # low
+            num_people = random.randint(2, 8)
+            colors = [(0, 255, 0), (100, 255, 100), (0, 200, 0)]  # Green shades
+        
+        # Add people as colored dots/rectangles
+        people_positions = []
+        for i in range(num_people):
+            x = random.randint(20, width-40)
+            y = random.randint(50, height-30)
+            color = random.choice(colors)
+            
+            # Draw person as small rectangle
+            draw.rectangle([x, y, x+15, y+25], fill=color, outline=(0, 0, 0))
+            people_positions.append((x, y))
+        
+        return np.array(img), people_positions, num_people
+    
+    @staticmethod
+    def _heat_kernel(heat_radius):
+        """Radial falloff for offsets -heat_radius..heat_radius-1 (same window as the stamp)"""
+        offsets = np.arange(-heat_radius, heat_radius)
+        distance = np.sqrt(offsets[np.newaxis, :] ** 2 + offsets[:, np.newaxis] ** 2)
+        return np.where(distance <= heat_radius, np.maximum(0, 1 - distance / heat_radius), 0.0)
+    
+    def generate_heatmap_from_positions(self, width, height, positions):
+        """Generate heatmap from people positions"""
+        heatmap = np.zeros((height, width), dtype=np.float32)
+        heat_radius = 20
+        kernel = self._heat_kernel(heat_radius)
+        
+        for x, y in positions:
+            # Stamp the precomputed circular heat pattern, clipped at the frame edges
+            x, y = int(x), int(y)
+            y_start = max(0, y - heat_radius)
+            y_end = min(height, y + heat_radius)
+            x_start = max(0, x - heat_radius)
+            x_end = min(width, x + heat_radius)
+            if y_start >= y_end or x_start >= x_end:
+                continue
+            
+            ky = y_start - (y - heat_radius)
+            kx = x_start - (x - heat_radius)
+            heatmap[y_start:y_end, x_start:x_end] += kernel[ky:ky + (y_end - y_start), kx:kx + (x_end - x_start)]
+        
+        # Apply Gaussian smoothing
+        heatmap = gaussian_filter(heatmap, sigma=8)
+        return heatmap
+    
+    def analyze_crowd_density(self, people_count, heatmap):
+        """Analyze crowd density and provide score"""
+        max_density = np.max(heatmap)
+        mean_density = np.mean(heatmap[heatmap > 0]) if np.any(heatmap > 0) else 0
+        
+        # Calculate crowd score (0-100)
+        crowd_score = min(100, (people_count * 3) + (max_density * 20) + (mean_density * 10))
+        
+        if crowd_score >= 70:
+            level = "HIGH"
+            color = "🔴"
+            priority = "URGENT"
+        elif crowd_score >= 40:
+            level = "MEDIUM"
+            color = "🟡"
+            priority = "MONITOR"
+        else:
+            level = "LOW"
+            color = "🟢"
+            priority = "NORMAL"
+        
+        return {
+            'score': round(crowd_score, 1),
+            'level': level,
+            'color': color,
+            'priority': priority,
+            'people_count': people_count,
+            'max_density': float(max_density),
+            'mean_density': float(mean_density)
+        }
@@ -1,122 +1,24 @@
 import streamlit as st
-import numpy as np
-from PIL import Image, ImageDraw, ImageFont
 import matplotlib.pyplot as plt
 import seaborn as sns
-from scipy.ndimage import gaussian_filter
-import random
 import io
 import base64
 import requests
 import json
+import time
 from datetime import datetime, timezone
 import pandas as pd
 
+from crowd_analyzer import MultiCameraCrowdAnalyzer
+from camera_pool import CameraAnalysisPool
+
 # API Configuration
 API_BASE_URL = "http://localhost:8005"
 
-class MultiCameraCrowdAnalyzer:
-    def __init__(self):
-        self.cameras = {}
-        self.crowd_levels = {}
-    
-    def create_sample_camera_feed(self, camera_id, crowd_density='medium'):
-        """Create sample camera feed with different crowd densities"""
-        width, height = 400, 300
-        
-        # Create base image (representing camera view)
-        img = Image.new('RGB', (width, height), color=(240, 240, 240))
-        draw = ImageDraw.Draw(img)
-        
-        # Add camera frame
-        draw.rectangle([0, 0, width-1, height-1], outline=(0, 0, 0), width=3)
-        
-        # Add camera label
-        try:
-            font = ImageFont.truetype("arial.ttf", 20)
-        except:
-            font = ImageFont.load_default()
-        
-        draw.text((10, 10), f"Camera {camera_id}", fill=(0, 0, 0), font=font)
-        
-        # Generate people based on density
-        if crowd_density == 'high':
-            num_people = random.randint(15, 25)
-            colors = [(255, 0, 0), (255, 100, 100), (200, 0, 0)]  # Red shades
-        elif crowd_density == 'medium':
-            num_people = random.randint(8, 15)
-            colors = [(255, 165, 0), (255, 200, 0), (200, 150, 0)]  # Orange shades
-        else:  # low
-            num_people = random.randint(2, 8)
-            colors = [(0, 255, 0), (100, 255, 100), (0, 200, 0)]  # Green shades
-        
-        # Add people as colored dots/rectangles
-        people_positions = []
-        for i in range(num_people):
-            x = random.randint(20, width-40)
-            y = random.randint(50, height-30)
-            color = random.choice(colors)
-            
-            # Draw person as small rectangle
-            draw.rectangle([x, y, x+15, y+25], fill=color, outline=(0, 0, 0))
-            people_positions.append((x, y))
-        
-        return np.array(img), people_positions, num_people
-    
-    def generate_heatmap_from_positions(self, width, height, positions):
-        """Generate heatmap from people positions"""
-        heatmap = np.zeros((height, width), dtype=np.float32)
-        
-        for x, y in positions:
-            # Add heat around each person
-            heat_radius = 20
-            y_start = max(0, y - heat_radius)
-            y_end = min(height, y + heat_radius)
-            x_start = max(0, x - heat_radius)
-            x_end = min(width, x + heat_radius)
-            
-            # Create circular heat pattern
-            for py in range(y_start, y_end):
-                for px in range(x_start, x_end):
-                    distance = np.sqrt((px - x)**2 + (py - y)**2)
-                    if distance <= heat_radius:
-                        heat_value = max(0, 1 - distance/heat_radius)
-                        heatmap[py, px] += heat_value
-        
-        # Apply Gaussian smoothing
-        heatmap = gaussian_filter(heatmap, sigma=8)
-        return heatmap
-    
-    def analyze_crowd_density(self, people_count, heatmap):
-        """Analyze crowd density and provide score"""
-        max_density = np.max(heatmap)
-        mean_density = np.mean(heatmap[heatmap > 0]) if np.any(heatmap > 0) else 0
-        
-        # Calculate crowd score (0-100)
-        crowd_score = min(100, (people_count * 3) + (max_density * 20) + (mean_density * 10))
-        
-        if crowd_score >= 70:
-            level = "HIGH"
-            color = "🔴"
-            priority = "URGENT"
-        elif crowd_score >= 40:
-            level = "MEDIUM"
-            color = "🟡"
-            priority = "MONITOR"
-        else:
-            level = "LOW"
-            color = "🟢"
-            priority = "NORMAL"
-        
-        return {
-            'score': round(crowd_score, 1),
-            'level': level,
-            'color': color,
-            'priority': priority,
-            'people_count': people_count,
-            'max_density': float(max_density),
-            'mean_density': float(mean_density)
-        }
+@st.cache_resource
+def get_analysis_pool():
+    """Worker pool shared across reruns and sessions (sample feeds are 400x300)"""
+    return CameraAnalysisPool(max_frame_shape=(300, 400))
 
 def create_sample_images():
     """Create 12 sample camera feeds with different crowd densities"""
@@ -142,17 +44,35 @@ def create_sample_images():
     
     for camera_id, density in camera_scenarios:
         img, positions, people_count = analyzer.create_sample_camera_feed(camera_id, density)
-        heatmap = analyzer.generate_heatmap_from_positions(400, 300, positions)
-        analysis = analyzer.analyze_crowd_density(people_count, heatmap)
-        
         camera_data[camera_id] = {
             'image': img,
-            'heatmap': heatmap,
             'positions': positions,
-            'analysis': analysis,
             'density_type': density
         }
     
+    # Analyse all feeds in parallel; results arrive in completion order
+    started = time.perf_counter()
+    try:
+        pool = get_analysis_pool()
+        for result in pool.analyze({cid: (data['image'], data['positions']) for cid, data in camera_data.items()}):
+            camera_data[result.camera_id].update({
+                'heatmap': result.heatmap,
+                'analysis': result.analysis,
+                'latency_ms': result.latency_ms
+            })
+    except Exception as e:
+        st.warning(f"Parallel analysis unavailable, analysing sequentially: {e}")
+        get_analysis_pool.clear()
+        for camera_id, data in camera_data.items():
+            camera_started = time.perf_counter()
+            heatmap = analyzer.generate_heatmap_from_positions(400, 300, data['positions'])
+            data.update({
+                'heatmap': heatmap,
+                'analysis': analyzer.analyze_crowd_density(len(data['positions']), heatmap),
+                'latency_ms': (time.perf_counter() - camera_started) * 1000
+            })
+    st.session_state.analysis_ms = (time.perf_counter() - started) * 1000
+    
     return camera_data
 
 def store_data_to_api(camera_data):
@@ -195,9 +115,17 @@ def store_data_to_api(camera_data):
 def get_latest_data_from_api():
     """Get latest camera data from API"""
     try:
-        response = requests.get(f"{API_BASE_URL}/cameras/latest")
+        # Revalidate with the last ETag; a 304 means the cached copy is current
+        cached = st.session_state.get('latest_api_cache')
+        headers = {'If-None-Match': cached['etag']} if cached else {}
+        response = requests.get(f"{API_BASE_URL}/cameras/latest", headers=headers)
+        if response.status_code == 304 and cached:
+            return cached['data']
         if response.status_code == 200:
-            return response.json()
+            data = response.json()
+            if response.headers.get('ETag'):
+                st.session_state.latest_api_cache = {'etag': response.headers['ETag'], 'data': data}
+            return data
         else:
             st.error(f"Failed to fetch data: {response.text}")
             return None
@@ -415,6 +343,8 @@ def main():
             
         elif view_mode == "Grid View":
             st.subheader("🎛️ All Camera Feeds")
+            if 'analysis_ms' in st.session_state:
+                st.caption(f"Analysed {len(camera_data)} cameras in {st.session_state.analysis_ms:.0f} ms")
             
             # Display all cameras in grid
             cols = st.columns(4)
@@ -426,6 +356,7 @@ def main():
                     st.write(f"Score: {analysis['score']}/100")
                     st.write(f"People: {analysis['people_count']}")
                     st.write(f"Level: {analysis['level']}")
+                    st.caption(f"Analysis latency: {data.get('latency_ms', 0):.0f} ms")
         
         else:  # Heatmap View
             st.subheader("🔥 Heatmap Analysis")
@@ -0,0 +1,48 @@
+# Conditional GET support: weak ETags from change counters or content hashes, If-None-Match -> 304
+# Shared by backend/app.py and heatmap/backend/main.py
+
+import hashlib
+from typing import Iterable
+
+from fastapi import Request, Response
+
+# Clients must revalidate every time, but may reuse their copy on a 304
+CACHE_CONTROL = "no-cache"
+
+
+async def table_versions_etag(conn, tables: Iterable[str]) -> str:
+    """ETag from the table_versions counters, which triggers bump on every write statement"""
+    rows = await conn.fetch("""
+        SELECT table_name, SUM(version) AS version FROM table_versions
+        WHERE table_name = ANY($1::text[]) GROUP BY table_name ORDER BY table_name
+        """, list(tables))
+    return 'W/"' + ".".join(f"{row['table_name']}-{row['version']}" for row in rows) + '"'
+
+
+def content_etag(body: bytes) -> str:
+    """
+    ETag hashed from the encoded response data, for data served from process memory:
+    every worker holding the same data computes the same tag, and it never runs
+    ahead of the data the way a table counter can while a change is being applied.
+    """
+    return 'W/"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Weak comparison against If-None-Match, as RFC 9110 requires for GET"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    wanted = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == wanted for tag in header.split(","))
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+
+
+def set_etag(response: Response, etag: str):
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
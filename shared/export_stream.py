@@ -0,0 +1,195 @@
+# Streaming exports: rows from a server-side cursor written out as NDJSON or CSV chunks, optionally gzipped
+# Shared by backend/app.py and heatmap/backend/main.py
+
+import csv
+import io
+import logging
+import zlib
+from datetime import date, datetime, timezone
+from typing import Any, AsyncIterator, Callable, Dict, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, Request
+from fastapi.responses import StreamingResponse
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+def csv_value(value: Any) -> Any:
+    if value is None:
+        return ""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def accepts_gzip(accept_encoding: str) -> bool:
+    """Whether Accept-Encoding allows gzip: named (or covered by *) with a q-value above 0"""
+    qualities = {}
+    for item in accept_encoding.split(","):
+        coding, *params = [part.strip() for part in item.split(";")]
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding.lower()] = quality
+    for coding in ("gzip", "x-gzip", "*"):
+        if coding in qualities:
+            return qualities[coding] > 0
+    return False
+
+
+def export_conditions(column: str, start: Optional[datetime], end: Optional[datetime],
+                      filters: Dict[str, Any]) -> Tuple[str, list]:
+    """WHERE clause and values for a [start, end) time range (naive times are UTC) plus equality filters"""
+    conditions, values = [], []
+    for condition, value in ((f"{column} >= ", start), (f"{column} < ", end)):
+        if value is not None:
+            if value.tzinfo is None:
+                value = value.replace(tzinfo=timezone.utc)
+            values.append(value)
+            conditions.append(f"{condition}${len(values)}")
+    for filter_column, value in filters.items():
+        if value is not None:
+            values.append(value)
+            conditions.append(f"{filter_column} = ${len(values)}")
+    return ("WHERE " + " AND ".join(conditions) if conditions else ""), values
+
+
+class ExportResponse(StreamingResponse):
+    """Streaming response that frees its export slot however the download ends"""
+
+    def __init__(self, *args, release: Callable[[], None], **kwargs):
+        super().__init__(*args, **kwargs)
+        self.release = release
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.release()
+
+
+class TableExport:
+    """
+    Streams a query's result without holding it in memory.
+
+    Rows are fetched `chunk_rows` at a time through a server-side cursor in a
+    read-only REPEATABLE READ transaction (one consistent snapshot however long
+    the download takes), and each chunk is encoded, optionally gzipped, and
+    yielded before the next is fetched. The connection is taken from the pool
+    for the length of the download, and given back when it ends or the client
+    goes away. At most `max_active` downloads run at once, so slow clients cannot
+    use up the pool or hold snapshots open without bound; more get a 429.
+    """
+
+    def __init__(self, dumps: Callable[[Any], bytes], chunk_rows: int = 5000, gzip_level: int = 6,
+                 max_active: int = 4):
+        self.dumps = dumps
+        self.chunk_rows = chunk_rows
+        self.gzip_level = gzip_level
+        self.max_active = max_active
+        self.active = 0
+        self.rejected = 0
+
+        self.exports = 0
+        self.failed_exports = 0
+        self.rows = 0
+        self.bytes_sent = 0
+
+    def response(self, request: Request, pool, query: str, values: Sequence[Any], fmt: str,
+                 name: str) -> StreamingResponse:
+        """Download of `query` as `name`.ndjson / `name`.csv; raises 429 when all export slots are taken"""
+        if self.active >= self.max_active:
+            self.rejected += 1
+            raise HTTPException(status_code=429, detail="Too many exports running; retry later",
+                                headers={"Retry-After": "30"})
+        # Compressed on the fly when the client accepts it; curl needs --compressed
+        gzip = accepts_gzip(request.headers.get("accept-encoding", ""))
+        headers = {"Content-Disposition": f'attachment; filename="{name}.{fmt}"'}
+        if gzip:
+            headers["Content-Encoding"] = "gzip"
+        # The slot is taken here rather than in stream(), which never runs if the client leaves first
+        self.active += 1
+        return ExportResponse(self.stream(pool, query, values, fmt, gzip), media_type=EXPORT_FORMATS[fmt],
+                              headers=headers, release=self._release)
+
+    def _release(self):
+        self.active -= 1
+
+    async def stream(self, pool, query: str, args: Sequence[Any], fmt: str, gzip: bool) -> AsyncIterator[bytes]:
+        # wbits=31: gzip container, so the body can be served with Content-Encoding: gzip
+        compressor = zlib.compressobj(self.gzip_level, zlib.DEFLATED, 31) if gzip else None
+
+        def emit(data: bytes) -> bytes:
+            if compressor is not None:
+                data = compressor.compress(data)
+            self.bytes_sent += len(data)
+            return data
+
+        self.exports += 1
+        try:
+            async with pool.acquire() as conn:
+                async with conn.transaction(isolation="repeatable_read", readonly=True):
+                    statement = await conn.prepare(query)
+                    buffer = io.StringIO()
+                    writer = csv.writer(buffer)
+                    lines = []
+                    if fmt == "csv":
+                        writer.writerow([attribute.name for attribute in statement.get_attributes()])
+
+                    def take() -> bytes:
+                        if fmt == "csv":
+                            chunk = buffer.getvalue().encode()
+                            buffer.seek(0)
+                            buffer.truncate()
+                        else:
+                            chunk = b"".join(lines)
+                            lines.clear()
+                        return emit(chunk)
+
+                    pending = 0
+                    async for record in statement.cursor(*args, prefetch=self.chunk_rows):
+                        if fmt == "csv":
+                            writer.writerow([csv_value(value) for value in record.values()])
+                        else:
+                            lines.append(self.dumps(dict(record)) + b"\n")
+                        pending += 1
+                        if pending == self.chunk_rows:
+                            self.rows += pending
+                            pending = 0
+                            data = take()
+                            if data:
+                                yield data
+
+                    self.rows += pending
+                    data = take()
+                    if compressor is not None:
+                        tail = compressor.flush()
+                        self.bytes_sent += len(tail)
+                        data += tail
+                    if data:
+                        yield data
+        except Exception:
+            # Headers are already sent; the client sees a truncated body
+            self.failed_exports += 1
+            logger.exception("Export failed")
+            raise
+
+    def stats(self) -> dict:
+        return {
+            "active": self.active,
+            "max_active": self.max_active,
+            "rejected": self.rejected,
+            "exports": self.exports,
+            "failed_exports": self.failed_exports,
+            "rows": self.rows,
+            "bytes_sent": self.bytes_sent,
+        }
@@ -0,0 +1,37 @@
+# Fast JSON responses: asyncpg Records serialized straight to bytes with orjson
+# Shared by backend/app.py and heatmap/backend/main.py
+
+from decimal import Decimal
+from typing import Any
+
+import orjson
+from asyncpg import Record
+from fastapi.encoders import decimal_encoder
+from fastapi.responses import Response
+
+
+def _default(value: Any) -> Any:
+    # orjson handles UUID, datetime, date and the builtins natively
+    if isinstance(value, Record):
+        return dict(value)
+    if isinstance(value, Decimal):
+        # Same int/float choice as jsonable_encoder, so the output doesn't change
+        return decimal_encoder(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def dumps(value: Any) -> bytes:
+    return orjson.dumps(value, default=_default)
+
+
+def api_response(success: bool, message: str, data: Any = None, status_code: int = 200,
+                 headers: dict = None, **extra: Any) -> Response:
+    """
+    The APIResponse envelope rendered without Pydantic.
+
+    `data` may hold asyncpg Records as-is; they are serialized in one pass instead
+    of dict(row), model validation and jsonable_encoder each walking every row.
+    `extra` adds envelope fields such as next_cursor.
+    """
+    body = dumps({"success": success, "message": message, "data": data, **extra})
+    return Response(content=body, status_code=status_code, headers=headers, media_type="application/json")
@@ -0,0 +1,93 @@
+# Push channel: fan change events out to Server-Sent Events subscribers
+# Shared by backend/app.py and heatmap/backend/main.py
+
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Set
+
+# (topic, data) -> whether the subscriber wants the event
+Predicate = Callable[[str, Dict[str, Any]], bool]
+
+# Sent instead of the backlog to a client that fell behind; it should refetch
+RESYNC = ("resync", b"{}")
+
+
+class Subscriber:
+    def __init__(self, topics: Set[str], predicate: Optional[Predicate], max_queue: int):
+        self.topics = topics
+        self.predicate = predicate
+        self.queue: asyncio.Queue = asyncio.Queue(max_queue)
+        self.dropped = 0
+
+    def offer(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Slow client: drop its backlog instead of buffering without bound
+            while not self.queue.empty():
+                self.queue.get_nowait()
+                self.dropped += 1
+            self.queue.put_nowait(RESYNC)
+
+
+class LiveFeed:
+    """
+    In-process broadcaster. Each event is serialized once and offered to every
+    subscriber whose topics and filter match; each subscriber has its own bounded
+    queue, so one slow connection never holds up the others.
+    """
+
+    def __init__(self, dumps: Callable[[Any], bytes], max_queue: int = 256, keepalive: float = 15.0):
+        self.dumps = dumps
+        self.max_queue = max_queue
+        self.keepalive = keepalive
+        self.subscribers: Set[Subscriber] = set()
+        self.available = False
+        self.published = 0
+        self.delivered = 0
+
+    def subscribe(self, topics: Set[str], predicate: Optional[Predicate] = None) -> Subscriber:
+        subscriber = Subscriber(topics, predicate, self.max_queue)
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self.subscribers.discard(subscriber)
+
+    def publish(self, topic: str, data: Dict[str, Any]):
+        self.published += 1
+        payload = None
+        for subscriber in self.subscribers:
+            if topic not in subscriber.topics:
+                continue
+            if subscriber.predicate is not None and not subscriber.predicate(topic, data):
+                continue
+            if payload is None:
+                payload = self.dumps(data)
+            subscriber.offer((topic, payload))
+            self.delivered += 1
+
+    async def stream(self, subscriber: Subscriber,
+                     is_disconnected: Callable[[], Awaitable[bool]]) -> AsyncIterator[bytes]:
+        """SSE body for one subscriber; unsubscribes when the client goes away"""
+        try:
+            yield b"retry: 5000\n\n"
+            while True:
+                try:
+                    topic, payload = await asyncio.wait_for(subscriber.queue.get(), timeout=self.keepalive)
+                except asyncio.TimeoutError:
+                    if await is_disconnected():
+                        return
+                    yield b": keepalive\n\n"
+                    continue
+                yield b"event: " + topic.encode() + b"\ndata: " + payload + b"\n\n"
+        finally:
+            self.unsubscribe(subscriber)
+
+    def stats(self) -> dict:
+        return {
+            "available": self.available,
+            "subscribers": len(self.subscribers),
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped": sum(subscriber.dropped for subscriber in self.subscribers),
+        }